@@ -0,0 +1,88 @@
+from collections import deque
+
+def assign_keys(index1 : list, index2 : list, num_buckets : int, capacity : int, contents = None, keys = None):
+    """
+    Assigns keys to one of their two candidate buckets so that no bucket holds
+    more than capacity keys and as many keys as possible are assigned.
+
+    Keys are first peeled off: while some bucket has room for all its
+    unassigned candidates, they are assigned to it. The remaining core is
+    placed by augmenting paths (breadth-first, unbounded length), which yields
+    a maximum assignment. Buckets from which a search found no free bucket
+    stay full for good and are skipped by later searches.
+
+    Args:
+        index1, index2: list of int : candidate buckets of key k
+        num_buckets: int > 0
+        capacity: int >= 0 : keys a bucket may hold
+        contents: list of num_buckets lists of key ids : an existing assignment
+            to extend in place, e.g. one made with a smaller capacity
+        keys: iterable of key ids to assign, all keys if None
+
+    Returns (contents, unplaced), unplaced being the key ids that fit nowhere.
+    """
+    if contents is None:
+        contents = [[] for _ in range(num_buckets)]
+    if keys is None:
+        keys = range(len(index1))
+    pending = set(keys)
+    incident = [[] for _ in range(num_buckets)]
+    for k in pending:
+        incident[index1[k]].append(k)
+        if index2[k] != index1[k]:
+            incident[index2[k]].append(k)
+    remaining = [len(keys_of) for keys_of in incident]
+
+    #peeling
+    queue = deque(i for i in range(num_buckets) if 0 < remaining[i] <= capacity - len(contents[i]))
+    while queue:
+        i = queue.popleft()
+        for k in incident[i]:
+            if k not in pending:
+                continue
+            pending.discard(k)
+            contents[i].append(k)
+            remaining[i] -= 1
+            other = index2[k] if index1[k] == i else index1[k]
+            if other != i:
+                remaining[other] -= 1
+                if remaining[other] == capacity - len(contents[other]):
+                    queue.append(other)
+
+    #augmenting paths for the core
+    unplaced = []
+    dead = [False] * num_buckets
+    for k in sorted(pending):
+        if not _augment(k, index1, index2, capacity, contents, dead):
+            unplaced.append(k)
+    return contents, unplaced
+
+def _augment(k, index1, index2, capacity, contents, dead) -> bool:
+    """
+    Searches a chain of moves from a candidate bucket of key k to a bucket
+    with room and applies it. Marks all searched buckets dead on failure.
+
+    Returns True if k was assigned.
+    """
+    starts = [i for i in {index1[k], index2[k]} if not dead[i]]
+    parent = {i: None for i in starts} #bucket -> (previous bucket, key moved from there)
+    queue = deque(starts)
+    while queue:
+        i = queue.popleft()
+        if len(contents[i]) < capacity:
+            #move keys back along the chain, then place k at its start
+            while parent[i] is not None:
+                previous, moved = parent[i]
+                contents[previous].remove(moved)
+                contents[i].append(moved)
+                i = previous
+            contents[i].append(k)
+            return True
+        for moved in contents[i]:
+            other = index2[moved] if index1[moved] == i else index1[moved]
+            if other not in parent and not dead[other]:
+                parent[other] = (i, moved)
+                queue.append(other)
+    for i in parent:
+        dead[i] = True
+    return False
@@ -0,0 +1,224 @@
+from bloom import BloomFilter
+from cuckoo import CuckooFilter, CBCuckooFilter
+import numpy as np
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+FILTERS = ("cf", "cbcf", "bloom")
+
+def new_filter(name, num_buckets, bucket_size, fingerprint_len, storage = "array"):
+    """
+    Returns an empty filter. A Bloom filter gets as many bits as the cuckoo
+    filters have fingerprint bits and the hash functions main.py uses.
+    """
+    if name == "cf":
+        return CuckooFilter(num_buckets=num_buckets, bucket_size=bucket_size, fingerprint_len=fingerprint_len, storage=storage)
+    if name == "cbcf":
+        return CBCuckooFilter(num_buckets=num_buckets, bucket_size=bucket_size, fingerprint_len=fingerprint_len, storage=storage)
+    if name == "bloom":
+        size = num_buckets * bucket_size * fingerprint_len
+        return BloomFilter(size=size, num_hash_functions=max(round(0.69 * size / (num_buckets * bucket_size * 0.95)), 1))
+    raise ValueError()
+
+def time_calls(function, args) -> np.ndarray:
+    """
+    Calls function once per element of args.
+
+    Returns the duration of every call in ns as an int64 array.
+    """
+    times = np.zeros(len(args), dtype=np.int64)
+    for k, arg in enumerate(args):
+        start = time.perf_counter_ns()
+        function(arg)
+        times[k] = time.perf_counter_ns() - start
+    return times
+
+def summarize(times : np.ndarray, failures = 0) -> dict:
+    """
+    Returns throughput and latency percentiles in µs of one operation.
+    """
+    if len(times) == 0:
+        return {"count": 0, "failures": failures}
+    return {
+        "count": len(times),
+        "failures": failures,
+        "ops_per_sec": len(times) / (int(times.sum()) / 1e9) if times.sum() > 0 else float("inf"),
+        "mean_us": float(times.mean()) / 1000,
+        "p50_us": float(np.percentile(times, 50)) / 1000,
+        "p90_us": float(np.percentile(times, 90)) / 1000,
+        "p99_us": float(np.percentile(times, 99)) / 1000
+    }
+
+def benchmark_point(name, num_buckets, bucket_size, fingerprint_len, occupancy, ops = 10000, seed = 0, storage = "array") -> dict:
+    """
+    Fills a filter to occupancy and times single calls of every operation it
+    supports at that occupancy:
+
+    insert: the last ops inserts that reach occupancy
+    lookup_positive, lookup_negative: ops stored resp. never inserted keys,
+        stored keys being those whose insert succeeded
+    delete: the stored keys of lookup_positive, deleted from a copy
+    scrub: scrub_step() calls of a full pass on a copy (cbcf only)
+
+    Returns a dict of summarize() results keyed by operation.
+    """
+    random.seed(seed)
+    f = new_filter(name, num_buckets, bucket_size, fingerprint_len, storage)
+    total = int(occupancy * num_buckets * bucket_size)
+    ops = min(ops, total)
+    keys = [str(i) for i in range(total)]
+    ok = f.insert_many(keys[:total - ops])
+    stored = [key for key, inserted in zip(keys, ok.tolist()) if inserted]
+    results = {}
+
+    failures = 0
+    times = np.zeros(ops, dtype=np.int64)
+    for k, key in enumerate(keys[total - ops:]):
+        start = time.perf_counter_ns()
+        ok = f.insert(key)
+        times[k] = time.perf_counter_ns() - start
+        if ok is False:
+            failures += 1
+        else:
+            stored.append(key)
+    results["insert"] = summarize(times, failures)
+
+    inserted = random.sample(stored, min(ops, len(stored)))
+    results["lookup_positive"] = summarize(time_calls(f.lookup, inserted))
+    results["lookup_negative"] = summarize(time_calls(f.lookup, [str(i) for i in range(total, total + ops)]))
+
+    if hasattr(f, "delete"):
+        g = f.copy()
+        failures = 0
+        times = np.zeros(len(inserted), dtype=np.int64)
+        for k, key in enumerate(inserted):
+            start = time.perf_counter_ns()
+            try:
+                g.delete(key)
+            except ValueError:
+                failures += 1
+            times[k] = time.perf_counter_ns() - start
+        results["delete"] = summarize(times, failures)
+
+    if hasattr(f, "scrub_step"):
+        g = f.copy()
+        g.scrub_cursor = 0
+        times = []
+        remaining = 1
+        while remaining > 0:
+            start = time.perf_counter_ns()
+            remaining = g.scrub_step()
+            times.append(time.perf_counter_ns() - start)
+        results["scrub"] = summarize(np.array(times, dtype=np.int64))
+    return results
+
+def environment() -> dict:
+    """
+    Returns metadata of the machine and tree the benchmark ran on.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "commit": commit
+    }
+
+def run(filters, num_buckets, bucket_sizes, fingerprint_lens, occupancies, ops = 10000, seed = 0, storage = "array") -> dict:
+    """
+    Runs benchmark_point() for every combination of the parameter lists.
+
+    Returns the results together with environment() and the parameters.
+    """
+    results = []
+    for name, n, b, f, o in itertools.product(filters, num_buckets, bucket_sizes, fingerprint_lens, occupancies):
+        print(f"{name} num_buckets={n} bucket_size={b} fingerprint_len={f} occupancy={o}", file=sys.stderr)
+        results.append({
+            "filter": name,
+            "num_buckets": n,
+            "bucket_size": b,
+            "fingerprint_len": f,
+            "occupancy": o,
+            "operations": benchmark_point(name, n, b, f, o, ops, seed, storage)
+        })
+    return {
+        "environment": environment(),
+        "parameters": {"ops": ops, "seed": seed, "storage": storage},
+        "results": results
+    }
+
+def compare(old : dict, new : dict, threshold = 0.1) -> list:
+    """
+    Matches the points and operations of two run() results. The median
+    latency is compared, it is far less sensitive to scheduler noise than
+    ops/sec, which is dominated by the slowest calls.
+
+    Returns (point, operation, old p50 µs, new p50 µs) of every operation
+    whose median latency grew by more than threshold.
+    """
+    def index(run_result):
+        return {(r["filter"], r["num_buckets"], r["bucket_size"], r["fingerprint_len"], r["occupancy"]): r["operations"] for r in run_result["results"]}
+    old_points = index(old)
+    regressions = []
+    for point, operations in index(new).items():
+        if point not in old_points:
+            continue
+        for operation, summary in operations.items():
+            before = old_points[point].get(operation, {}).get("p50_us")
+            after = summary.get("p50_us")
+            if before is not None and after is not None and after > (1 + threshold) * before:
+                regressions.append((point, operation, before, after))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures throughput and latency of filter operations over a parameter grid.")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    run_parser = subparsers.add_parser("run", help="run the benchmark and write a JSON result file")
+    run_parser.add_argument("--filter", nargs="+", choices=FILTERS, default=list(FILTERS))
+    run_parser.add_argument("--num-buckets", nargs="+", type=int, default=[1024, 8192])
+    run_parser.add_argument("--bucket-size", nargs="+", type=int, default=[4])
+    run_parser.add_argument("--fingerprint-len", nargs="+", type=int, default=[12, 18])
+    run_parser.add_argument("--occupancy", nargs="+", type=float, default=[0.5, 0.9])
+    run_parser.add_argument("--ops", type=int, default=10000, help="timed calls per operation and point")
+    run_parser.add_argument("--storage", choices=("list", "array"), default="array")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", default="benchmark.json")
+    compare_parser = subparsers.add_parser("compare", help="flag latency regressions between two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative growth of the median latency reported as regression")
+    args = parser.parse_args()
+    if args.mode == "run":
+        result = run(args.filter, args.num_buckets, args.bucket_size, args.fingerprint_len, args.occupancy, args.ops, args.seed, args.storage)
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=1)
+        return
+    with open(args.old) as file:
+        old = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    regressions = compare(old, new, args.threshold)
+    for point, operation, before, after in regressions:
+        print(f"REGRESSION {operation} {point}: p50 {before:.2f} -> {after:.2f} µs ({after / before - 1:+.1%})")
+    if not regressions:
+        print("no regressions")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
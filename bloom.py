@@ -1,8 +1,15 @@
 from bitarray import bitarray
+import copy
+import math
 import mmh3
+import numpy as np
+from hashing import HASH_MODES, as_blocks, as_hashable, as_key, fmix64, hash_many, hash64_many
+from snapshot import read_snapshot, scalar_attributes, write_snapshot
+
+REMIX = 0x9E3779B97F4A7C15 #xored in before fmix64, whose fixed point is 0
 
 class BloomFilter:
-    def __init__(self, size : int, num_hash_functions: int):
+    def __init__(self, size : int, num_hash_functions: int, hash_mode = "classic", block_bits = None):
         """
         Initializes a Bloom Filter. Individual bits in bitarray
         accessible through [] operator.
@@ -10,35 +17,78 @@ class BloomFilter:
         Args:
             size: int > 0
             num_hash_functions: int > 0
+            hash_mode: "classic" | "single" : "classic" calls mmh3.hash once per
+                hash function, "single" derives all bit positions from one
+                mmh3.hash64 call by Kirsch-Mitzenmacher double hashing, see
+                _positions()
+            block_bits: None | power of two int : if given, the filter is split
+                into blocks of block_bits bits (512 = one 64-byte cache line) and
+                all bits of an element are set in one block. size is rounded up
+                to a multiple of block_bits
         
         Raises ValueError if conditions not met.
         """
-        if size < 1 or num_hash_functions < 1:
+        if size < 1 or num_hash_functions < 1 or hash_mode not in HASH_MODES:
             raise ValueError()
+        if block_bits is not None:
+            if block_bits < 1 or block_bits & (block_bits - 1):
+                raise ValueError()
+            size = -(-size // block_bits) * block_bits
+            self.num_blocks = size // block_bits
         self.size = size
-        self.bitarray = bitarray(size)
+        self.bitarray = bitarray(size, endian="big")
         self.bitarray.setall(0)
         self.num_hash_functions = num_hash_functions
+        self.hash_mode = hash_mode
+        self.block_bits = block_bits
         self.num_items = 0
 
     def insert(self, __item : str) -> None:
         """
         Inserts argument into bitarray.
         """
-        for i in range(self.num_hash_functions):
-            self.bitarray[mmh3.hash(key=__item, seed=i) % self.size] = 1
+        for position in self._positions(as_key(__item)):
+            self.bitarray[position] = 1
         self.num_items += 1
 
+    def insert_many(self, keys) -> np.ndarray:
+        """
+        Inserts a sequence or NumPy array of keys. Hashes all keys in bulk
+        and sets the bits with one vectorized scatter per hash function.
+
+        Returns a boolean array like CuckooFilter.insert_many(), all True
+        since a Bloom filter insert cannot fail.
+        """
+        keys = as_hashable(keys)
+        bytes_view = np.frombuffer(self.bitarray, dtype=np.uint8)
+        for positions in self._positions_many(keys):
+            np.bitwise_or.at(bytes_view, positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+        self.num_items += len(keys)
+        return np.ones(len(keys), dtype=np.bool_)
+
     def lookup(self, __item : str) -> bool:
         """
         Checks if element was inserted. If element was
         inserted, returns True. If it was not inserted, 
         most likely returns False.
         """
-        for i in range(self.num_hash_functions):
-            if self.bitarray[mmh3.hash(key=__item, seed=i) % self.size] == 0:
+        for position in self._positions(as_key(__item)):
+            if self.bitarray[position] == 0:
                 return False
         return True
+
+    def lookup_many(self, keys) -> np.ndarray:
+        """
+        Looks up a sequence or NumPy array of keys at once.
+
+        Returns a boolean array with the result of lookup() for every key.
+        """
+        keys = as_hashable(keys)
+        bytes_view = np.frombuffer(self.bitarray, dtype=np.uint8)
+        found = np.ones(len(keys), dtype=np.bool_)
+        for positions in self._positions_many(keys):
+            found &= (bytes_view[positions >> 3] & (0x80 >> (positions & 7))) != 0
+        return found
     
     def compute_false_positive_rate(self) -> float:
         """
@@ -51,8 +101,138 @@ class BloomFilter:
         k: number of hash functions used
 
         m: length of bitarray
+
+        A blocked filter is a set of small filters of B = block_bits bits whose
+        loads i are Poisson distributed with mean n*B/m. Its rate is
+
+        sum over i of Poisson(i; n*B/m) * (1-(1-1/B)**(k*i))**k
+        """
+        k = self.num_hash_functions
+        if self.block_bits is None:
+            return (1-(1-1/self.size)**(self.num_items * k))**k
+        B = self.block_bits
+        mean = self.num_items / self.num_blocks
+        rate = 0.0
+        for i in range(int(mean + 10 * math.sqrt(mean) + 20)):
+            poisson = math.exp(i * math.log(mean) - mean - math.lgamma(i + 1)) if mean > 0 else float(i == 0)
+            rate += poisson * (1 - (1 - 1/B)**(k * i))**k
+        return rate
+
+    def copy(self):
+        """
+        Returns an independent copy of the filter.
+        """
+        bloom = copy.copy(self)
+        bloom.bitarray = self.bitarray.copy()
+        return bloom
+
+    def save(self, path):
+        """
+        Writes the filter to path as a binary snapshot, see snapshot.py.
         """
-        return (1-(1-1/self.size)**(self.num_items * self.num_hash_functions))**self.num_hash_functions
+        write_snapshot(path, {"class": type(self).__name__, "attributes": scalar_attributes(self)}, {"bits": self.bitarray})
+
+    @classmethod
+    def load(cls, path, mmap = False):
+        """
+        Reads a filter written by save(). With mmap, the bits are served from
+        a read-only mmap of the file, see CuckooFilter.load().
+
+        Raises ValueError if path holds no Bloom filter snapshot.
+        """
+        header, sections = read_snapshot(path, mmap)
+        if header["class"] != cls.__name__:
+            raise ValueError()
+        bloom = cls.__new__(cls)
+        vars(bloom).update(header["attributes"])
+        if mmap:
+            bloom.bitarray = bitarray(buffer=sections["bits"], endian="big")
+        else:
+            bloom.bitarray = bitarray(endian="big")
+            bloom.bitarray.frombytes(bytes(sections["bits"]))
+            del bloom.bitarray[bloom.size:]
+        return bloom
+
+    def _positions(self, item):
+        """
+        Returns the bit positions of item. "classic" positions are hashed
+        lazily so lookup() can stop hashing at the first unset bit.
+
+        "single" mode uses enhanced double hashing of the two halves of
+        mmh3.hash64: x_0 = h1, x_(i+1) = x_i + y_i, y_0 = h2, y_(i+1) = y_i + i,
+        all mod 2**64. Blocked filters take the block from the high half and
+        the in-block offsets from disjoint log2(block_bits)-bit slices of the
+        low half, remixed with fmix64 once its bits run out, see _offsets().
+        """
+        k = self.num_hash_functions
+        if self.hash_mode == "single":
+            low, high = mmh3.hash64(item, signed=False)
+            if self.block_bits is None:
+                return [position % self.size for position in self._double_hashes(low, high)]
+            base = (high % self.num_blocks) * self.block_bits
+            return [base + offset for offset in self._offsets(low)]
+        if self.block_bits is None:
+            return (mmh3.hash(key=item, seed=i) % self.size for i in range(k))
+        base = (mmh3.hash(key=item, seed=k) % self.num_blocks) * self.block_bits
+        return (base + mmh3.hash(key=item, seed=i) % self.block_bits for i in range(k))
+
+    def _double_hashes(self, x, y) -> list:
+        # x_0 .. x_(k-1) of enhanced double hashing, see _positions()
+        hashes = []
+        for i in range(self.num_hash_functions):
+            hashes.append(x)
+            x = (x + y) & 0xFFFFFFFFFFFFFFFF
+            y = (y + i) & 0xFFFFFFFFFFFFFFFF
+        return hashes
+
+    def _offsets(self, word) -> list:
+        # in-block offsets of a blocked "single" filter, see _positions()
+        width = self.block_bits.bit_length() - 1
+        per_word = 64 // max(width, 1)
+        offsets = []
+        for i in range(self.num_hash_functions):
+            if i > 0 and i % per_word == 0:
+                word ^= REMIX
+                word ^= word >> 33
+                word = (word * 0xFF51AFD7ED558CCD) & 0xFFFFFFFFFFFFFFFF
+                word ^= word >> 33
+                word = (word * 0xC4CEB9FE1A85EC53) & 0xFFFFFFFFFFFFFFFF
+                word ^= word >> 33
+            offsets.append(word >> (width * (i % per_word)) & (self.block_bits - 1))
+        return offsets
+
+    def _positions_many(self, keys):
+        # vectorized _positions(), one int64 array of positions per hash function
+        k = self.num_hash_functions
+        keys = as_blocks(keys) #keys of one width are joined once for all hash functions
+        if self.hash_mode == "single":
+            hashes = hash64_many(keys)
+            low, high = hashes[:, 0], hashes[:, 1]
+            if self.block_bits is None:
+                return ((x % np.uint64(self.size)).astype(np.int64) for x in self._double_hashes_many(low, high))
+            base = (high % np.uint64(self.num_blocks)).astype(np.int64) * self.block_bits
+            return (base + offsets.astype(np.int64) for offsets in self._offsets_many(low))
+        if self.block_bits is None:
+            return (hash_many(keys, seed=i) % self.size for i in range(k))
+        base = hash_many(keys, seed=k) % self.num_blocks * self.block_bits
+        return (base + hash_many(keys, seed=i) % self.block_bits for i in range(k))
+
+    def _offsets_many(self, words):
+        # vectorized _offsets() on a uint64 array
+        width = self.block_bits.bit_length() - 1
+        per_word = 64 // max(width, 1)
+        mask = np.uint64(self.block_bits - 1)
+        for i in range(self.num_hash_functions):
+            if i > 0 and i % per_word == 0:
+                words = fmix64(words ^ np.uint64(REMIX))
+            yield words >> np.uint64(width * (i % per_word)) & mask
+
+    def _double_hashes_many(self, x, y):
+        # vectorized _double_hashes() on uint64 arrays, wrapping mod 2**64
+        for i in range(self.num_hash_functions):
+            yield x
+            x = x + y
+            y = y + np.uint64(i)
 
     def __getitem__(self, index):
         return self.bitarray[index]
\ No newline at end of file
@@ -0,0 +1,360 @@
+import copy
+import sys
+import numpy as np
+
+def uint_dtype(bits : int):
+    """
+    Returns the smallest unsigned NumPy dtype able to hold a value of 'bits' bits.
+
+    Raises ValueError if bits > 64.
+    """
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if bits <= np.iinfo(dtype).bits:
+            return np.dtype(dtype)
+    raise ValueError()
+
+class ListBuckets:
+    def __init__(self, num_buckets : int, bucket_size : int, dtype = None, slots = None, counts = None):
+        """
+        Bucket storage backed by one Python list per bucket. This is the
+        original layout of the filters; every slot is a boxed object.
+
+        Args:
+            num_buckets: int > 0
+            bucket_size: int > 0
+            dtype: ignored, accepted for interface compatibility with ArrayBuckets
+            slots, counts: arrays in the layout of ArrayBuckets to take the
+                contents from, see to_arrays()
+        """
+        self.num_buckets = num_buckets
+        self.bucket_size = bucket_size
+        if slots is None:
+            self.lists = [[] for _ in range(num_buckets)]
+        else:
+            self.lists = [row[:count] for row, count in zip(slots.tolist(), counts.tolist())]
+
+    def __len__(self):
+        return self.num_buckets
+
+    def __getitem__(self, i) -> list:
+        return self.lists[i]
+
+    def size(self, i) -> int:
+        return len(self.lists[i])
+
+    def contains(self, i, value) -> bool:
+        return value in self.lists[i]
+
+    def contains_many(self, indices : np.ndarray, values : np.ndarray) -> np.ndarray:
+        """
+        Returns a boolean array telling whether values[k] is stored in bucket indices[k].
+        """
+        lists = self.lists
+        return np.fromiter((value in lists[i] for i, value in zip(indices.tolist(), values.tolist())), dtype=np.bool_, count=len(indices))
+
+    def index(self, i, value) -> int:
+        return self.lists[i].index(value)
+
+    def get(self, i, j):
+        return self.lists[i][j]
+
+    def set(self, i, j, value):
+        self.lists[i][j] = value
+
+    def append(self, i, value):
+        self.lists[i].append(value)
+
+    def pop(self, i, j = -1):
+        return self.lists[i].pop(j)
+
+    def remove(self, i, value):
+        self.lists[i].remove(value)
+
+    def copy(self):
+        buckets = copy.copy(self)
+        buckets.lists = [bucket.copy() for bucket in self.lists]
+        return buckets
+
+    def memory_bytes(self) -> int:
+        """
+        Returns the approximate heap size of the storage: the bucket lists
+        and the boxed slot values, walking every bucket.
+        """
+        return sys.getsizeof(self.lists) + sum(sys.getsizeof(bucket) + sum(map(sys.getsizeof, bucket)) for bucket in self.lists)
+
+    def to_arrays(self, dtype):
+        """
+        Returns (slots, counts) in the layout of ArrayBuckets.
+        """
+        buckets = ArrayBuckets(self.num_buckets, self.bucket_size, dtype)
+        for i, bucket in enumerate(self.lists):
+            buckets.slots[i, :len(bucket)] = bucket
+            buckets.counts[i] = len(bucket)
+        return buckets.slots, buckets.counts
+
+class ArrayBuckets:
+    def __init__(self, num_buckets : int, bucket_size : int, dtype, slots = None, counts = None):
+        """
+        Bucket storage backed by one fixed-shape NumPy array of shape
+        (num_buckets, bucket_size) plus a per-bucket fill count. Slots
+        [0, counts[i]) of row i are occupied, the rest are garbage.
+
+        Args:
+            num_buckets: int > 0
+            bucket_size: int > 0
+            dtype: NumPy dtype of a slot, see uint_dtype()
+            slots, counts: existing arrays to use instead of new ones, e.g.
+                read-only views of a memory-mapped snapshot
+        """
+        self.num_buckets = num_buckets
+        self.bucket_size = bucket_size
+        if slots is None:
+            slots = np.zeros((num_buckets, bucket_size), dtype=dtype)
+            counts = np.zeros(num_buckets, dtype=uint_dtype(bucket_size.bit_length()))
+        self.slots = slots
+        self.counts = counts
+
+    def __len__(self):
+        return self.num_buckets
+
+    def __getitem__(self, i) -> list:
+        return self.slots[i, :self.counts[i]].tolist()
+
+    def size(self, i) -> int:
+        return int(self.counts[i])
+
+    def contains(self, i, value) -> bool:
+        return value in self.slots[i, :self.counts[i]]
+
+    def contains_many(self, indices : np.ndarray, values : np.ndarray) -> np.ndarray:
+        """
+        Returns a boolean array telling whether values[k] is stored in bucket
+        indices[k]. Gathers all candidate rows at once and compares them in bulk.
+        """
+        occupied = np.arange(self.bucket_size) < self.counts[indices][:, None]
+        return ((self.slots[indices] == values[:, None]) & occupied).any(axis=1)
+
+    def index(self, i, value) -> int:
+        hits = np.flatnonzero(self.slots[i, :self.counts[i]] == value)
+        if len(hits) == 0:
+            raise ValueError()
+        return int(hits[0])
+
+    def get(self, i, j):
+        if j < 0:
+            j += int(self.counts[i])
+        return self.slots.item(i, j)
+
+    def set(self, i, j, value):
+        if j < 0:
+            j += int(self.counts[i])
+        self.slots[i, j] = value
+
+    def append(self, i, value):
+        count = int(self.counts[i])
+        if count == self.bucket_size:
+            raise IndexError()
+        self.slots[i, count] = value
+        self.counts[i] = count + 1
+
+    def pop(self, i, j = -1):
+        """
+        Removes and returns slot j of bucket i, shifting later slots down
+        so slot order matches ListBuckets.
+        """
+        count = int(self.counts[i])
+        if j < 0:
+            j += count
+        if j < 0 or j >= count:
+            raise IndexError()
+        row = self.slots[i]
+        value = row.item(j)
+        row[j:count - 1] = row[j + 1:count]
+        self.counts[i] = count - 1
+        return value
+
+    def remove(self, i, value):
+        self.pop(i, self.index(i, value))
+
+    def copy(self):
+        buckets = copy.copy(self)
+        buckets.slots = self.slots.copy()
+        buckets.counts = self.counts.copy()
+        return buckets
+
+    def memory_bytes(self) -> int:
+        return self.slots.nbytes + self.counts.nbytes
+
+    def to_arrays(self, dtype = None):
+        return self.slots, self.counts
+
+class PackedBuckets:
+    def __init__(self, num_buckets : int, bucket_size : int, slot_len : int, long_slot_len = None, sbits = None, data = None, counts = None):
+        """
+        Bucket storage packed into one contiguous bytearray of bucket_len bits
+        per bucket, slots stored most significant bit first. Every slot is
+        read as one big-endian 64-bit word and cut out with shift and mask.
+        Fill counts are kept in a separate array as in ArrayBuckets. The
+        table cannot be decoded without them, so table_bits counts
+        ceil(log2(bucket_size + 1)) bits per bucket for them, sbits included.
+
+        If sbits is given, bucket i holds up to bucket_size - 1 slots of
+        long_slot_len bits while sbits[i] is set and bucket_size slots of
+        slot_len bits otherwise (the configurable-bucket format).
+
+        Args:
+            num_buckets: int > 0
+            bucket_size: int > 0
+            slot_len: 0 < int <= 57
+            long_slot_len: 0 < int <= 57, only used with sbits
+            sbits: bitarray of num_buckets selector bits, owned by the filter
+            data, counts: an existing packed table and fill counts to use
+                instead of new ones, e.g. read-only views of a snapshot
+
+        Raises ValueError if a slot is wider than 57 bits.
+        """
+        self.num_buckets = num_buckets
+        self.bucket_size = bucket_size
+        self.slot_len = slot_len
+        self.long_slot_len = slot_len if sbits is None else long_slot_len
+        self.sbits = sbits
+        if max(self.slot_len, self.long_slot_len) > 57:
+            raise ValueError()
+        self.bucket_len = max(bucket_size * slot_len, (bucket_size - 1) * self.long_slot_len)
+        self.table_bits = num_buckets * (self.bucket_len + bucket_size.bit_length() + (0 if sbits is None else 1))
+        if data is None:
+            # 8 spare bytes so every slot can be read as a whole 64-bit word
+            data = bytearray((num_buckets * self.bucket_len + 7) // 8 + 8)
+            counts = np.zeros(num_buckets, dtype=uint_dtype(bucket_size.bit_length()))
+        self.data = data
+        self.bytes = np.frombuffer(self.data, dtype=np.uint8)
+        self.counts = counts
+
+    def __len__(self):
+        return self.num_buckets
+
+    def __getitem__(self, i) -> list:
+        """
+        Decodes the occupied slots of bucket i from one integer read.
+        """
+        count = int(self.counts[i])
+        if count == 0:
+            return []
+        bits = self._slot_len(i)
+        offset = i * self.bucket_len
+        start, end = offset >> 3, (offset + count * bits + 7) >> 3
+        word = int.from_bytes(self.data[start:end], "big") >> ((end - start) * 8 - (offset & 7) - count * bits)
+        mask = (1 << bits) - 1
+        return [(word >> (bits * (count - 1 - j))) & mask for j in range(count)]
+
+    def size(self, i) -> int:
+        return int(self.counts[i])
+
+    def contains(self, i, value) -> bool:
+        return value in self[i]
+
+    def contains_many(self, indices : np.ndarray, values : np.ndarray) -> np.ndarray:
+        """
+        Returns a boolean array telling whether values[k] is stored in bucket
+        indices[k]. Decodes slot j of all candidate buckets at once per step.
+        """
+        if self.sbits is None:
+            bits = np.full(len(indices), self.slot_len, dtype=np.int64)
+        else:
+            long_buckets = np.frombuffer(self.sbits.unpack(), dtype=np.bool_)[indices]
+            bits = np.where(long_buckets, self.long_slot_len, self.slot_len)
+        counts = self.counts[indices]
+        offsets = indices * self.bucket_len
+        found = np.zeros(len(indices), dtype=np.bool_)
+        for j in range(self.bucket_size):
+            found |= (self._read_many(offsets + j * bits, bits) == values) & (j < counts)
+        return found
+
+    def index(self, i, value) -> int:
+        return self[i].index(value)
+
+    def get(self, i, j):
+        if j < 0:
+            j += int(self.counts[i])
+        bits = self._slot_len(i)
+        return self._read(i * self.bucket_len + j * bits, bits)
+
+    def set(self, i, j, value):
+        if j < 0:
+            j += int(self.counts[i])
+        bits = self._slot_len(i)
+        self._write(i * self.bucket_len + j * bits, bits, value)
+
+    def append(self, i, value):
+        count = int(self.counts[i])
+        if count == self._capacity(i):
+            raise IndexError()
+        bits = self._slot_len(i)
+        self._write(i * self.bucket_len + count * bits, bits, value)
+        self.counts[i] = count + 1
+
+    def pop(self, i, j = -1):
+        """
+        Removes and returns slot j of bucket i, shifting later slots down
+        so slot order matches ListBuckets.
+        """
+        values = self[i]
+        value = values.pop(j)
+        bits = self._slot_len(i)
+        if j < 0:
+            j += len(values) + 1
+        for k in range(j, len(values)):
+            self._write(i * self.bucket_len + k * bits, bits, values[k])
+        self.counts[i] = len(values)
+        return value
+
+    def remove(self, i, value):
+        self.pop(i, self.index(i, value))
+
+    def copy(self):
+        """
+        Returns a copy of the storage. The copy shares sbits with this
+        storage, a filter copying its sbits has to rebind them.
+        """
+        buckets = copy.copy(self)
+        buckets.data = bytearray(self.data)
+        buckets.bytes = np.frombuffer(buckets.data, dtype=np.uint8)
+        buckets.counts = self.counts.copy()
+        return buckets
+
+    def memory_bytes(self) -> int:
+        # sbits belong to the filter and are not counted here
+        return len(self.data) + self.counts.nbytes
+
+    def _slot_len(self, i) -> int:
+        if self.sbits is not None and self.sbits[i]:
+            return self.long_slot_len
+        return self.slot_len
+
+    def _capacity(self, i) -> int:
+        if self.sbits is not None and self.sbits[i]:
+            return self.bucket_size - 1
+        return self.bucket_size
+
+    def _read(self, offset, bits) -> int:
+        start = offset >> 3
+        word = int.from_bytes(self.data[start:start + 8], "big")
+        return (word >> (64 - (offset & 7) - bits)) & ((1 << bits) - 1)
+
+    def _write(self, offset, bits, value):
+        start = offset >> 3
+        shift = 64 - (offset & 7) - bits
+        word = int.from_bytes(self.data[start:start + 8], "big") & ~(((1 << bits) - 1) << shift)
+        self.data[start:start + 8] = (word | (value << shift)).to_bytes(8, "big")
+
+    def _read_many(self, offsets : np.ndarray, bits : np.ndarray) -> np.ndarray:
+        # vectorized _read(), as int64 array
+        words = self.bytes[(offsets >> 3)[:, None] + np.arange(8)].view(">u8")[:, 0].astype(np.uint64)
+        shifts = (64 - (offsets & 7) - bits).astype(np.uint64)
+        masks = (np.uint64(1) << bits.astype(np.uint64)) - np.uint64(1)
+        return ((words >> shifts) & masks).astype(np.int64)
+
+STORAGE_BACKENDS = {
+    "list": ListBuckets,
+    "array": ArrayBuckets
+}
@@ -0,0 +1,245 @@
+from collections import OrderedDict
+from buckets import ArrayBuckets, uint_dtype
+from cuckoo import CuckooFilter, CBCuckooFilter
+from hashing import as_key
+from stats import timed
+
+CACHE_POLICIES = ("clock", "lru")
+
+class LookupCache:
+    def __init__(self, capacity : int, num_buckets : int, policy = "clock"):
+        """
+        Initializes a cache of lookup results, keyed by the key itself, i.e.
+        by its Python hash, which str and bytes compute only once. Every
+        entry remembers both candidate buckets of its key and their versions
+        when it was stored; touch() bumps the version of a changed bucket, so
+        entries of keys mapping to it stop being served.
+
+        Args:
+            capacity: int > 0 : max number of cached keys
+            num_buckets: int > 0 : buckets of the filter
+            policy: "clock" | "lru" : eviction once capacity keys are cached
+
+        Raises ValueError if constraints not met.
+        """
+        if capacity < 1 or policy not in CACHE_POLICIES:
+            raise ValueError()
+        self.capacity = capacity
+        self.policy = policy
+        self.versions = [0] * num_buckets
+        self.hits = 0
+        self.misses = 0
+        if policy == "lru":
+            self.entries = OrderedDict() #key -> (found, index1, index2, version1, version2)
+        else:
+            self.entries = {} #key -> slot
+            self.keys = [None] * capacity
+            self.values = [None] * capacity
+            self.referenced = bytearray(capacity)
+            self.hand = 0
+
+    def get(self, key):
+        """
+        Returns the cached lookup result of key, None if key is not cached or
+        one of its buckets changed since.
+        """
+        if self.policy == "lru":
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+        else:
+            slot = self.entries.get(key)
+            value = None if slot is None else self.values[slot]
+        if value is None or self.versions[value[1]] != value[3] or self.versions[value[2]] != value[4]:
+            self.misses += 1
+            return None
+        if self.policy == "clock":
+            self.referenced[slot] = 1
+        self.hits += 1
+        return value[0]
+
+    def put(self, key, found : bool, index1 : int, index2 : int):
+        """
+        Caches the lookup result of key, evicting another key if full.
+        """
+        value = (found, index1, index2, self.versions[index1], self.versions[index2])
+        if self.policy == "lru":
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+            return
+        slot = self.entries.get(key)
+        if slot is None:
+            if len(self.entries) < self.capacity:
+                slot = len(self.entries)
+            else:
+                #second chance: skip and clear referenced slots
+                while self.referenced[self.hand]:
+                    self.referenced[self.hand] = 0
+                    self.hand = (self.hand + 1) % self.capacity
+                slot = self.hand
+                self.hand = (self.hand + 1) % self.capacity
+                del self.entries[self.keys[slot]]
+            self.entries[key] = slot
+            self.keys[slot] = key
+        self.values[slot] = value
+        self.referenced[slot] = 1
+
+    def touch(self, index : int):
+        """
+        Invalidates the entries of all keys with index as a candidate bucket.
+        """
+        self.versions[index] += 1
+
+    def compute_hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+class VersionedBuckets(ArrayBuckets):
+    def __init__(self, num_buckets : int, bucket_size : int, dtype, cache : LookupCache, slots = None, counts = None):
+        """
+        ArrayBuckets that report every change of a bucket to cache.touch().
+        remove() goes through pop().
+
+        Args:
+            num_buckets: int > 0
+            bucket_size: int > 0
+            dtype: NumPy dtype of a slot, see uint_dtype()
+            cache: LookupCache
+            slots, counts: see ArrayBuckets
+        """
+        super().__init__(num_buckets, bucket_size, dtype, slots, counts)
+        self.cache = cache
+
+    def set(self, i, j, value):
+        self.cache.touch(i)
+        super().set(i, j, value)
+
+    def append(self, i, value):
+        self.cache.touch(i)
+        super().append(i, value)
+
+    def pop(self, i, j = -1):
+        self.cache.touch(i)
+        return super().pop(i, j)
+
+class CachedFilter:
+    """
+    Front cache mode of a filter: lookup() first asks a small LookupCache
+    and only hashes the key and probes its buckets on a miss, which pays
+    off when a few hot keys make up most lookups. Every bucket change, be
+    it an insert, a kick, a delete, a stash move, a scrub relocation or a
+    long/short switch (which always rewrites the slots), invalidates the
+    cached results of keys mapping to that bucket, so lookup() returns
+    what the uncached filter would.
+    lookup_many() hashes in bulk anyway and bypasses the cache.
+    """
+
+    @timed("lookup")
+    def lookup(self, __item : str) -> bool:
+        """
+        Always returns True if element was inserted.
+
+        Most likely returns False if element was not inserted.
+
+        May return True even if element was not inserted.
+        """
+        key = as_key(__item)
+        found = self.cache.get(key)
+        if found is None:
+            hashed = self._hash(key)
+            found = self._lookup_hashed(*hashed)
+            self.cache.put(key, found, hashed[-2], hashed[-1])
+        return found
+
+    def delete(self, __item : str):
+        self._touch_stash() #a stashed victim may be deleted
+        super().delete(__item)
+
+    def copy(self):
+        """
+        Returns an independent copy of the filter with an empty cache.
+        """
+        filter = super().copy()
+        filter.cache = LookupCache(self.cache_size, self.num_buckets, self.cache_policy)
+        filter.buckets.cache = filter.cache
+        return filter
+
+    def _stash(self, entry) -> bool:
+        stashed = super()._stash(entry)
+        if stashed:
+            self.cache.touch(entry[0])
+        return stashed
+
+    def _drain_stash(self):
+        self._touch_stash()
+        super()._drain_stash()
+
+    def _touch_stash(self):
+        for entry in self.stash:
+            self.cache.touch(entry[0])
+
+    def _new_buckets(self, bits, dtype = None):
+        if dtype is not None:
+            #keys of a CB filter are not looked up
+            return ArrayBuckets(self.num_buckets, self.bucket_size, dtype)
+        return VersionedBuckets(self.num_buckets, self.bucket_size, uint_dtype(bits), self.cache)
+
+    def _restore(self, header, sections, mmap):
+        self.cache = LookupCache(self.cache_size, self.num_buckets, self.cache_policy)
+        super()._restore(header, sections, mmap)
+
+    def _load_buckets(self, header, slots, counts, mmap):
+        buckets = super()._load_buckets(header, slots, counts, mmap)
+        return VersionedBuckets(self.num_buckets, self.bucket_size, buckets.slots.dtype, self.cache, buckets.slots, buckets.counts)
+
+class CachedCuckooFilter(CachedFilter, CuckooFilter):
+    def __init__(self, num_buckets : int, bucket_size : int, fingerprint_len : int, max_kicks = 10, hash_mode = "classic", eviction = "random", stash_size = 4, stats = None, cache_size = 1024, cache_policy = "clock"):
+        """
+        Initializes a Cuckoo Filter with a lookup front cache, see CachedFilter.
+
+        Args:
+            num_buckets: int > 0
+            bucket_size: int > 0
+            fingerprint_len: int > 0
+            max_kicks: int > 0 : max number of retry iterations when inserting
+            hash_mode: "classic" | "single" : see CuckooFilter
+            eviction: "random" | "bfs" : see CuckooFilter
+            stash_size: int >= 0 : see CuckooFilter
+            stats: FilterStats | None : see CuckooFilter
+            cache_size: int > 0 : max number of cached keys
+            cache_policy: "clock" | "lru" : see LookupCache
+
+        Raises ValueError if constraints not met.
+        """
+        self.cache_size = cache_size
+        self.cache_policy = cache_policy
+        self.cache = LookupCache(cache_size, num_buckets, cache_policy)
+        super().__init__(num_buckets, bucket_size, fingerprint_len, max_kicks, "array", hash_mode, eviction, stash_size, stats)
+
+class CachedCBCuckooFilter(CachedFilter, CBCuckooFilter):
+    def __init__(self, num_buckets : int, bucket_size : int, fingerprint_len : int, max_kicks = 10, hash_mode = "classic", keyless = False, eviction = "random", stash_size = 4, stats = None, cache_size = 1024, cache_policy = "clock"):
+        """
+        Initializes a Configurable-Bucket Cuckoo Filter with a lookup front
+        cache, see CachedFilter.
+
+        Args:
+            num_buckets: int > 0
+            bucket_size: int > 0
+            fingerprint_len: int > 0
+            max_kicks: int > 0 : max number of retry iterations when inserting
+            hash_mode: "classic" | "single" : see CuckooFilter
+            keyless: bool : see CBCuckooFilter
+            eviction: "random" | "bfs" : see CuckooFilter
+            stash_size: int >= 0 : see CuckooFilter
+            stats: FilterStats | None : see CuckooFilter
+            cache_size: int > 0 : max number of cached keys
+            cache_policy: "clock" | "lru" : see LookupCache
+
+        Raises ValueError if constraints not met.
+        """
+        self.cache_size = cache_size
+        self.cache_policy = cache_policy
+        self.cache = LookupCache(cache_size, num_buckets, cache_policy)
+        super().__init__(num_buckets, bucket_size, fingerprint_len, max_kicks, "array", hash_mode, keyless, eviction, stash_size, stats)
@@ -0,0 +1,76 @@
+from cache import CACHE_POLICIES, CachedCBCuckooFilter
+from cuckoo import CBCuckooFilter
+from hashing import as_keys
+from trace import zipf_trace
+import argparse
+import random
+import time
+
+def benchmark_cache(num_buckets, fingerprint_size, occupancy, num_flows, num_packets, exponent, cache_size, policy, updates = 0, seed = 0) -> dict:
+    """
+    Fills a CB Cuckoo Filter and a cached one alike with half of num_flows
+    Zipf-distributed flows and up to occupancy with other keys, then looks
+    up every packet of the trace with both, one lookup() per packet. With
+    updates, every updates packets one key is inserted into both filters and
+    deleted again, which invalidates the cache entries of the buckets touched.
+
+    Returns a dict with the hit rate, both lookup rates and the speedup.
+
+    Raises ValueError if the filters answer a lookup differently.
+    """
+    flows, packets = zipf_trace(num_flows, num_packets, exponent, seed)
+    keys = as_keys(packets)
+    fill = as_keys(flows[::2]) + [str(i) for i in range(max(int(occupancy * num_buckets * 4) - len(flows[::2]), 0))]
+    filters = []
+    for f in (CBCuckooFilter(num_buckets, 4, fingerprint_size, storage="array"), CachedCBCuckooFilter(num_buckets, 4, fingerprint_size, cache_size=cache_size, cache_policy=policy)):
+        random.seed(seed)
+        f.insert_many(fill)
+        filters.append(f)
+    plain, cached = filters
+    churn = [f"churn{i}" for i in range(num_packets // updates + 1)] if updates else []
+    results = []
+    rates = []
+    for f in (plain, cached):
+        random.seed(seed)
+        found = []
+        elapsed = 0
+        for start in range(0, num_packets, updates or num_packets):
+            stop = min(start + (updates or num_packets), num_packets)
+            begin = time.perf_counter()
+            found += map(f.lookup, keys[start:stop])
+            elapsed += time.perf_counter() - begin
+            if updates:
+                key = churn[start // updates]
+                if f.insert(key):
+                    f.delete(key)
+        results.append(found)
+        rates.append(num_packets / elapsed)
+    if results[0] != results[1]:
+        raise ValueError()
+    return {
+        "hit_rate": cached.cache.compute_hit_rate(),
+        "uncached_lookups_per_sec": rates[0],
+        "cached_lookups_per_sec": rates[1],
+        "speedup": rates[1] / rates[0]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the lookup front cache of a CB Cuckoo Filter on a Zipf-skewed trace.")
+    parser.add_argument("--num-buckets", type=int, default=65536)
+    parser.add_argument("--fingerprint-size", type=int, default=12)
+    parser.add_argument("--occupancy", type=float, default=0.9)
+    parser.add_argument("--flows", type=int, default=100000)
+    parser.add_argument("--packets", type=int, default=500000)
+    parser.add_argument("--exponent", nargs="+", type=float, default=[0.8, 1.0, 1.2], help="Zipf exponents of the flow popularity")
+    parser.add_argument("--cache-size", nargs="+", type=int, default=[1024, 8192])
+    parser.add_argument("--policy", choices=CACHE_POLICIES, default="clock")
+    parser.add_argument("--updates", type=int, default=0, help="insert and delete one key every this many packets, 0 for none")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for exponent in args.exponent:
+        for cache_size in args.cache_size:
+            result = benchmark_cache(args.num_buckets, args.fingerprint_size, args.occupancy, args.flows, args.packets, exponent, cache_size, args.policy, args.updates, args.seed)
+            print(f"exponent {exponent}, cache {cache_size}: hit rate {result['hit_rate']:.3f}, {result['uncached_lookups_per_sec']:.0f} -> {result['cached_lookups_per_sec']:.0f} lookups/s ({result['speedup']:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import math
+import numpy as np
+from bloom import BloomFilter
+from cuckoo import CuckooFilter, CBCuckooFilter
+from trace import FIVE_TUPLE
+
+PREFILTERS = ("none", "bloom", "cf", "cbcf")
+
+#a rule matches src_ip/src_len and dst_ip/dst_len prefixes, ports and protocol
+#exactly or any value if -1; its priority is its row, lower wins
+RULE = np.dtype([("src_ip", "u4"), ("src_len", "u1"), ("dst_ip", "u4"), ("dst_len", "u1"), ("src_port", "i4"), ("dst_port", "i4"), ("protocol", "i2")])
+
+WELL_KNOWN_PORTS = (20, 21, 22, 23, 25, 53, 80, 110, 123, 143, 161, 443, 993, 1521, 3306, 8080)
+
+def prefix_mask(length) -> np.ndarray:
+    """
+    Returns the 32-bit netmasks of prefix lengths, 0 for length 0.
+    """
+    length = np.asarray(length, dtype=np.uint64)
+    return ((np.uint64(2**32 - 1) << (np.uint64(32) - length)) & np.uint64(2**32 - 1)).astype(np.uint32)
+
+class Tuple:
+    def __init__(self, src_len : int, dst_len : int, src_port : bool, dst_port : bool, protocol : bool):
+        """
+        One tuple of the tuple space: the rules with these prefix lengths and
+        exactly matched fields. A packet can only match a rule of the tuple
+        through its header masked by the tuple, so one exact-match lookup of
+        the masked header in the tuple's table finds it.
+
+        Args:
+            src_len, dst_len: 0 <= int <= 32 : prefix lengths
+            src_port, dst_port, protocol: bool : field matched exactly
+        """
+        self.masks = (int(prefix_mask(src_len)), int(prefix_mask(dst_len)), 0xFFFF if src_port else 0, 0xFFFF if dst_port else 0, 0xFF if protocol else 0)
+        self.table = {} #off-chip table: masked header -> best rule
+        self.best = None #best rule of the tuple
+        self.filter = None
+
+    def mask(self, packets : np.ndarray) -> np.ndarray:
+        """
+        Returns packets with the bits the tuple ignores cleared, as FIVE_TUPLE.
+        """
+        masked = np.empty(len(packets), dtype=FIVE_TUPLE)
+        for name, mask in zip(FIVE_TUPLE.names, self.masks):
+            masked[name] = packets[name] & mask
+        return masked
+
+class TupleSpaceClassifier:
+    def __init__(self, rules : np.ndarray, prefilter = "cbcf", bucket_size = 4, fingerprint_len = 12, occupancy = 0.9, **filter_args):
+        """
+        Initializes a tuple space search classifier over rules. Rules are
+        grouped by tuple, see Tuple. Every tuple keeps its rules in an
+        exact-match table, which stands for slow off-chip memory, and gets a
+        pre-filter of its masked rule headers, which stands for on-chip
+        memory: a table is only read when its filter accepts the packet.
+
+        All pre-filters of a kind use the same memory per rule. Cuckoo
+        filters get ceil(n / (bucket_size * occupancy)) buckets for n rules,
+        more if from_keys() cannot place them all, so there are no false
+        negatives. A "cf" filter in classic hash_mode rounds that up to a
+        power of two, see CuckooFilter. Bloom filters get as many bits as
+        the unrounded buckets and the optimal number of hash functions.
+
+        Args:
+            rules: RULE array, the row is the priority
+            prefilter: "none" | "bloom" | "cf" | "cbcf"
+            bucket_size: int > 0
+            fingerprint_len: int > 0
+            occupancy: 0 < float <= 1 : target occupancy of cuckoo filters
+            filter_args: further arguments of the filters, e.g. hash_mode
+
+        Raises ValueError if constraints not met.
+        """
+        if prefilter not in PREFILTERS or not 0 < occupancy <= 1:
+            raise ValueError()
+        self.prefilter = prefilter
+        self.num_rules = len(rules)
+        self.packets = 0
+        self.table_accesses = 0
+        tuples = {}
+        for r, rule in enumerate(rules.tolist()):
+            src_ip, src_len, dst_ip, dst_len, src_port, dst_port, protocol = rule
+            shape = (src_len, dst_len, src_port >= 0, dst_port >= 0, protocol >= 0)
+            if shape not in tuples:
+                tuples[shape] = Tuple(*shape)
+            t = tuples[shape]
+            header = np.array([(src_ip, dst_ip, max(src_port, 0), max(dst_port, 0), max(protocol, 0))], dtype=FIVE_TUPLE)
+            key = t.mask(header).view(f"V{FIVE_TUPLE.itemsize}").tolist()[0]
+            t.table.setdefault(key, r) #an earlier rule with the same key shadows later ones
+            if t.best is None:
+                t.best = r
+        self.tuples = sorted(tuples.values(), key=lambda t: t.best)
+        for t in self.tuples:
+            t.filter = self._new_filter(list(t.table), bucket_size, fingerprint_len, occupancy, filter_args)
+
+    def _new_filter(self, keys, bucket_size, fingerprint_len, occupancy, filter_args):
+        if self.prefilter == "none":
+            return None
+        num_buckets = math.ceil(len(keys) / (bucket_size * occupancy))
+        if self.prefilter == "bloom":
+            size = num_buckets * bucket_size * fingerprint_len
+            f = BloomFilter(size, max(round(math.log(2) * size / len(keys)), 1), **filter_args)
+            f.insert_many(keys)
+            return f
+        filter_class = CBCuckooFilter if self.prefilter == "cbcf" else CuckooFilter
+        while True:
+            if filter_class is CuckooFilter and filter_args.get("hash_mode", "classic") == "classic":
+                num_buckets = 2**(num_buckets - 1).bit_length() #see CuckooFilter
+            f = filter_class.from_keys(keys, num_buckets, bucket_size, fingerprint_len, **filter_args)
+            if f.num_items == len(keys):
+                return f
+            num_buckets += math.ceil(num_buckets / 8)
+
+    def classify(self, packet) -> int:
+        """
+        Classifies one packet, a FIVE_TUPLE record or a tuple of its fields.
+
+        Returns the matching rule with the highest priority, -1 if none.
+        """
+        return int(self.classify_many(np.array([tuple(packet)], dtype=FIVE_TUPLE))[0])
+
+    def classify_many(self, packets : np.ndarray) -> np.ndarray:
+        """
+        Classifies a FIVE_TUPLE array of packets. Tuples are probed in order
+        of their best rule, and a packet only probes tuples whose best rule
+        beats its match so far, so probing stops once no packet can improve.
+        Each packet probes the pre-filter of a tuple first and reads the
+        table only if the filter accepts, counted in table_accesses.
+
+        Returns an int64 array with the result of classify() for every packet.
+        """
+        matches = np.full(len(packets), self.num_rules, dtype=np.int64)
+        for t in self.tuples:
+            candidates = np.flatnonzero(matches > t.best)
+            if len(candidates) == 0:
+                break
+            masked = t.mask(packets[candidates])
+            if t.filter is not None:
+                accepted = t.filter.lookup_many(masked)
+                candidates, masked = candidates[accepted], masked[accepted]
+            self.table_accesses += len(candidates)
+            for k, key in zip(candidates.tolist(), masked.view(f"V{FIVE_TUPLE.itemsize}").tolist()):
+                rule = t.table.get(key)
+                if rule is not None and rule < matches[k]:
+                    matches[k] = rule
+        self.packets += len(packets)
+        matches[matches == self.num_rules] = -1
+        return matches
+
+    def compute_filter_memory_bits(self) -> int:
+        """
+        Returns the bits of all pre-filters as sized, i.e. slots times
+        fingerprint length resp. Bloom filter bits. A CB Cuckoo Filter bucket
+        holds bucket_size short or bucket_size - 1 long fingerprints in the
+        same bits.
+        """
+        bits = 0
+        for t in self.tuples:
+            if isinstance(t.filter, BloomFilter):
+                bits += t.filter.size
+            elif t.filter is not None:
+                bits += t.filter.num_buckets * t.filter.bucket_size * t.filter.fingerprint_len
+        return bits
+
+def match_rules(rules : np.ndarray, packets : np.ndarray) -> np.ndarray:
+    """
+    Classifies packets by a linear search over all rules, as reference.
+
+    Returns the first matching rule of every packet, -1 if none.
+    """
+    matches = np.full(len(packets), -1, dtype=np.int64)
+    for r in range(len(rules) - 1, -1, -1):
+        rule = rules[r]
+        hit = ((packets["src_ip"] ^ rule["src_ip"]) & prefix_mask(rule["src_len"]) == 0) & ((packets["dst_ip"] ^ rule["dst_ip"]) & prefix_mask(rule["dst_len"]) == 0)
+        for field in ("src_port", "dst_port", "protocol"):
+            if rule[field] >= 0:
+                hit &= packets[field] == rule[field]
+        matches[hit] = r
+    return matches
+
+def generate_rules(num_rules : int, seed = 0) -> np.ndarray:
+    """
+    Generates a synthetic ACL-like rule set in the spirit of ClassBench:
+    addresses are drawn from a small pool so that prefixes nest and repeat,
+    prefix lengths cluster on /0, /8, /16, /24 and /32, destination ports
+    are mostly well-known, source ports mostly any and ports are only given
+    for TCP and UDP.
+
+    Returns a RULE array.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = np.array([0, 8, 16, 20, 24, 28, 32])
+    weights = np.array([0.1, 0.05, 0.15, 0.1, 0.25, 0.1, 0.25])
+    pool = rng.integers(0, 2**32, max(num_rules // 8, 1), dtype=np.uint64).astype(np.uint32)
+    rules = np.zeros(num_rules, dtype=RULE)
+    for name in ("src", "dst"):
+        rules[f"{name}_len"] = rng.choice(lengths, num_rules, p=weights)
+        rules[f"{name}_ip"] = rng.choice(pool, num_rules) & prefix_mask(rules[f"{name}_len"])
+    rules["protocol"] = rng.choice([6, 17, -1], num_rules, p=[0.6, 0.25, 0.15])
+    ports = rules["protocol"] >= 0
+    rules["dst_port"] = np.where(ports & (rng.random(num_rules) < 0.7), rng.choice(WELL_KNOWN_PORTS, num_rules), -1)
+    rules["src_port"] = np.where(ports & (rng.random(num_rules) < 0.1), rng.integers(1024, 65536, num_rules), -1)
+    return rules
+
+def generate_trace(rules : np.ndarray, num_packets : int, match_fraction = 0.8, seed = 0) -> np.ndarray:
+    """
+    Generates packets for rules: match_fraction of them match a random rule,
+    its wildcard bits filled at random, the rest are random headers.
+
+    Returns a FIVE_TUPLE array.
+    """
+    rng = np.random.default_rng(seed)
+    packets = np.zeros(num_packets, dtype=FIVE_TUPLE)
+    for name, high in zip(FIVE_TUPLE.names, (2**32, 2**32, 2**16, 2**16, 256)):
+        packets[name] = rng.integers(0, high, num_packets)
+    packets["protocol"] = rng.choice([6, 17, 1], num_packets, p=[0.6, 0.3, 0.1])
+    matching = np.flatnonzero(rng.random(num_packets) < match_fraction)
+    chosen = rules[rng.integers(0, len(rules), len(matching))]
+    for name in ("src", "dst"):
+        mask = prefix_mask(chosen[f"{name}_len"])
+        packets[f"{name}_ip"][matching] = chosen[f"{name}_ip"] & mask | packets[f"{name}_ip"][matching] & ~mask
+    for field in ("src_port", "dst_port", "protocol"):
+        exact = chosen[field] >= 0
+        packets[field][matching[exact]] = chosen[field][exact]
+    any_protocol = matching[chosen["protocol"] < 0]
+    packets["protocol"][any_protocol] = rng.choice([6, 17], len(any_protocol))
+    return packets
@@ -0,0 +1,48 @@
+from classifier import PREFILTERS, TupleSpaceClassifier, generate_rules, generate_trace, match_rules
+import argparse
+import time
+
+CHUNK = 4096 #packets per classify_many call
+
+def benchmark_prefilter(prefilter, rules, packets, expected, bucket_size, fingerprint_len, occupancy) -> dict:
+    """
+    Builds a classifier with prefilter and classifies packets in chunks.
+
+    Returns a dict with packets per second, off-chip table accesses per
+    packet, pre-filter bits per rule and the number of tuples.
+
+    Raises ValueError if a packet is classified other than by match_rules().
+    """
+    c = TupleSpaceClassifier(rules, prefilter, bucket_size, fingerprint_len, occupancy)
+    start = time.perf_counter()
+    for first in range(0, len(packets), CHUNK):
+        if (c.classify_many(packets[first:first + CHUNK]) != expected[first:first + CHUNK]).any():
+            raise ValueError()
+    duration = time.perf_counter() - start
+    return {
+        "packets_per_sec": len(packets) / duration,
+        "accesses_per_packet": c.table_accesses / c.packets,
+        "bits_per_rule": c.compute_filter_memory_bits() / len(rules),
+        "tuples": len(c.tuples)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares pre-filters of a tuple space packet classifier on a synthetic ClassBench-style rule set.")
+    parser.add_argument("--prefilter", nargs="+", choices=PREFILTERS, default=list(PREFILTERS))
+    parser.add_argument("--rules", type=int, default=10000)
+    parser.add_argument("--packets", type=int, default=100000)
+    parser.add_argument("--match-fraction", type=float, default=0.8, help="packets generated from a rule, the rest are random")
+    parser.add_argument("--bucket-size", type=int, default=4)
+    parser.add_argument("--fingerprint-len", type=int, default=12)
+    parser.add_argument("--occupancy", type=float, default=0.9, help="target occupancy of the cuckoo pre-filters")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rules = generate_rules(args.rules, args.seed)
+    packets = generate_trace(rules, args.packets, args.match_fraction, args.seed + 1)
+    expected = match_rules(rules, packets)
+    for prefilter in args.prefilter:
+        result = benchmark_prefilter(prefilter, rules, packets, expected, args.bucket_size, args.fingerprint_len, args.occupancy)
+        print(f"{prefilter}: {result['packets_per_sec']:.0f} packets/s, {result['accesses_per_packet']:.3f} table accesses/packet, {result['bits_per_rule']:.1f} filter bits/rule, {result['tuples']} tuples")
+
+if __name__ == "__main__":
+    main()
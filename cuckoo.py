@@ -1,94 +1,225 @@
-import random, mmh3
+import copy, random, sys, mmh3
+import numpy as np
+from collections import deque
 from bitarray import bitarray
+from assignment import assign_keys
+from buckets import STORAGE_BACKENDS, ListBuckets, PackedBuckets, uint_dtype
+from hashing import HASH_MODES, as_blocks, as_hashable, as_key, as_keys, hash_many, hash_fingerprints, hash64_many, alt_offset, alt_offset_many, alt_offsets
+from snapshot import decode_keys, encode_keys, read_snapshot, scalar_attributes, write_snapshot
+from stats import timed
+
+EVICTION_STRATEGIES = ("random", "bfs")
 
 class CuckooFilter:
-    def __init__(self, num_buckets : int, bucket_size : int, fingerprint_len : int, max_kicks = 10):
+    def __init__(self, num_buckets : int, bucket_size : int, fingerprint_len : int, max_kicks = 10, storage = "list", hash_mode = "classic", eviction = "random", stash_size = 4, stats = None, max_visited = None):
         """
         Initializes a Cuckoo Filter
 
         Args:
-            num_buckets: int > 0
+            num_buckets: int > 0 : a power of two in "classic" hash_mode, whose
+                alternate index (an xor) is only then an involution, so kicked
+                fingerprints find their way back
             bucket_size: int > 0
             fingerprint_len: int > 0
             max_kicks: int > 0 : max number of retry iterations when inserting
-        
+            storage: "list" | "array" : bucket storage backend, see buckets.py
+            hash_mode: "classic" | "single" : "classic" hashes every key with three
+                murmur calls, "single" derives fingerprint and both bucket indices
+                from one mmh3.hash64 call plus a 2**fingerprint_len offset table,
+                computed on the fly for fingerprints wider than 20 bits
+            eviction: "random" | "bfs" : "random" kicks random fingerprints for up
+                to max_kicks steps, "bfs" searches the shortest chain of at most
+                max_kicks displacements to a free slot, visiting at most max_visited
+                buckets, before moving anything
+            stash_size: int >= 0 : number of victims a failed eviction may park in
+                the stash. If the stash is full, the eviction is undone instead
+            stats: FilterStats | None : records kicks, failures, conversions and
+                operation times if given, see stats.py
+            max_visited: int > 0 : buckets a "bfs" search may visit before it
+                gives up, bounding its worst case. Defaults to max_kicks * bucket_size
+
         Raises ValueError if constraints not met.
         """
-        if num_buckets < 1 or bucket_size < 1 or fingerprint_len < 1 or max_kicks < 1:
+        if max_visited is None:
+            max_visited = max_kicks * bucket_size
+        if num_buckets < 1 or bucket_size < 1 or fingerprint_len < 1 or max_kicks < 1 or stash_size < 0 or max_visited < 1:
+            raise ValueError()
+        if storage not in STORAGE_BACKENDS or hash_mode not in HASH_MODES or eviction not in EVICTION_STRATEGIES:
+            raise ValueError()
+        if hash_mode == "classic" and num_buckets & (num_buckets - 1) and self._needs_involution():
             raise ValueError()
         self.num_buckets = num_buckets
         self.bucket_size = bucket_size
         self.max_kicks = max_kicks
+        self.max_visited = max_visited
         self.fingerprint_len = fingerprint_len
-        self.buckets = [[] for _ in range(num_buckets)]
+        self.storage = storage
+        self.hash_mode = hash_mode
+        self.eviction = eviction
+        self.stash_size = stash_size
+        self.stash = [] #(index, fingerprint) of victims, index being one of their buckets
+        self.stats = stats
+        if hash_mode == "single":
+            self.alt_offsets = alt_offsets(fingerprint_len)
+        self.buckets = self._new_buckets(self._slot_len())
         self.num_items = 0
 
+    @classmethod
+    def from_keys(cls, keys, num_buckets : int, bucket_size : int, fingerprint_len : int, **filter_args):
+        """
+        Builds a filter from a known key set in one pass. All keys are hashed
+        at once and placed by an offline assignment, see assign_keys(), which
+        stores as many keys as any insertion order could. Keys that fit
+        nowhere go to the stash while it has room, the rest are left out:
+        len(keys) - num_items of them.
+
+        Args:
+            keys: sequence or NumPy array of keys
+            num_buckets, bucket_size, fingerprint_len, filter_args: see __init__
+
+        Raises ValueError if constraints not met.
+        """
+        filter = cls(num_buckets, bucket_size, fingerprint_len, **filter_args)
+        filter._fill(as_hashable(keys))
+        return filter
+
+    def _fill(self, keys):
+        # places keys into the empty filter, see from_keys()
+        fingerprints, index1, index2 = self._hash_many(keys)
+        fingerprints, index1 = fingerprints.tolist(), index1.tolist()
+        contents, unplaced = assign_keys(index1, index2.tolist(), self.num_buckets, self.bucket_size)
+        for i, bucket in enumerate(contents):
+            for k in bucket:
+                self.buckets.append(i, fingerprints[k])
+            self.num_items += len(bucket)
+        for k in unplaced:
+            if not self._stash((index1[k], fingerprints[k])):
+                break
+
+    @timed("insert")
     def insert(self, __item : str) -> bool:
         """
         Inserts byte-like object into the filter.
 
         Returns True if insert successful, otherwise False.
         """
-        fingerprint = self._get_fingerprint(item=__item, len=self.fingerprint_len)
-        index1 = mmh3.hash(key=__item, seed=1) % self.num_buckets
-        index2 = (index1 ^ mmh3.hash(key=str(fingerprint), seed=2))  % self.num_buckets
+        fingerprint, index1, index2 = self._hash(as_key(__item))
+        return self._insert(fingerprint, index1, index2)
+
+    @timed("insert", batched=True)
+    def insert_many(self, keys) -> np.ndarray:
+        """
+        Inserts a sequence or NumPy array of keys. All keys are hashed in bulk,
+        placement itself stays sequential.
 
-        if len(self.buckets[index1]) < self.bucket_size:
-            self.buckets[index1].append(fingerprint)
+        Returns a boolean array, True where the insert was successful.
+        """
+        keys = as_hashable(keys)
+        fingerprints, index1, index2 = self._hash_many(keys)
+        return np.fromiter(map(self._insert, fingerprints.tolist(), index1.tolist(), index2.tolist()), dtype=np.bool_, count=len(keys))
+
+    def _insert(self, fingerprint, index1, index2) -> bool:
+        if self.buckets.size(index1) < self.bucket_size:
+            self.buckets.append(index1, fingerprint)
+            self.num_items += 1
+            self._record_kicks(0)
+            return True
+
+        if self.buckets.size(index2) < self.bucket_size:
+            self.buckets.append(index2, fingerprint)
             self.num_items += 1
+            self._record_kicks(0)
             return True
 
-        if len(self.buckets[index2]) < self.bucket_size:
-            self.buckets[index2].append(fingerprint)
+        if self.eviction == "bfs":
+            found = self._find_path(index1, index2)
+            if found is None:
+                return self._stash((index1, fingerprint))
+            self._move_along(*found, fingerprint)
             self.num_items += 1
+            self._record_kicks(len(found[0]))
             return True
-        
+
         #need to enter evict procedure
         eviction_index = random.choice([index1, index2])
-        for _ in range(self.max_kicks):
-            if len(self.buckets[eviction_index]) < self.bucket_size:
-                self.buckets[eviction_index].append(fingerprint)
+        journal = []
+        for kicks in range(self.max_kicks):
+            if self.buckets.size(eviction_index) < self.bucket_size:
+                self.buckets.append(eviction_index, fingerprint)
                 self.num_items += 1
+                self._record_kicks(kicks)
                 return True
             eviction_fingerprint = random.choice(self.buckets[eviction_index])
-            self.buckets[eviction_index].remove(eviction_fingerprint)
-            self.buckets[eviction_index].append(fingerprint)
+            self.buckets.remove(eviction_index, eviction_fingerprint)
+            self.buckets.append(eviction_index, fingerprint)
+            journal.append((eviction_index, eviction_fingerprint, fingerprint))
 
             fingerprint = eviction_fingerprint #in next iter, fingerprint holds to be inserted fingerprint
-            eviction_index = (eviction_index ^ mmh3.hash(key=str(fingerprint), seed=2)) % self.num_buckets#compute alternate bucket
+            eviction_index = self._alt_index(eviction_index, fingerprint) #compute alternate bucket
 
+        if self._stash(journal[-1][:2]):
+            return True
+        for index, eviction_fingerprint, inserted_fingerprint in reversed(journal):
+            self.buckets.remove(index, inserted_fingerprint)
+            self.buckets.append(index, eviction_fingerprint)
         return False
 
+    @timed("lookup")
     def lookup(self, __item : str) -> bool:
         """
         Always returns True if element was inserted.
-        
+
         Most likely returns False if element was not inserted.
-        
+
         May return True even if element was not inserted.
         """
-        fingerprint = self._get_fingerprint(item=__item, len=self.fingerprint_len)
-        index1 = mmh3.hash(key=__item, seed=1) % self.num_buckets
-        index2 = (index1 ^ mmh3.hash(key=str(fingerprint), seed=2)) % self.num_buckets #might need to do another modulo
-        return fingerprint in self.buckets[index1] or fingerprint in self.buckets[index2]
+        return self._lookup_hashed(*self._hash(as_key(__item)))
+
+    def _lookup_hashed(self, fingerprint, index1, index2) -> bool:
+        if self.buckets.contains(index1, fingerprint) or self.buckets.contains(index2, fingerprint):
+            return True
+        return (index1, fingerprint) in self.stash or (index2, fingerprint) in self.stash
+
+    @timed("lookup", batched=True)
+    def lookup_many(self, keys) -> np.ndarray:
+        """
+        Looks up a sequence or NumPy array of keys at once.
+
+        Returns a boolean array with the result of lookup() for every key.
+        """
+        return self._lookup_hashed_many(*self._hash_many(as_hashable(keys)))
+
+    def _lookup_hashed_many(self, fingerprints, index1, index2) -> np.ndarray:
+        found = self.buckets.contains_many(index1, fingerprints) | self.buckets.contains_many(index2, fingerprints)
+        for index, fingerprint in self.stash:
+            found |= ((index1 == index) | (index2 == index)) & (fingerprints == fingerprint)
+        return found
 
+    @timed("delete")
     def delete(self, __item : str):
         """
         Delete element from filter.
 
         Raises ValueError if element is not found.
         """
-        fingerprint = self._get_fingerprint(item=__item, len=self.fingerprint_len)
-        index1 = mmh3.hash(key=__item, seed=1) % self.num_buckets
-        if fingerprint in self.buckets[index1]:
-            self.buckets[index1].remove(fingerprint)
+        hash, index1 = self._hash_key(as_key(__item))
+        fingerprint = hash % (2**self.fingerprint_len)
+        if self.buckets.contains(index1, fingerprint):
+            self.buckets.remove(index1, fingerprint)
             self.num_items -= 1
+            self._drain_stash()
             return
-        index2 = (index1 ^ mmh3.hash(key=str(fingerprint), seed=2)) % self.num_buckets
-        if fingerprint in self.buckets[index2]:
-            self.buckets[index2].remove(fingerprint)
+        index2 = self._alt_index(index1, fingerprint)
+        if self.buckets.contains(index2, fingerprint):
+            self.buckets.remove(index2, fingerprint)
             self.num_items -= 1
-            return 
+            self._drain_stash()
+            return
+        for entry in ((index1, fingerprint), (index2, fingerprint)):
+            if entry in self.stash:
+                self.stash.remove(entry)
+                self.num_items -= 1
+                return
         raise ValueError()
 
     def compute_false_positive_rate(self) -> float:
@@ -98,23 +229,267 @@ class CuckooFilter:
         8 * filter_occupancy / 2**fingerprint_len
         """
         return 8 *self.compute_filter_occupancy() / 2**self.fingerprint_len
-    
+
     def compute_filter_occupancy(self) -> float:
         """
-        Returns the filter occupancy:  
+        Returns the filter occupancy:
 
         elements_stored / (num_buckets * bucket_size)
         """
         return self.num_items / (self.num_buckets * self.bucket_size)
-    
+
+    def compute_stash_occupancy(self) -> float:
+        """
+        Returns the stash occupancy:
+
+        victims_stashed / stash_size
+
+        Elements in the stash count towards num_items and filter occupancy.
+        """
+        if self.stash_size == 0:
+            return 0.0
+        return len(self.stash) / self.stash_size
+
+    def compute_memory_bytes(self) -> int:
+        """
+        Returns the approximate memory footprint of the stored fingerprints:
+        bucket storage, stash and, for CB filters, sbits. Kept keys are
+        not counted.
+        """
+        return self.buckets.memory_bytes() + sys.getsizeof(self.stash)
+
+    def copy(self):
+        """
+        Returns an independent copy of the filter, e.g. to scrub or modify a
+        snapshot while inserting into the original goes on. Statistics are
+        copied as well.
+        """
+        filter = copy.copy(self)
+        filter.buckets = self.buckets.copy()
+        filter.stash = list(self.stash)
+        if self.stats is not None:
+            filter.stats = self.stats.copy()
+        return filter
+
+    def save(self, path):
+        """
+        Writes the filter to path as a binary snapshot, see snapshot.py:
+        parameters, counters and stash in the header, the slot table as one
+        contiguous section. Statistics are not saved.
+        """
+        header, sections = self._snapshot()
+        write_snapshot(path, header, sections)
+
+    @classmethod
+    def load(cls, path, mmap = False):
+        """
+        Reads a filter written by save() of the same class.
+
+        With mmap, the slot table and sbits are not copied but served from a
+        read-only mmap of the file, so any number of processes can load one
+        filter at almost no cost and share its pages. Such a filter supports
+        lookup() and lookup_many() only. List storage is served as "array".
+
+        Raises ValueError if path holds no snapshot of this class.
+        """
+        header, sections = read_snapshot(path, mmap)
+        if header["class"] != cls.__name__:
+            raise ValueError()
+        filter = cls.__new__(cls)
+        vars(filter).update(header["attributes"])
+        filter.stats = None
+        filter._restore(header, sections, mmap)
+        return filter
+
+    def to_storage(self, storage):
+        """
+        Moves the buckets to another storage backend, e.g. to build a filter
+        on "list" storage, which is faster at scalar inserts and scrubbing,
+        and look it up on "array" storage, which lookup_many() vectorizes.
+
+        Raises ValueError if storage is unknown or the filter is packed.
+        """
+        if storage not in STORAGE_BACKENDS or self.storage == "packed":
+            raise ValueError()
+        slots, counts = self.buckets.to_arrays(uint_dtype(self._slot_len()))
+        self.buckets = STORAGE_BACKENDS[storage](self.num_buckets, self.bucket_size, slots.dtype, slots, counts)
+        self.storage = storage
+
+    def _snapshot(self):
+        # header and sections of save()
+        header = {"class": type(self).__name__, "attributes": scalar_attributes(self), "stash": [list(entry) for entry in self.stash]}
+        if self.storage == "packed":
+            return header, {"slots": self.buckets.data, "counts": self.buckets.counts}
+        slots, counts = self.buckets.to_arrays(uint_dtype(self._slot_len()))
+        header["dtype"] = slots.dtype.str
+        return header, {"slots": slots, "counts": counts}
+
+    def _restore(self, header, sections, mmap):
+        # rebuilds what save() left out of the header attributes
+        vars(self).setdefault("max_visited", self.max_kicks * self.bucket_size) #snapshots from before max_visited
+        if self.hash_mode == "single":
+            self.alt_offsets = alt_offsets(self.fingerprint_len)
+        self.stash = [tuple(entry) for entry in header["stash"]]
+        counts = np.frombuffer(sections["counts"], dtype=uint_dtype(self.bucket_size.bit_length()))
+        self.buckets = self._load_buckets(header, sections["slots"], counts, mmap)
+
+    def _load_buckets(self, header, slots, counts, mmap):
+        dtype = np.dtype(header["dtype"])
+        slots = np.frombuffer(slots, dtype=dtype).reshape(self.num_buckets, self.bucket_size)
+        if mmap:
+            self.storage = "array"
+        return STORAGE_BACKENDS[self.storage](self.num_buckets, self.bucket_size, dtype, slots, counts)
+
+    def _record_kicks(self, kicks):
+        if self.stats is not None:
+            self.stats.record_kicks(kicks)
+
+    def _stash(self, entry) -> bool:
+        """
+        Parks the victim of a failed eviction in the stash if it has room.
+
+        Returns True if the victim was stashed. If False, the insert failed.
+        """
+        if len(self.stash) == self.stash_size:
+            if self.stats is not None:
+                self.stats.insert_failures += 1
+            return False
+        self.stash.append(entry)
+        self.num_items += 1
+        if self.stats is not None:
+            self.stats.stashed += 1
+        return True
+
+    def _drain_stash(self):
+        """
+        Moves stashed victims back into the table where one of their buckets has room.
+        """
+        for entry in list(self.stash):
+            index, fingerprint = entry
+            for candidate in (index, self._alt_index(index, fingerprint)):
+                if self.buckets.size(candidate) < self.bucket_size:
+                    self.buckets.append(candidate, fingerprint)
+                    self.stash.remove(entry)
+                    break
+
+    def _find_path(self, index1, index2):
+        """
+        Breadth-first search for the shortest chain of at most max_kicks
+        displacements that starts in the full bucket index1 or index2 and ends
+        in a bucket with a free slot. Every bucket is visited at most once and
+        the search gives up after max_visited buckets, so a failing search
+        does not walk the whole table.
+
+        Returns (path, free_index), path being the (bucket, slot) pairs whose
+        fingerprints move one step on, or None if there is no such chain.
+        """
+        queue = deque([(index1, ()), (index2, ())])
+        visited = {index1, index2}
+        while queue:
+            index, path = queue.popleft()
+            if len(path) == self.max_kicks:
+                continue
+            for j in range(self.buckets.size(index)):
+                alt_index = self._slot_alt_index(index, j)
+                if alt_index in visited:
+                    continue
+                step = path + ((index, j),)
+                if self.buckets.size(alt_index) < self.bucket_size:
+                    return step, alt_index
+                if len(visited) >= self.max_visited:
+                    return None
+                visited.add(alt_index)
+                queue.append((alt_index, step))
+        return None
+
+    def _needs_involution(self) -> bool:
+        # True if moved fingerprints find their other bucket by _alt_index() alone
+        return True
+
+    def _slot_alt_index(self, index, j) -> int:
+        # the other bucket of the fingerprint in slot j of bucket index
+        return self._alt_index(index, self.buckets.get(index, j))
+
+    def _move_along(self, path, free_index, fingerprint):
+        """
+        Moves every fingerprint on path one step on, starting at the free end,
+        and stores fingerprint in the slot freed at the start of path.
+        """
+        index, j = path[-1]
+        self.buckets.append(free_index, self.buckets.get(index, j))
+        for k in range(len(path) - 1, 0, -1):
+            index, j = path[k]
+            self.buckets.set(index, j, self.buckets.get(*path[k - 1]))
+        self.buckets.set(*path[0], fingerprint)
+
     def _get_fingerprint(self, item, len):
+        if self.hash_mode == "single":
+            return (mmh3.hash64(item, signed=False)[0] & (2**63 - 1)) % (2**len)
         return mmh3.hash(key=item) % (2**len)
 
+    def _hash_key(self, item):
+        """
+        Returns (hash, index1) of item. Fingerprints of any length are
+        hash % 2**len, so short and long fingerprints share their low bits.
+        """
+        if self.hash_mode == "single":
+            low, high = mmh3.hash64(item, signed=False)
+            return low & (2**63 - 1), high % self.num_buckets
+        return mmh3.hash(key=item), mmh3.hash(key=item, seed=1) % self.num_buckets
+
+    def _alt_index(self, index, fingerprint) -> int:
+        """
+        Returns the alternate bucket of a fingerprint stored in bucket index.
+        In "single" mode the offset is looked up, not hashed, unless the
+        fingerprints are too wide for a table, see hashing.alt_offsets(), and
+        _alt_index(_alt_index(i, f), f) == i holds for any num_buckets.
+        """
+        if self.hash_mode == "single":
+            offset = alt_offset(fingerprint) if self.alt_offsets is None else int(self.alt_offsets[fingerprint])
+            return (offset - index) % self.num_buckets
+        return (index ^ mmh3.hash(key=str(fingerprint), seed=2)) % self.num_buckets
+
+    def _hash(self, item):
+        # fingerprint, index1 and index2 of item
+        hash, index1 = self._hash_key(item)
+        fingerprint = hash % (2**self.fingerprint_len)
+        return fingerprint, index1, self._alt_index(index1, fingerprint)
+
+    def _hash_key_many(self, keys):
+        # vectorized _hash_key(), as int64 arrays
+        keys = as_blocks(keys)
+        if self.hash_mode == "single":
+            hashes = hash64_many(keys)
+            return (hashes[:, 0] & np.uint64(2**63 - 1)).astype(np.int64), (hashes[:, 1] % np.uint64(self.num_buckets)).astype(np.int64)
+        return hash_many(keys), hash_many(keys, seed=1) % self.num_buckets
+
+    def _alt_index_many(self, index, fingerprints):
+        # vectorized _alt_index(), as int64 array
+        if self.hash_mode == "single":
+            offsets = alt_offset_many(fingerprints) if self.alt_offsets is None else self.alt_offsets[fingerprints]
+            return (offsets.astype(np.int64) - index) % self.num_buckets
+        return (index ^ hash_fingerprints(fingerprints)) % self.num_buckets
+
+    def _hash_many(self, keys):
+        # fingerprints, index1 and index2 of all keys, as int64 arrays
+        hashes, index1 = self._hash_key_many(keys)
+        fingerprints = hashes % (2**self.fingerprint_len)
+        return fingerprints, index1, self._alt_index_many(index1, fingerprints)
+
+    def _slot_len(self) -> int:
+        # widest fingerprint a slot has to hold
+        return self.fingerprint_len
+
+    def _new_buckets(self, bits, dtype = None):
+        if dtype is None:
+            dtype = uint_dtype(bits)
+        return STORAGE_BACKENDS[self.storage](self.num_buckets, self.bucket_size, dtype)
+
 class CBCuckooFilter(CuckooFilter):
-    def __init__(self, num_buckets : int, bucket_size : int, fingerprint_len : int, max_kicks = 10):
+    def __init__(self, num_buckets : int, bucket_size : int, fingerprint_len : int, max_kicks = 10, storage = "list", hash_mode = "classic", keyless = False, eviction = "random", stash_size = 4, stats = None, max_visited = None):
         """
         Initializes a Configurable-Bucket Cuckoo Filter. This is a Cuckoo Filter which adjusts
-        fingerprint length stored in the buckets based on filter occupancy. Achieves lower false 
+        fingerprint length stored in the buckets based on filter occupancy. Achieves lower false
         positive rate compared to ordinary CuckooFilter.
 
         Args:
@@ -122,175 +497,488 @@ class CBCuckooFilter(CuckooFilter):
             bucket_size: int > 0
             fingerprint_len: int > 0
             max_kicks: int > 0 : max number of retry iterations when inserting
-        
+            storage: "list" | "array" : bucket storage backend, see buckets.py
+            hash_mode: "classic" | "single" : see CuckooFilter
+            keyless: bool : if True, original keys are not stored. Long-to-short
+                conversion truncates the stored fingerprints to their low
+                fingerprint_len bits. The truncated high bits are lost, so a short
+                bucket stays short until it is empty again (sticky short buckets),
+                and scrubbing does nothing. Kicks use the alternate-index involution,
+                so "classic" hash_mode requires num_buckets to be a power of two.
+            eviction: "random" | "bfs" : see CuckooFilter
+            stash_size: int >= 0 : see CuckooFilter
+            stats: FilterStats | None : see CuckooFilter
+            max_visited: int > 0 : see CuckooFilter
+
         Raises ValueError if constraints not met.
         """
-        super().__init__(num_buckets, bucket_size, fingerprint_len, max_kicks)
-        self.sbits = bitarray(num_buckets)
+        self.long_fingerprint_len = int(fingerprint_len + fingerprint_len/3)
+        self.sbits = bitarray(max(num_buckets, 0))
         self.sbits.setall(1) #all empty!
-        self.long_fingerprint_len = int(self.fingerprint_len + self.fingerprint_len/3)
-        self.actual_elements = [[] for _ in range(num_buckets)]
+        self.scrub_cursor = 0
+        self.num_short_buckets = 0
+        self.num_short_fingerprints = 0 #fingerprints stored in short buckets, kept up to date by every bucket change
+        self.keyless = keyless
+        super().__init__(num_buckets, bucket_size, fingerprint_len, max_kicks, storage, hash_mode, eviction, stash_size, stats, max_visited)
+        #stash entries are (index, item, short_fingerprint, long_fingerprint), item and long_fingerprint None if unknown
+        if not keyless:
+            self.actual_elements = self._new_buckets(0, dtype=object)
 
+    @timed("insert")
     def insert(self, __item : str) -> bool:
         """
         Inserts byte-like object into the filter.
 
         Returns True if insert successful, otherwise False.
         """
-        short_fingerprint = self._get_fingerprint(item=__item, len=self.fingerprint_len)
-        long_fingerprint = self._get_fingerprint(item=__item, len=self.long_fingerprint_len)
-        index1 = mmh3.hash(key=__item, seed=1) % self.num_buckets
-        index2 = (index1 ^ mmh3.hash(key=str(short_fingerprint), seed=2))  % self.num_buckets
-        if len(self.buckets[index1]) < len(self.buckets[index2]):
+        __item = as_key(__item)
+        short_fingerprint, long_fingerprint, index1, index2 = self._hash(__item)
+        return self._insert(__item, short_fingerprint, long_fingerprint, index1, index2)
+
+    @timed("insert", batched=True)
+    def insert_many(self, keys) -> np.ndarray:
+        """
+        Inserts a sequence or NumPy array of keys. All keys are hashed in bulk,
+        placement itself stays sequential.
+
+        Returns a boolean array, True where the insert was successful.
+        """
+        keys = as_hashable(keys)
+        short_fingerprints, long_fingerprints, index1, index2 = self._hash_many(keys)
+        keys = as_keys(keys) #stored as insert() stores them
+        return np.fromiter(map(self._insert, keys, short_fingerprints.tolist(), long_fingerprints.tolist(), index1.tolist(), index2.tolist()), dtype=np.bool_, count=len(keys))
+
+    def _insert(self, __item, short_fingerprint, long_fingerprint, index1, index2) -> bool:
+        if self.buckets.size(index1) < self.buckets.size(index2):
             insertindex = index1
         else:
             insertindex = index2
 
-        if len(self.buckets[insertindex]) < self.bucket_size:
-            if len(self.buckets[insertindex]) == self.bucket_size - 1:
-                # special case: transforms long fingerprints into short ones.
-                for i in range(len(self.buckets[insertindex])):
-                    self.buckets[insertindex][i] = self._get_fingerprint(item=self.actual_elements[insertindex][i], len=self.fingerprint_len)
-                self.buckets[insertindex].append(short_fingerprint)
-                self.sbits[insertindex] = 0
-            else:
-                self.buckets[insertindex].append(long_fingerprint)
-            self.actual_elements[insertindex].append(__item)
+        if self.buckets.size(insertindex) < self.bucket_size:
+            self._place(insertindex, __item, short_fingerprint, long_fingerprint)
             self.num_items += 1
+            self._record_kicks(0)
+            return True
+
+        if self.eviction == "bfs":
+            found = self._find_path(index1, index2)
+            if found is None:
+                return self._stash((index1, None if self.keyless else __item, short_fingerprint, long_fingerprint))
+            self._move_along(*found, __item, short_fingerprint)
+            self.num_items += 1
+            self._record_kicks(len(found[0]))
             return True
 
-        
-        
         #need to enter evict procedure
         eviction_index = random.choice([index1, index2])
-        for _ in range(self.max_kicks):
-            if len(self.buckets[eviction_index]) < self.bucket_size:
-                if len(self.buckets[eviction_index]) == self.bucket_size - 1:
-                    # special case: transforms long fingerprints into short ones.
-                    for i in range(len(self.buckets[eviction_index])):
-                        self.buckets[eviction_index][i] = self._get_fingerprint(item=self.actual_elements[eviction_index][i], len=self.fingerprint_len)
-                    self.buckets[eviction_index].append(short_fingerprint)
-                    self.sbits[eviction_index] = 0
-                else:
-                    self.buckets[eviction_index].append(self._get_fingerprint(item=__item, len=self.long_fingerprint_len)) #get this long one on the fly
-                self.actual_elements[eviction_index].append(__item)
+        journal = []
+        for kicks in range(self.max_kicks):
+            if self.buckets.size(eviction_index) < self.bucket_size:
+                #get this long one on the fly, a keyless filter only knows the short one
+                long_fingerprint = None if self.keyless else self._get_fingerprint(item=__item, len=self.long_fingerprint_len)
+                self._place(eviction_index, __item, short_fingerprint, long_fingerprint)
                 self.num_items += 1
+                self._record_kicks(kicks)
                 return True
-            eviction_fingerprint = self.buckets[eviction_index].pop()
-            eviction_item = self.actual_elements[eviction_index].pop()
-            self.buckets[eviction_index].append(short_fingerprint)
-            self.actual_elements[eviction_index].append(__item)
+            eviction_fingerprint = self.buckets.pop(eviction_index)
+            self.buckets.append(eviction_index, short_fingerprint)
+            if self.keyless:
+                eviction_item = None
+            else:
+                eviction_item = self.actual_elements.pop(eviction_index)
+                self.actual_elements.append(eviction_index, __item)
+            journal.append((eviction_index, eviction_item, eviction_fingerprint))
 
             short_fingerprint = eviction_fingerprint # in next iter, short_fingerprint holds to be inserted short_fingerprint
             __item = eviction_item
-            #recompute corresponding index for 'floating' item
-            index1 = mmh3.hash(key=__item, seed=1) % self.num_buckets
-            index2 = (index1 ^ mmh3.hash(key=str(short_fingerprint), seed=2))  % self.num_buckets
-            eviction_index = index2 if eviction_index == index1 else index1
+            eviction_index = self._other_index(eviction_index, __item, short_fingerprint)
 
+        long_fingerprint = None if self.keyless else self._get_fingerprint(item=__item, len=self.long_fingerprint_len)
+        if self._stash((journal[-1][0], __item, short_fingerprint, long_fingerprint)):
+            return True
+        for index, eviction_item, eviction_fingerprint in reversed(journal):
+            self.buckets.pop(index)
+            self.buckets.append(index, eviction_fingerprint)
+            if not self.keyless:
+                self.actual_elements.pop(index)
+                self.actual_elements.append(index, eviction_item)
         return False
 
+    @timed("lookup")
     def lookup(self, __item : str) -> bool:
         """
         Always returns True if element was inserted.
-        
+
         Most likely returns False if element was not inserted.
-        
+
         May return True even if element was not inserted.
         """
-        short_fingerprint = self._get_fingerprint(item=__item, len=self.fingerprint_len)
-        long_fingerprint = self._get_fingerprint(item=__item, len=self.long_fingerprint_len)
-        index1 = mmh3.hash(key=__item, seed=1) % self.num_buckets
-        index2 = (index1 ^ mmh3.hash(key=str(short_fingerprint), seed=2)) % self.num_buckets
+        return self._lookup_hashed(*self._hash(as_key(__item)))
+
+    def _lookup_hashed(self, short_fingerprint, long_fingerprint, index1, index2) -> bool:
         if self.sbits[index1]:
-            if long_fingerprint in self.buckets[index1]:
+            if self.buckets.contains(index1, long_fingerprint):
                 return True
         else:
-            if short_fingerprint in self.buckets[index1]:
+            if self.buckets.contains(index1, short_fingerprint):
                 return True
         if self.sbits[index2]:
-            if long_fingerprint in self.buckets[index2]:
+            if self.buckets.contains(index2, long_fingerprint):
                 return True
         else:
-            if short_fingerprint in self.buckets[index2]:
+            if self.buckets.contains(index2, short_fingerprint):
                 return True
+        for index, _, stashed_short_fingerprint, stashed_long_fingerprint in self.stash:
+            if index == index1 or index == index2:
+                if stashed_long_fingerprint is None:
+                    if stashed_short_fingerprint == short_fingerprint:
+                        return True
+                elif stashed_long_fingerprint == long_fingerprint:
+                    return True
         return False
 
+    @timed("lookup", batched=True)
+    def lookup_many(self, keys) -> np.ndarray:
+        """
+        Looks up a sequence or NumPy array of keys at once.
+
+        Returns a boolean array with the result of lookup() for every key.
+        """
+        return self._lookup_hashed_many(*self._hash_many(as_hashable(keys)))
+
+    def _lookup_hashed_many(self, short_fingerprints, long_fingerprints, index1, index2) -> np.ndarray:
+        long_buckets = np.frombuffer(self.sbits.unpack(), dtype=np.bool_)
+        found = self.buckets.contains_many(index1, np.where(long_buckets[index1], long_fingerprints, short_fingerprints))
+        found |= self.buckets.contains_many(index2, np.where(long_buckets[index2], long_fingerprints, short_fingerprints))
+        for index, _, stashed_short_fingerprint, stashed_long_fingerprint in self.stash:
+            if stashed_long_fingerprint is None:
+                matches = short_fingerprints == stashed_short_fingerprint
+            else:
+                matches = long_fingerprints == stashed_long_fingerprint
+            found |= ((index1 == index) | (index2 == index)) & matches
+        return found
+
+    @timed("delete")
     def delete(self, __item : str):
         """
         Delete element of filter.
 
         Raises ValueError if element is not found.
         """
-        if __item == '190':
-            pass
-        short_fingerprint = self._get_fingerprint(item=__item, len=self.fingerprint_len)
-        long_fingerprint = self._get_fingerprint(item=__item, len=self.long_fingerprint_len)
-        index1 = mmh3.hash(key=__item, seed=1) % self.num_buckets
-        if index1 == 70 or index1 == 25:
-            pass
-        #check index1
-        if self.sbits[index1]:
-            if long_fingerprint in self.buckets[index1]:
-                if __item in self.actual_elements[index1]:
-                    self.buckets[index1].pop(self.actual_elements[index1].index(__item))
-                    self.actual_elements[index1].remove(__item)
-                    self.num_items -= 1
-                    return
-        else:
-            if short_fingerprint in self.buckets[index1]:
-                if __item in self.actual_elements[index1]:
-                    self.buckets[index1].pop(self.actual_elements[index1].index(__item))
-                    self.actual_elements[index1].remove(__item)
-                    self.num_items -= 1
-                    #need to convert bucket to long fingerprints!
-                    for i in range(len(self.buckets[index1])):
-                        self.buckets[index1][i] = self._get_fingerprint(item=self.actual_elements[index1][i], len=self.long_fingerprint_len)
-                    self.sbits[index1] = 1
-                    return
-        #check index 2
-        index2 = (index1 ^ mmh3.hash(key=str(short_fingerprint), seed=2)) % self.num_buckets
-        if index2 == 70 or index2 == 25:
-            pass
-        if self.sbits[index2]:
-            if long_fingerprint in self.buckets[index2]:
-                if __item in self.actual_elements[index2]:
-                    self.buckets[index2].pop(self.actual_elements[index2].index(__item))
-                    self.actual_elements[index2].remove(__item)
-                    self.num_items -= 1
+        __item = as_key(__item)
+        hash, index1 = self._hash_key(__item)
+        short_fingerprint = hash % (2**self.fingerprint_len)
+        long_fingerprint = hash % (2**self.long_fingerprint_len)
+        index2 = self._alt_index(index1, short_fingerprint)
+        if self.keyless:
+            self._delete_keyless(short_fingerprint, long_fingerprint, index1, index2)
+            return
+        if self._remove(index1, __item, short_fingerprint, long_fingerprint):
+            self._drain_stash()
+            return
+        if self._remove(index2, __item, short_fingerprint, long_fingerprint):
+            self._drain_stash()
+            return
+        for entry in self.stash:
+            index, item, stashed_short_fingerprint, stashed_long_fingerprint = entry
+            if (index == index1 or index == index2) and item == __item:
+                self.stash.remove(entry)
+                self.num_items -= 1
+                return
+        raise ValueError()
+
+    def _delete_keyless(self, short_fingerprint, long_fingerprint, index1, index2):
+        """
+        Removes one fingerprint of a key from its buckets or the stash. A
+        short fingerprint may as well belong to another key whose long
+        fingerprint merely shares its low bits, so matching long fingerprints
+        are looked for everywhere first and short ones only after.
+
+        Raises ValueError if no fingerprint matches.
+        """
+        for long in (True, False):
+            for index in (index1, index2):
+                if bool(self.sbits[index]) == long and self._remove(index, None, short_fingerprint, long_fingerprint):
+                    self._drain_stash()
                     return
-        else:
-            if short_fingerprint in self.buckets[index2]:
-                if __item in self.actual_elements[index2]:
-                    self.buckets[index2].pop(self.actual_elements[index2].index(__item))
-                    self.actual_elements[index2].remove(__item)
+            for entry in self.stash:
+                index, _, stashed_short_fingerprint, stashed_long_fingerprint = entry
+                if index != index1 and index != index2:
+                    continue
+                if stashed_long_fingerprint == long_fingerprint if long else stashed_long_fingerprint is None and stashed_short_fingerprint == short_fingerprint:
+                    self.stash.remove(entry)
                     self.num_items -= 1
-                    #need to convert bucket to long fingerprints!
-                    for i in range(len(self.buckets[index2])):
-                        self.buckets[index2][i] = self._get_fingerprint(item=self.actual_elements[index2][i], len=self.long_fingerprint_len)
-                    self.sbits[index2] = 1
                     return
         raise ValueError()
 
+    def copy(self):
+        """
+        Returns an independent copy of the filter, e.g. to scrub or modify a
+        snapshot while inserting into the original goes on.
+        """
+        filter = copy.copy(self)
+        filter.sbits = self.sbits.copy()
+        filter.buckets = self.buckets.copy()
+        filter.stash = list(self.stash)
+        if not self.keyless:
+            filter.actual_elements = self.actual_elements.copy()
+        if self.stats is not None:
+            filter.stats = self.stats.copy()
+        return filter
+
+    def compute_memory_bytes(self) -> int:
+        return super().compute_memory_bytes() + self.sbits.nbytes
+
+    def _snapshot(self):
+        header, sections = super()._snapshot()
+        header["stash"] = [[index, short_fingerprint, long_fingerprint] for index, _, short_fingerprint, long_fingerprint in self.stash]
+        sections["sbits"] = self.sbits
+        if not self.keyless:
+            sections["keys"] = encode_keys(item for i in range(self.num_buckets) for item in self.actual_elements[i])
+            sections["stash_keys"] = encode_keys(item for _, item, _, _ in self.stash)
+        return header, sections
+
+    def _restore(self, header, sections, mmap):
+        """
+        Restores sbits before the buckets, packed storage reads its slot
+        widths from them. Keys are not loaded with mmap, lookups need none.
+        """
+        if mmap:
+            self.sbits = bitarray(buffer=sections["sbits"])
+        else:
+            self.sbits = bitarray()
+            self.sbits.frombytes(bytes(sections["sbits"]))
+            del self.sbits[self.num_buckets:]
+        super()._restore(header, sections, mmap)
+        if self.keyless:
+            self.stash = [(index, None, short_fingerprint, long_fingerprint) for index, short_fingerprint, long_fingerprint in self.stash]
+            return
+        stash_keys = decode_keys(sections["stash_keys"])
+        self.stash = [(index, item, short_fingerprint, long_fingerprint) for (index, short_fingerprint, long_fingerprint), item in zip(self.stash, stash_keys)]
+        if mmap:
+            self.actual_elements = None
+            return
+        keys = iter(decode_keys(sections["keys"]))
+        self.actual_elements = STORAGE_BACKENDS.get(self.storage, ListBuckets)(self.num_buckets, self.bucket_size, object)
+        for i in range(self.num_buckets):
+            for _ in range(self.buckets.size(i)):
+                self.actual_elements.append(i, next(keys))
+
+    def _fill(self, keys):
+        """
+        Places keys into the empty filter in scrub-optimal form: a maximum
+        assignment with room for bucket_size - 1 long fingerprints per bucket
+        is extended by augmenting paths to bucket_size. Every extension fills
+        exactly one bucket, so the number of short buckets is the minimum any
+        placement of these keys can have and scrub() would find nothing to do.
+        """
+        short_fingerprints, long_fingerprints, index1, index2 = self._hash_many(keys)
+        short_fingerprints, long_fingerprints, index1, index2 = short_fingerprints.tolist(), long_fingerprints.tolist(), index1.tolist(), index2.tolist()
+        if not self.keyless:
+            keys = as_keys(keys)
+        contents, unplaced = assign_keys(index1, index2, self.num_buckets, self.bucket_size - 1)
+        contents, unplaced = assign_keys(index1, index2, self.num_buckets, self.bucket_size, contents, unplaced)
+        for i, bucket in enumerate(contents):
+            if len(bucket) == self.bucket_size:
+                self.sbits[i] = 0 #flip first, packed storage takes the slot width from sbits
+                self.num_short_buckets += 1
+                self.num_short_fingerprints += len(bucket)
+                fingerprints = short_fingerprints
+            else:
+                fingerprints = long_fingerprints
+            for k in bucket:
+                self.buckets.append(i, fingerprints[k])
+                if not self.keyless:
+                    self.actual_elements.append(i, keys[k])
+            self.num_items += len(bucket)
+        for k in unplaced:
+            if not self._stash((index1[k], None if self.keyless else keys[k], short_fingerprints[k], long_fingerprints[k])):
+                break
+
+    def _drain_stash(self):
+        """
+        Moves stashed victims back into the table where one of their buckets has room.
+        """
+        for entry in list(self.stash):
+            index, item, short_fingerprint, long_fingerprint = entry
+            for candidate in (index, self._other_index(index, item, short_fingerprint)):
+                if self.buckets.size(candidate) < self.bucket_size:
+                    self._place(candidate, item, short_fingerprint, long_fingerprint)
+                    self.stash.remove(entry)
+                    break
+
+    def _needs_involution(self) -> bool:
+        # a keyed filter rehashes its keys, see _other_index()
+        return self.keyless
+
+    def _slot_alt_index(self, index, j) -> int:
+        # buckets on a displacement path are full, hence hold short fingerprints
+        item = None if self.keyless else self.actual_elements.get(index, j)
+        return self._other_index(index, item, self.buckets.get(index, j))
+
+    def _move_along(self, path, free_index, item, short_fingerprint):
+        """
+        Moves every element on path one step on, starting at the free end,
+        and stores item in the slot freed at the start of path. All buckets
+        on path are full and stay short, the free one is filled by _place().
+        """
+        index, j = path[-1]
+        moved_item = None if self.keyless else self.actual_elements.get(index, j)
+        moved_long_fingerprint = None if self.keyless else self._get_fingerprint(item=moved_item, len=self.long_fingerprint_len)
+        self._place(free_index, moved_item, self.buckets.get(index, j), moved_long_fingerprint)
+        for k in range(len(path) - 1, 0, -1):
+            index, j = path[k]
+            self.buckets.set(index, j, self.buckets.get(*path[k - 1]))
+            if not self.keyless:
+                self.actual_elements.set(index, j, self.actual_elements.get(*path[k - 1]))
+        self.buckets.set(*path[0], short_fingerprint)
+        if not self.keyless:
+            self.actual_elements.set(*path[0], item)
+
+    def _place(self, index, item, short_fingerprint, long_fingerprint):
+        """
+        Stores item in bucket index, which must have a free slot. Fills the
+        last free slot with a short fingerprint and converts the bucket to shorts.
+        A long_fingerprint of None (kicked fingerprint of a keyless filter) also
+        converts the bucket to shorts. Does not touch num_items.
+        """
+        if long_fingerprint is None or not self.sbits[index] or self.buckets.size(index) == self.bucket_size - 1:
+            # special case: transforms long fingerprints into short ones.
+            if self.sbits[index]:
+                self._to_short(index)
+            self.buckets.append(index, short_fingerprint)
+            self.num_short_fingerprints += 1
+        else:
+            self.buckets.append(index, long_fingerprint)
+        if not self.keyless:
+            self.actual_elements.append(index, item)
+
+    def _remove(self, index, item, short_fingerprint, long_fingerprint) -> bool:
+        """
+        Removes item from bucket index if present there. A short bucket
+        that loses an element is converted back to long fingerprints. A
+        keyless filter removes one matching fingerprint instead and only
+        converts a short bucket back once it is empty.
+
+        Returns True if item was removed.
+        """
+        if self.sbits[index]:
+            if not self.buckets.contains(index, long_fingerprint):
+                return False
+        else:
+            if not self.buckets.contains(index, short_fingerprint):
+                return False
+        if self.keyless:
+            if self.sbits[index]:
+                self.buckets.remove(index, long_fingerprint)
+            else:
+                self.buckets.remove(index, short_fingerprint)
+                self.num_short_fingerprints -= 1
+                if self.buckets.size(index) == 0:
+                    self.sbits[index] = 1
+                    self.num_short_buckets -= 1
+            self.num_items -= 1
+            return True
+        if not self.actual_elements.contains(index, item):
+            return False
+        self.buckets.pop(index, self.actual_elements.index(index, item))
+        self.actual_elements.remove(index, item)
+        self.num_items -= 1
+        if not self.sbits[index]:
+            #need to convert bucket to long fingerprints!
+            self.num_short_fingerprints -= 1
+            self._to_long(index)
+        return True
+
+    def _to_short(self, index):
+        if self.keyless:
+            fingerprints = [fingerprint % (2**self.fingerprint_len) for fingerprint in self.buckets[index]]
+        else:
+            fingerprints = [self._get_fingerprint(item=item, len=self.fingerprint_len) for item in self.actual_elements[index]]
+        self.sbits[index] = 0 #flip first, packed storage takes the slot width from sbits
+        for j, fingerprint in enumerate(fingerprints):
+            self.buckets.set(index, j, fingerprint)
+        self.num_short_buckets += 1
+        self.num_short_fingerprints += len(fingerprints)
+        if self.stats is not None:
+            self.stats.to_short += 1
+
+    def _to_long(self, index):
+        fingerprints = [self._get_fingerprint(item=item, len=self.long_fingerprint_len) for item in self.actual_elements[index]]
+        self.sbits[index] = 1
+        for j, fingerprint in enumerate(fingerprints):
+            self.buckets.set(index, j, fingerprint)
+        self.num_short_buckets -= 1
+        self.num_short_fingerprints -= len(fingerprints)
+        if self.stats is not None:
+            self.stats.to_long += 1
+
+    def _slot_len(self) -> int:
+        return self.long_fingerprint_len
+
+    def _hash(self, item):
+        # short and long fingerprints, index1 and index2 of item
+        hash, index1 = self._hash_key(item)
+        short_fingerprint = hash % (2**self.fingerprint_len)
+        return short_fingerprint, hash % (2**self.long_fingerprint_len), index1, self._alt_index(index1, short_fingerprint)
+
+    def _other_index(self, index, item, short_fingerprint) -> int:
+        """
+        Returns the candidate bucket of item that is not index. "single" mode
+        uses the offset table, "classic" mode rehashes item because its xor
+        is not an involution unless num_buckets is a power of two.
+        """
+        if self.hash_mode == "single" or self.keyless:
+            return self._alt_index(index, short_fingerprint)
+        index1 = self._hash_key(item)[1]
+        index2 = self._alt_index(index1, short_fingerprint)
+        return index2 if index == index1 else index1
+
+    def _hash_many(self, keys):
+        # short and long fingerprints, index1 and index2 of all keys, as int64 arrays
+        hashes, index1 = self._hash_key_many(keys)
+        short_fingerprints = hashes % (2**self.fingerprint_len)
+        long_fingerprints = hashes % (2**self.long_fingerprint_len)
+        return short_fingerprints, long_fingerprints, index1, self._alt_index_many(index1, short_fingerprints)
+
     def _test_verify_state(self):
+        assert self.num_short_buckets == self.sbits.count(0)
+        assert self.num_short_fingerprints == sum(self.buckets.size(i) for i in range(self.num_buckets) if not self.sbits[i])
+        if self.keyless:
+            self._test_verify_keyless_state()
+            return
         for i in range(self.num_buckets):
             #check length consistency
-            assert len(self.buckets[i]) == len(self.actual_elements[i])
+            assert self.buckets.size(i) == self.actual_elements.size(i)
             #check sbits consistency
             if self.sbits[i]:
-                assert len(self.buckets[i]) < self.bucket_size
-                for j in range(len(self.buckets[i])):
-                    assert self.buckets[i][j] == self._get_fingerprint(item=self.actual_elements[i][j], len=self.long_fingerprint_len)
+                assert self.buckets.size(i) < self.bucket_size
+                for j in range(self.buckets.size(i)):
+                    assert self.buckets.get(i, j) == self._get_fingerprint(item=self.actual_elements.get(i, j), len=self.long_fingerprint_len)
             else:
-                assert len(self.buckets[i]) == self.bucket_size
-                for j in range(len(self.buckets[i])):
-                    assert self.buckets[i][j] == self._get_fingerprint(item=self.actual_elements[i][j], len=self.fingerprint_len)
-            for j in range(len(self.buckets[i])):
-                short_fprint = self._get_fingerprint(item=self.actual_elements[i][j], len=self.fingerprint_len)
-                index1 = mmh3.hash(key=self.actual_elements[i][j], seed=1) % self.num_buckets
-                index2 = (index1 ^ mmh3.hash(key=str(short_fprint), seed=2))  % self.num_buckets
+                assert self.buckets.size(i) == self.bucket_size
+                for j in range(self.buckets.size(i)):
+                    assert self.buckets.get(i, j) == self._get_fingerprint(item=self.actual_elements.get(i, j), len=self.fingerprint_len)
+            for j in range(self.buckets.size(i)):
+                item = self.actual_elements.get(i, j)
+                _, _, index1, index2 = self._hash(item)
                 assert i == index1 or i == index2
 
+    def _test_verify_keyless_state(self):
+        num_items = 0
+        for i in range(self.num_buckets):
+            size = self.buckets.size(i)
+            num_items += size
+            if self.sbits[i]:
+                assert size < self.bucket_size
+                bits = self.long_fingerprint_len
+            else:
+                assert size > 0
+                bits = self.fingerprint_len
+            for j in range(size):
+                assert 0 <= self.buckets.get(i, j) < 2**bits
+        assert num_items + len(self.stash) == self.num_items
+
     def compute_false_positive_rate(self) -> float:
         """
         Returns the false positive rate based on:
@@ -299,77 +987,204 @@ class CBCuckooFilter(CuckooFilter):
 
         where
 
-        l: fraction of available filter slots filled by short fingerprints
+        l: fraction of available filter slots filled by long fingerprints
 
-        s: fraction of available filter slots filled by long fingerprints
+        s: fraction of available filter slots filled by short fingerprints
+
+        Both come from counters kept up to date by every bucket change, so this is O(1).
+        Stashed elements count as long fingerprints.
         """
-        shortscounter = 0
-        for i in range(self.num_buckets):
-            if self.sbits[i] == 0:
-                shortscounter += 4
-        s = shortscounter / (self.num_buckets * self.bucket_size)
-        l = (self.num_items - shortscounter) / (self.num_buckets * self.bucket_size)
+        s = self.num_short_fingerprints / (self.num_buckets * self.bucket_size)
+        l = (self.num_items - self.num_short_fingerprints) / (self.num_buckets * self.bucket_size)
         return 8 * (l / 2**(self.long_fingerprint_len) + s / 2**(self.fingerprint_len))
-    
-    def scrub(self):
-        if self.compute_filter_occupancy() > 0.95:
-            print("Warning: Scrubbing at", self.compute_filter_occupancy(), "may be slow!")
-            if self.compute_filter_occupancy() == 1:
-                print("Scrubbing abort: Filter is full!")
-                return
-        for i in range(len(self.buckets)):
-            if len(self.buckets[i]) == self.bucket_size:
-                eviction_index = i
-                eviction_item = self.actual_elements[eviction_index].pop()
-                eviction_short_fingerprint = self.buckets[eviction_index].pop()
-                eviction_long_fingerprint = self._get_fingerprint(item=eviction_item, len=self.long_fingerprint_len)
-                for j in range(len(self.buckets[eviction_index])): #convert to longs
-                    self.buckets[eviction_index][j] = self._get_fingerprint(item=self.actual_elements[eviction_index][j], len=self.long_fingerprint_len)
-                self.sbits[eviction_index] = 1
-                for _ in range(20):
-                    #recompute corresponding index for 'floating' item
-                    index1 = mmh3.hash(key=eviction_item, seed=1) % self.num_buckets
-                    index2 = (index1 ^ mmh3.hash(key=str(eviction_short_fingerprint), seed=2))  % self.num_buckets
-                    eviction_index = index2 if eviction_index == index1 else index1
-                    if len(self.buckets[eviction_index]) < self.bucket_size - 1:
-                        #success, can insert long fingerprint
-                        self.buckets[eviction_index].append(eviction_long_fingerprint)
-                        self.actual_elements[eviction_index].append(eviction_item)
-                        eviction_item = 0
-                        break
-                    else:
-                        #need to swap out, search on
-                        self.actual_elements[eviction_index].append(eviction_item)
-                        if self.sbits[eviction_index]:
-                            self.buckets[eviction_index].append(eviction_long_fingerprint)
-                        else:
-                            self.buckets[eviction_index].append(eviction_short_fingerprint)
-                        eviction_item = self.actual_elements[eviction_index].pop(-2)
-                        self.buckets[eviction_index].pop(-2)
-                        eviction_short_fingerprint = self._get_fingerprint(item=eviction_item, len=self.fingerprint_len)
-                        eviction_long_fingerprint = self._get_fingerprint(item=eviction_item, len=self.long_fingerprint_len)
-                if eviction_item == 0:
-                    continue
-                while True: #continue indefinitely until swap completed (this loop relaxes constraints)
-                    #recompute corresponding index for 'floating' item
-                    index1 = mmh3.hash(key=eviction_item, seed=1) % self.num_buckets
-                    index2 = (index1 ^ mmh3.hash(key=str(eviction_short_fingerprint), seed=2))  % self.num_buckets
-                    eviction_index = index2 if eviction_index == index1 else index1
-                    if len(self.buckets[eviction_index]) < self.bucket_size:
-                        #success, can insert fingerprint
-                        if len(self.buckets[eviction_index]) == self.bucket_size - 1: #need to transform bucket to shorts
-                            for j in range(len(self.buckets[eviction_index])):
-                                self.buckets[eviction_index][j] = self._get_fingerprint(item=self.actual_elements[eviction_index][j], len=self.fingerprint_len)
-                            self.buckets[eviction_index].append(eviction_short_fingerprint)
-                            self.sbits[eviction_index] = 0
-                        else:
-                            self.buckets[eviction_index].append(eviction_long_fingerprint)
-                        self.actual_elements[eviction_index].append(eviction_item)
-                        break
-                    else:
-                        #need to swap out, search on
-                        self.actual_elements[eviction_index].append(eviction_item)
-                        self.buckets[eviction_index].append(eviction_short_fingerprint)
-                        eviction_item = self.actual_elements[eviction_index].pop(-2)
-                        eviction_short_fingerprint = self.buckets[eviction_index].pop(-2)
-                        eviction_long_fingerprint = self._get_fingerprint(item=eviction_item, len=self.long_fingerprint_len)
\ No newline at end of file
+
+    def scrub(self, max_relocations = 1000):
+        """
+        Runs one complete scrub pass over all buckets, see scrub_step().
+        """
+        self.scrub_cursor = 0
+        while self.scrub_step(max_relocations) > 0:
+            pass
+
+    @timed("scrub_step")
+    def scrub_step(self, max_relocations = 64) -> int:
+        """
+        Continues the current scrub pass: moves one element out of each full
+        short bucket so the bucket returns to long fingerprints. Short buckets
+        are found through sbits, which insert and delete keep up to date.
+        Does at most max_relocations relocations per call. A bucket that cannot
+        be relocated within a whole call's budget stays short.
+
+        Stashed victims are moved back into the table first where possible.
+
+        Returns the number of short buckets the current pass has yet to visit,
+        0 once the pass is complete. The next call starts a new pass.
+
+        Raises ValueError if max_relocations < 1.
+        """
+        if max_relocations < 1:
+            raise ValueError()
+        self._drain_stash()
+        if self.keyless or self.num_items == self.num_buckets * self.bucket_size:
+            #truncated fingerprints cannot be lengthened again, a full filter has no room
+            self.scrub_cursor = 0
+            return 0
+        budget = max_relocations
+        while budget > 0:
+            index = self.sbits.find(0, self.scrub_cursor)
+            if index == -1:
+                break
+            relocations = self._scrub_bucket(index, budget)
+            if relocations is None:
+                if budget < max_relocations:
+                    break #retry with a whole budget in the next call
+                relocations = budget
+            budget -= relocations
+            self.scrub_cursor = index + 1
+        if self.stats is not None:
+            self.stats.scrub_relocations += max_relocations - budget
+        remaining = self.sbits.count(0, self.scrub_cursor)
+        if remaining == 0:
+            self.scrub_cursor = 0
+        return remaining
+
+    def _scrub_bucket(self, index, max_relocations):
+        """
+        Moves the last element of full short bucket index into its other
+        bucket, kicking elements on for at most max_relocations relocations.
+        The first 20 relocations only accept buckets with room for a long
+        fingerprint. If the walk fails, all kicks are undone and bucket
+        index is restored.
+
+        Returns the number of relocations, None if the walk failed.
+        """
+        item = self.actual_elements.pop(index)
+        short_fingerprint = self.buckets.pop(index)
+        self.num_short_fingerprints -= 1
+        long_fingerprint = self._get_fingerprint(item=item, len=self.long_fingerprint_len)
+        self._to_long(index) #convert to longs
+        journal = []
+        eviction_index = index
+        for relocations in range(max_relocations):
+            #recompute corresponding index for 'floating' item
+            eviction_index = self._other_index(eviction_index, item, short_fingerprint)
+            if relocations < 20:
+                if self.buckets.size(eviction_index) < self.bucket_size - 1:
+                    #success, can insert long fingerprint
+                    self.buckets.append(eviction_index, long_fingerprint)
+                    self.actual_elements.append(eviction_index, item)
+                    return relocations + 1
+            elif self.buckets.size(eviction_index) < self.bucket_size:
+                #constraints relaxed, success if fingerprint fits at all
+                self._place(eviction_index, item, short_fingerprint, long_fingerprint)
+                return relocations + 1
+            #need to swap out, search on
+            journal.append((eviction_index, self.actual_elements.pop(eviction_index), self.buckets.pop(eviction_index)))
+            self.actual_elements.append(eviction_index, item)
+            self.buckets.append(eviction_index, long_fingerprint if self.sbits[eviction_index] else short_fingerprint)
+            item = journal[-1][1]
+            long_fingerprint = self._get_fingerprint(item=item, len=self.long_fingerprint_len)
+            short_fingerprint = long_fingerprint % (2**self.fingerprint_len)
+        for eviction_index, swapped_item, swapped_fingerprint in reversed(journal):
+            item = self.actual_elements.pop(eviction_index)
+            self.buckets.pop(eviction_index)
+            self.actual_elements.append(eviction_index, swapped_item)
+            self.buckets.append(eviction_index, swapped_fingerprint)
+        long_fingerprint = self._get_fingerprint(item=item, len=self.long_fingerprint_len)
+        self._place(index, item, long_fingerprint % (2**self.fingerprint_len), long_fingerprint)
+        return None
+
+class PackedCuckooFilter(CuckooFilter):
+    def __init__(self, num_buckets : int, bucket_size : int, fingerprint_len : int, max_kicks = 10, hash_mode = "classic", eviction = "random", stash_size = 4, stats = None):
+        """
+        Initializes a Cuckoo Filter whose buckets are packed into one contiguous
+        table of num_buckets * bucket_size * fingerprint_len bits, see PackedBuckets.
+
+        Args:
+            num_buckets: int > 0
+            bucket_size: int > 0
+            fingerprint_len: 0 < int <= 57
+            max_kicks: int > 0 : max number of retry iterations when inserting
+            hash_mode: "classic" | "single" : see CuckooFilter
+            eviction: "random" | "bfs" : see CuckooFilter
+            stash_size: int >= 0 : see CuckooFilter
+            stats: FilterStats | None : see CuckooFilter
+
+        Raises ValueError if constraints not met.
+        """
+        super().__init__(num_buckets, bucket_size, fingerprint_len, max_kicks, "list", hash_mode, eviction, stash_size, stats)
+        self.storage = "packed"
+
+    def compute_bits_per_item(self) -> float:
+        """
+        Returns the packed table size in bits, fill counts included, divided
+        by the number of stored elements, inf if the filter is empty. See
+        PackedBuckets.
+        """
+        return self.buckets.table_bits / self.num_items if self.num_items else float("inf")
+
+    def compute_table_bytes(self) -> int:
+        """
+        Returns the packed table size in bytes, fill counts included, i.e.
+        its cache footprint.
+        """
+        return (self.buckets.table_bits + 7) // 8
+
+    def _new_buckets(self, bits, dtype = None):
+        return PackedBuckets(self.num_buckets, self.bucket_size, bits)
+
+    def _load_buckets(self, header, slots, counts, mmap):
+        return PackedBuckets(self.num_buckets, self.bucket_size, self.fingerprint_len, data=slots if mmap else bytearray(slots), counts=counts)
+
+class PackedCBCuckooFilter(CBCuckooFilter):
+    def __init__(self, num_buckets : int, bucket_size : int, fingerprint_len : int, max_kicks = 10, hash_mode = "classic", keyless = False, eviction = "random", stash_size = 4, stats = None):
+        """
+        Initializes a Configurable-Bucket Cuckoo Filter in the hardware format of
+        the paper: every bucket is one packed field holding either bucket_size - 1
+        long or bucket_size short fingerprints, selected by its sbit. For
+        bucket_size 4 a bucket is exactly 4 * fingerprint_len bits. See PackedBuckets.
+
+        Args:
+            num_buckets: int > 0
+            bucket_size: int > 0
+            fingerprint_len: 0 < int <= 42
+            max_kicks: int > 0 : max number of retry iterations when inserting
+            hash_mode: "classic" | "single" : see CuckooFilter
+            keyless: bool : see CBCuckooFilter. Without it, keys are still kept
+                outside the packed table.
+            eviction: "random" | "bfs" : see CuckooFilter
+            stash_size: int >= 0 : see CuckooFilter
+            stats: FilterStats | None : see CuckooFilter
+
+        Raises ValueError if constraints not met.
+        """
+        super().__init__(num_buckets, bucket_size, fingerprint_len, max_kicks, "list", hash_mode, keyless, eviction, stash_size, stats)
+        self.storage = "packed"
+
+    def compute_bits_per_item(self) -> float:
+        """
+        Returns the packed table size in bits, sbits and fill counts included,
+        divided by the number of stored elements, inf if the filter is empty.
+        See PackedBuckets.
+        """
+        return self.buckets.table_bits / self.num_items if self.num_items else float("inf")
+
+    def compute_table_bytes(self) -> int:
+        """
+        Returns the packed table size in bytes, sbits and fill counts
+        included, i.e. its cache footprint.
+        """
+        return (self.buckets.table_bits + 7) // 8
+
+    def copy(self):
+        filter = super().copy()
+        filter.buckets.sbits = filter.sbits
+        return filter
+
+    def _new_buckets(self, bits, dtype = None):
+        if dtype is not None:
+            return super()._new_buckets(bits, dtype)
+        return PackedBuckets(self.num_buckets, self.bucket_size, self.fingerprint_len, self.long_fingerprint_len, self.sbits)
+
+    def _load_buckets(self, header, slots, counts, mmap):
+        return PackedBuckets(self.num_buckets, self.bucket_size, self.fingerprint_len, self.long_fingerprint_len, self.sbits, slots if mmap else bytearray(slots), counts)
@@ -0,0 +1,62 @@
+from cuckoo import CuckooFilter, CBCuckooFilter, EVICTION_STRATEGIES
+import numpy as np
+import argparse
+import random
+import time
+
+FILTERS = {
+    "cf": CuckooFilter,
+    "cbcf": CBCuckooFilter
+}
+
+def benchmark_eviction(filter_class, num_buckets, fingerprint_size, max_kicks, eviction, seed = 0, max_visited = None):
+    """
+    Inserts keys one by one until as many inserts were attempted as the filter
+    has slots, timing every insert. max_visited caps the buckets a BFS search
+    visits, the filter default if None.
+
+    Returns a dict with the occupancy at the first failed insert (max load),
+    the final occupancy, the failure rate and mean/p99 insert time in µs.
+    """
+    random.seed(seed)
+    f = filter_class(num_buckets=num_buckets, bucket_size=4, fingerprint_len=fingerprint_size, max_kicks=max_kicks, storage="array", eviction=eviction, max_visited=max_visited)
+    capacity = num_buckets * 4
+    times = np.zeros(capacity, dtype=np.int64)
+    failures = 0
+    max_load = 1.0
+    for i in range(capacity):
+        key = str(i)
+        start = time.perf_counter_ns()
+        ok = f.insert(key)
+        times[i] = time.perf_counter_ns() - start
+        if not ok:
+            if failures == 0:
+                max_load = i / capacity
+            failures += 1
+    return {
+        "max_load": max_load,
+        "final_occupancy": f.compute_filter_occupancy(),
+        "failure_rate": failures / capacity,
+        "mean_insert_us": float(times.mean()) / 1000,
+        "p99_insert_us": float(np.percentile(times, 99)) / 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares random-walk and BFS eviction of Cuckoo and CB Cuckoo filters.")
+    parser.add_argument("--filter", choices=FILTERS.keys(), default="cf")
+    parser.add_argument("--num-buckets", type=int, default=8192)
+    parser.add_argument("--fingerprint-size", type=int, default=12)
+    parser.add_argument("--max-kicks", type=int, default=10, help="random-walk kicks resp. BFS path length")
+    parser.add_argument("--max-visited", type=int, nargs="+", help="BFS visited bucket caps to compare, default max_kicks * bucket_size and num_buckets (uncapped)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    caps = args.max_visited or [args.max_kicks * 4, args.num_buckets]
+    for eviction in EVICTION_STRATEGIES:
+        for max_visited in caps if eviction == "bfs" else [None]:
+            result = benchmark_eviction(FILTERS[args.filter], args.num_buckets, args.fingerprint_size, args.max_kicks, eviction, args.seed, max_visited)
+            print(f"{eviction}:" if max_visited is None else f"{eviction} (max_visited {max_visited}):")
+            for name, value in result.items():
+                print(f"    {name}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,31 @@
-import json
+import argparse
+from store import open_results
 
-def read_measurements_from_file(file_path):
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
+COLUMNS = ["measurements.cf_fpr_e", "measurements.cf_fpr", "measurements.cbcf_fpr_e", "measurements.cbcf_fpr", "measurements.bloom_fpr_e", "measurements.bloom_fpr"]
 
-        for line in lines:
-            entry = json.loads(line)
-            measurements = entry['measurements']
+def read_measurements(source, fingerprint_sizes = None):
+    """
+    Prints the expected and actual FPR of every filter, one measurement per
+    line separated by spaces. Only these columns are read, one chunk at a
+    time, so source may be larger than memory.
 
-            # Extract the measurement values
-            cf_fpr_e = measurements['cf_fpr_e']
-            cf_fpr = measurements['cf_fpr']
-            cbcf_fpr_e = measurements['cbcf_fpr_e']
-            cbcf_fpr = measurements['cbcf_fpr']
-            bloom_fpr_e = measurements['bloom_fpr_e']
-            bloom_fpr = measurements['bloom_fpr']
+    Args:
+        source: result store directory or list of JSON-lines files
+        fingerprint_sizes: print only measurements of these, all if None
+    """
+    scan = open_results(source)
+    for chunk in scan(COLUMNS + ["parameters.fingerprint_size"]):
+        rows = zip(*(chunk[name].tolist() for name in COLUMNS), chunk["parameters.fingerprint_size"].tolist())
+        for *values, fingerprint_size in rows:
+            if fingerprint_sizes is None or fingerprint_size in fingerprint_sizes:
+                print(*values)
 
-            # Print the measurements separated by a space
-            print(cf_fpr_e, cf_fpr, cbcf_fpr_e, cbcf_fpr, bloom_fpr_e, bloom_fpr)
+def main():
+    parser = argparse.ArgumentParser(description="Prints the FPR columns of measurements.")
+    parser.add_argument("source", nargs="*", default=["measurements18.txt"], help="result store directory or measurements<f>.txt files")
+    parser.add_argument("--fingerprint-size", nargs="+", type=int, default=None)
+    args = parser.parse_args()
+    read_measurements(args.source[0] if len(args.source) == 1 else args.source, args.fingerprint_size)
 
-
-# Usage example
-file_path = 'measurements18.txt'  # Replace with the path to your file
-read_measurements_from_file(file_path)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
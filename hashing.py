@@ -0,0 +1,226 @@
+import itertools
+import mmh3
+import numpy as np
+
+def as_key(key):
+    """
+    Returns key as an object accepted by mmh3. str and bytes are returned
+    unchanged. An int, NumPy integer or NumPy bool is a fixed-width key: its
+    8-byte little-endian two's complement, as for NumPy integer arrays,
+    whatever the width of its dtype. Other bytes-like objects, e.g. memoryview, bytearray
+    or an element of a record array, are converted to bytes.
+    """
+    if isinstance(key, (str, bytes)):
+        return key
+    if isinstance(key, (int, np.integer, np.bool_)):
+        return int(key).to_bytes(8, "little", signed=key < 0)
+    return bytes(key)
+
+def as_keys(keys) -> list:
+    """
+    Returns keys as a sequence of objects accepted by mmh3, never building
+    strings. Integer arrays become 8-byte keys as in as_key(), void and
+    record arrays (e.g. packet 5-tuples) one bytes key of the raw record per
+    element, str and bytes arrays lists of str resp. bytes. Sequences of
+    str or bytes are returned unchanged, other sequences are converted key
+    by key with as_key().
+    """
+    if isinstance(keys, np.ndarray):
+        if keys.dtype.kind in "iub":
+            keys = keys.astype("<u8" if keys.dtype.kind == "u" else "<i8")
+        if keys.dtype.kind in "iuV":
+            return np.ascontiguousarray(keys).view(f"V{keys.dtype.itemsize}").tolist()
+        keys = keys.tolist()
+    if len(keys) == 0 or isinstance(keys[0], (str, bytes)):
+        return keys
+    return [as_key(key) for key in keys]
+
+def as_hashable(keys):
+    """
+    Returns keys for hash_many() and hash64_many(): NumPy arrays of
+    fixed-width keys unchanged, as as_blocks() views them without a copy,
+    any other keys as_keys(keys).
+    """
+    if isinstance(keys, np.ndarray) and keys.dtype.kind in "iubV":
+        return keys
+    return as_keys(keys)
+
+def as_blocks(keys):
+    """
+    Returns keys of one width as a (len(keys), width) uint8 array of their
+    bytes, which murmur3_32() and murmur3_x64_128() hash without a Python
+    loop: NumPy integer arrays as in as_keys(), void and record arrays, and
+    sequences of bytes of equal length. Such an array is returned as it is,
+    any other keys unchanged.
+    """
+    if isinstance(keys, np.ndarray):
+        if keys.ndim == 2 and keys.dtype == np.uint8:
+            return keys
+        if keys.dtype.kind in "iub":
+            keys = keys.astype("<u8" if keys.dtype.kind == "u" else "<i8")
+        if keys.dtype.kind in "iuV":
+            return np.ascontiguousarray(keys).view(np.uint8).reshape(len(keys), keys.dtype.itemsize)
+        return keys
+    if len(keys) == 0 or not isinstance(keys[0], bytes) or len(set(map(len, keys))) != 1:
+        return keys
+    try:
+        joined = b"".join(keys)
+    except TypeError:
+        return keys
+    return np.frombuffer(joined, dtype=np.uint8).reshape(len(keys), len(keys[0]))
+
+def _rotl32(x, r):
+    return (x << np.uint32(r)) | (x >> np.uint32(32 - r))
+
+def _rotl64(x, r):
+    return (x << np.uint64(r)) | (x >> np.uint64(64 - r))
+
+def fmix64(k):
+    """
+    Returns the murmur3 64-bit finalizer of a uint64 array, wrapping.
+    """
+    k ^= k >> np.uint64(33)
+    k *= np.uint64(0xFF51AFD7ED558CCD)
+    k ^= k >> np.uint64(33)
+    k *= np.uint64(0xC4CEB9FE1A85EC53)
+    k ^= k >> np.uint64(33)
+    return k
+
+def murmur3_32(blocks : np.ndarray, seed = 0) -> np.ndarray:
+    """
+    MurmurHash3_x86_32 of every row of a (n, width) uint8 array, see
+    as_blocks(), as a uint32 array. Equals mmh3.hash(row, seed, signed=False),
+    one pass over the rows per 4 bytes of width.
+    """
+    n, width = blocks.shape
+    c1, c2 = np.uint32(0xCC9E2D51), np.uint32(0x1B873593)
+    h = np.full(n, seed & 0xFFFFFFFF, dtype=np.uint32)
+    body = width // 4 * 4
+    words = np.ascontiguousarray(blocks[:, :body]).view("<u4").astype(np.uint32)
+    for j in range(body // 4):
+        k = _rotl32(words[:, j] * c1, 15) * c2
+        h = _rotl32(h ^ k, 13) * np.uint32(5) + np.uint32(0xE6546B64)
+    if width > body:
+        k = np.zeros(n, dtype=np.uint32)
+        for j in range(width - body):
+            k |= blocks[:, body + j].astype(np.uint32) << np.uint32(8 * j)
+        h ^= _rotl32(k * c1, 15) * c2
+    h ^= np.uint32(width & 0xFFFFFFFF)
+    h ^= h >> np.uint32(16)
+    h *= np.uint32(0x85EBCA6B)
+    h ^= h >> np.uint32(13)
+    h *= np.uint32(0xC2B2AE35)
+    h ^= h >> np.uint32(16)
+    return h
+
+def murmur3_x64_128(blocks : np.ndarray, seed = 0) -> np.ndarray:
+    """
+    MurmurHash3_x64_128 of every row of a (n, width) uint8 array, see
+    as_blocks(), as a (n, 2) uint64 array of the low and the high half.
+    Equals mmh3.hash64(row, seed, signed=False).
+    """
+    n, width = blocks.shape
+    c1, c2 = np.uint64(0x87C37B91114253D5), np.uint64(0x4CF5AD432745937F)
+    h1 = np.full(n, seed & 0xFFFFFFFF, dtype=np.uint64)
+    h2 = h1.copy()
+    body = width // 16 * 16
+    words = np.ascontiguousarray(blocks[:, :body]).view("<u8").astype(np.uint64)
+    for j in range(0, body // 8, 2):
+        h1 ^= _rotl64(words[:, j] * c1, 31) * c2
+        h1 = (_rotl64(h1, 27) + h2) * np.uint64(5) + np.uint64(0x52DCE729)
+        h2 ^= _rotl64(words[:, j + 1] * c2, 33) * c1
+        h2 = (_rotl64(h2, 31) + h1) * np.uint64(5) + np.uint64(0x38495AB5)
+    tail = width - body
+    if tail > 8:
+        k2 = np.zeros(n, dtype=np.uint64)
+        for j in range(8, tail):
+            k2 |= blocks[:, body + j].astype(np.uint64) << np.uint64(8 * (j - 8))
+        h2 ^= _rotl64(k2 * c2, 33) * c1
+    if tail > 0:
+        k1 = np.zeros(n, dtype=np.uint64)
+        for j in range(min(tail, 8)):
+            k1 |= blocks[:, body + j].astype(np.uint64) << np.uint64(8 * j)
+        h1 ^= _rotl64(k1 * c1, 31) * c2
+    h1 ^= np.uint64(width)
+    h2 ^= np.uint64(width)
+    h1 += h2
+    h2 += h1
+    h1 = fmix64(h1)
+    h2 = fmix64(h2)
+    h1 += h2
+    h2 += h1
+    return np.column_stack((h1, h2))
+
+def hash_many(keys, seed = 0) -> np.ndarray:
+    """
+    Returns mmh3.hash(key, seed) of every key as an int64 array. Keys of
+    one width are hashed by murmur3_32(), others one by one.
+    """
+    blocks = as_blocks(keys)
+    if isinstance(blocks, np.ndarray) and blocks.ndim == 2:
+        return murmur3_32(blocks, seed).view(np.int32).astype(np.int64)
+    return np.fromiter((mmh3.hash(key, seed) for key in keys), dtype=np.int64, count=len(keys))
+
+def hash_fingerprints(fingerprints : np.ndarray, seed = 2) -> np.ndarray:
+    """
+    Returns mmh3.hash(str(fingerprint), seed) of every fingerprint as an
+    int64 array. Every distinct fingerprint is hashed only once, the decimal
+    digits of all fingerprints of one length at once.
+    """
+    unique, inverse = np.unique(fingerprints, return_inverse=True)
+    unique = unique.astype(np.int64)
+    digits = np.searchsorted(10 ** np.arange(1, 19, dtype=np.int64), unique, side="right") + 1
+    hashes = np.zeros(len(unique), dtype=np.int64)
+    for length in np.unique(digits).tolist():
+        selected = digits == length
+        powers = 10 ** np.arange(length - 1, -1, -1, dtype=np.int64)
+        blocks = (unique[selected, None] // powers % 10 + ord("0")).astype(np.uint8)
+        hashes[selected] = murmur3_32(blocks, seed).view(np.int32)
+    return hashes[inverse]
+
+HASH_MODES = ("classic", "single")
+
+def hash64_many(keys) -> np.ndarray:
+    """
+    Returns mmh3.hash64(key, signed=False) of every key as a (len(keys), 2)
+    uint64 array. Row k holds the low and the high half of mmh3.hash128(keys[k]).
+    Keys of one width are hashed by murmur3_x64_128(), others one by one.
+    """
+    blocks = as_blocks(keys)
+    if isinstance(blocks, np.ndarray) and blocks.ndim == 2:
+        return murmur3_x64_128(blocks)
+    halves = itertools.chain.from_iterable(mmh3.hash64(key, signed=False) for key in keys)
+    return np.fromiter(halves, dtype=np.uint64, count=2 * len(keys)).reshape(len(keys), 2)
+
+ALT_OFFSET_TABLE_BITS = 20 #widest fingerprints with an offset table, 4 MiB
+
+def alt_offsets(fingerprint_len : int):
+    """
+    Returns the alternate-bucket offset of every fingerprint in [0, 2**fingerprint_len)
+    as a uint32 lookup table, or None if fingerprint_len > ALT_OFFSET_TABLE_BITS:
+    the table would take 4 * 2**fingerprint_len bytes, so alt_offset() and
+    alt_offset_many() compute such offsets on the fly instead.
+    """
+    if fingerprint_len > ALT_OFFSET_TABLE_BITS:
+        return None
+    return alt_offset_many(np.arange(2**fingerprint_len, dtype=np.uint64))
+
+def alt_offset_many(fingerprints : np.ndarray) -> np.ndarray:
+    """
+    Returns the alternate-bucket offsets of fingerprints as a uint32 array.
+    Offsets come from the splitmix64 finalizer, so they need no string hashing.
+    """
+    z = fingerprints.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return (z >> np.uint64(32)).astype(np.uint32)
+
+def alt_offset(fingerprint : int) -> int:
+    """
+    Returns the alternate-bucket offset of one fingerprint, see alt_offset_many().
+    """
+    z = (fingerprint + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return (z ^ (z >> 31)) >> 32
@@ -1,54 +1,193 @@
 from bloom import BloomFilter
 from cuckoo import CuckooFilter, CBCuckooFilter
+from stats import FilterStats
+from store import ResultStore
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import argparse
 import json
-import threading
-
-
-def measureFPR(num_buckets, fingerprint_size, target_occupancy):
-    cf = CuckooFilter(num_buckets=num_buckets, bucket_size=4, fingerprint_len=fingerprint_size)
-    cbcf = CBCuckooFilter(num_buckets=num_buckets, bucket_size=4, fingerprint_len=fingerprint_size)
-    bloom = BloomFilter(size=num_buckets*4*fingerprint_size, num_hash_functions=round(0.69*num_buckets*4*fingerprint_size/(num_buckets*4*0.95)))
-    print("Num hash functions for bloom:", round(0.69*num_buckets*4*fingerprint_size/(num_buckets*4*0.95)))
-    for i in range(int(target_occupancy * num_buckets * 4)):
-        cf.insert(str(i))
-        cbcf.insert(str(i))
-        bloom.insert(str(i))
-    print(f"Cuckoo Filter: \n    Occupancy: {cf.compute_filter_occupancy()}\n    Expected FPR: {cf.compute_false_positive_rate()}")
-    print(f"Configurable-Bucket Cuckoo Filter: \n    Occupancy: {cbcf.compute_filter_occupancy()}\n    Expected FPR: {cbcf.compute_false_positive_rate()}")
-    count = 0
-    for i in range(int(target_occupancy * num_buckets * 4)):
-        if bloom[i]:
-            count += 1
-    print(f"Bloom Filter 'occupancy': {count/(target_occupancy * num_buckets * 4)}\n")
-    cbcf.scrub()
-    cbcf.scrub()
-    cbcf.scrub()
-    cbcf._test_verify_state()
-    print(f"After Scrubbing: Expected FPR: {cbcf.compute_false_positive_rate()}")
-    print(f"Bloom Filter: \n    Expected FPR: {bloom.compute_false_positive_rate()}")
-    cf_fpr = 0
-    cbcf_fpr = 0
-    bloom_fpr = 0
-    runs = 100
-    lookups = 1000000
-    for j in range(runs):
-        cf_fp = 0
-        cbcf_fp = 0
-        bloom_fp = 0
-        for i in range(int(target_occupancy * num_buckets * 4)+j * lookups, int(target_occupancy * num_buckets * 4) + j * lookups + lookups):
-            if cf.lookup(str(i)):
-                cf_fp += 1
-            if cbcf.lookup(str(i)):
-                cbcf_fp += 1
-            if bloom.lookup(str(i)):
-                bloom_fp += 1
-        cf_fpr += cf_fp / lookups
-        cbcf_fpr += cbcf_fp / lookups
-        bloom_fpr += bloom_fp / lookups
-    cf_fpr /= runs
-    cbcf_fpr /= runs
-    bloom_fpr /= runs
+import os
+import random
+
+BLOCK = 1000000 #negative lookups per lookup_many call
+Z = 1.96 #normal quantile of the 95% confidence intervals
+
+_filters = {} #(filters, describe_filters()) built by this process, keyed by sweep point, bloom_args and bulk
+_sweeps = {} #unscrubbed filters filled by fill_filters(), keyed by (num_buckets, fingerprint_size, bloom_args)
+
+def new_filters(num_buckets, fingerprint_size, stats = False, bloom_args = None):
+    #built on list storage, which inserts and scrubs faster, see build_filters()
+    cf = CuckooFilter(num_buckets=num_buckets, bucket_size=4, fingerprint_len=fingerprint_size, storage="list", stats=FilterStats() if stats else None)
+    cbcf = CBCuckooFilter(num_buckets=num_buckets, bucket_size=4, fingerprint_len=fingerprint_size, storage="list", stats=FilterStats() if stats else None)
+    bloom = BloomFilter(size=num_buckets*4*fingerprint_size, num_hash_functions=round(0.69*num_buckets*4*fingerprint_size/(num_buckets*4*0.95)), **(bloom_args or {}))
+    return cf, cbcf, bloom
+
+def insert_keys(filters, start, stop):
+    keys = [str(i) for i in range(start, stop)]
+    for f in filters:
+        f.insert_many(keys)
+
+def fill_filters(num_buckets, fingerprint_size, target_occupancy, checkpoints, stats = False, bloom_args = None):
+    """
+    Returns copies of one set of filters of this process, filled up to
+    target_occupancy. Only the keys missing since the last call are inserted,
+    checkpoint by checkpoint, and random is seeded from each checkpoint, so
+    the result does not depend on which points this process measured before.
+    """
+    sweep = (num_buckets, fingerprint_size, repr(bloom_args))
+    if sweep not in _sweeps or _sweeps[sweep][0] > target_occupancy:
+        _sweeps[sweep] = (0, new_filters(num_buckets, fingerprint_size, stats, bloom_args))
+    filled, filters = _sweeps[sweep]
+    for checkpoint in checkpoints:
+        if filled < checkpoint <= target_occupancy:
+            random.seed(repr((num_buckets, fingerprint_size, checkpoint)))
+            insert_keys(filters, int(filled * num_buckets * 4), int(checkpoint * num_buckets * 4))
+            filled = checkpoint
+    _sweeps[sweep] = (filled, filters)
+    return tuple(f.copy() for f in filters)
+
+def build_filters(num_buckets, fingerprint_size, target_occupancy, checkpoints = None, stats = False, bloom_args = None, bulk = False):
+    """
+    Returns (cf, cbcf, bloom) filled to target_occupancy, cbcf scrubbed three times.
+    cf and cbcf are built on list storage and moved to array storage for the
+    lookups: a scrub pass at 0.95 takes 2.6 s on list against 5.5 s on array.
+    With checkpoints, the filters are filled incrementally by fill_filters(),
+    otherwise they are built from scratch. If stats, cf and cbcf of a newly
+    built point record a FilterStats, which does not change their contents.
+    bloom_args are further BloomFilter arguments, e.g. hash_mode and block_bits.
+    If bulk, cf and cbcf are built by from_keys() instead, which places the
+    keys offline and leaves cbcf nothing to scrub.
+
+    random is seeded from the sweep point, so every process builds identical
+    filters for the same point and shards of one point can be merged.
+    """
+    point = (num_buckets, fingerprint_size, target_occupancy)
+    key = _filters_key(num_buckets, fingerprint_size, target_occupancy, bloom_args, bulk)
+    if key not in _filters:
+        _filters.clear()
+        if bulk:
+            cf, cbcf, bloom = new_filters(num_buckets, fingerprint_size, stats, bloom_args)
+            keys = [str(i) for i in range(int(target_occupancy * num_buckets * 4))]
+            cf = CuckooFilter.from_keys(keys, num_buckets=num_buckets, bucket_size=4, fingerprint_len=fingerprint_size, storage="list", stats=cf.stats)
+            cbcf = CBCuckooFilter.from_keys(keys, num_buckets=num_buckets, bucket_size=4, fingerprint_len=fingerprint_size, storage="list", stats=cbcf.stats)
+            bloom.insert_many(keys)
+        elif checkpoints is None:
+            random.seed(repr(point))
+            cf, cbcf, bloom = new_filters(num_buckets, fingerprint_size, stats, bloom_args)
+            insert_keys((cf, cbcf, bloom), 0, int(target_occupancy * num_buckets * 4))
+        else:
+            cf, cbcf, bloom = fill_filters(num_buckets, fingerprint_size, target_occupancy, checkpoints, stats, bloom_args)
+        cbcf.scrub()
+        cbcf.scrub()
+        cbcf.scrub()
+        cbcf._test_verify_state()
+        cf.to_storage("array") #lookup_many() is vectorized on array storage only
+        cbcf.to_storage("array")
+        _filters[key] = ((cf, cbcf, bloom), describe_filters(cf, cbcf, bloom, int(target_occupancy * num_buckets * 4)))
+    return _filters[key][0]
+
+def _filters_key(num_buckets, fingerprint_size, target_occupancy, bloom_args, bulk):
+    return (num_buckets, fingerprint_size, target_occupancy), repr(bloom_args), bulk
+
+def describe_filters(cf, cbcf, bloom, num_items) -> dict:
+    """
+    Returns what measureFPR() reports of freshly built filters besides the
+    measured rates: expected rates, occupancies, the fraction of the first
+    num_items Bloom filter bits that are set and the build statistics of cf
+    and cbcf if they have any, see FilterStats.to_dict().
+    """
+    return {
+        "num_hash_functions": bloom.num_hash_functions,
+        "cf_occupancy": cf.compute_filter_occupancy(),
+        "cbcf_occupancy": cbcf.compute_filter_occupancy(),
+        "bloom_fill": bloom.bitarray.count(1, 0, num_items) / num_items,
+        "cf_fpr_e": cf.compute_false_positive_rate(),
+        "cbcf_fpr_e": cbcf.compute_false_positive_rate(),
+        "bloom_fpr_e": bloom.compute_false_positive_rate(),
+        "stats": {name: f.stats.to_dict(f) for name, f in (("cf", cf), ("cbcf", cbcf)) if f.stats is not None}
+    }
+
+def count_false_positives(num_buckets, fingerprint_size, target_occupancy, start, stop, checkpoints = None, active = (0, 1, 2), bloom_args = None, bulk = False, stats = False, describe = False) -> tuple:
+    """
+    Looks up the keys str(start) .. str(stop - 1), none of which was inserted,
+    in the filters listed in active (0: cf, 1: cbcf, 2: bloom).
+
+    Returns the number of positives of cf, cbcf and bloom as an int64 array,
+    and describe_filters() of the filters as built if describe, else None.
+    """
+    filters = build_filters(num_buckets, fingerprint_size, target_occupancy, checkpoints, stats, bloom_args, bulk)
+    description = _filters[_filters_key(num_buckets, fingerprint_size, target_occupancy, bloom_args, bulk)][1] if describe else None
+    counts = np.zeros(len(filters), dtype=np.int64)
+    for block_start in range(start, stop, BLOCK):
+        keys = [str(i) for i in range(block_start, min(block_start + BLOCK, stop))]
+        for k in active:
+            counts[k] += np.count_nonzero(filters[k].lookup_many(keys))
+    return counts, description
+
+def wilson_interval(positives, lookups, z = Z):
+    """
+    Returns the Wilson score interval (low, high) of a binomial proportion.
+    """
+    p = positives / lookups
+    center = (p + z**2 / (2 * lookups)) / (1 + z**2 / lookups)
+    half_width = z / (1 + z**2 / lookups) * (p * (1 - p) / lookups + z**2 / (4 * lookups**2))**0.5
+    return max(center - half_width, 0.0), min(center + half_width, 1.0)
+
+def is_precise(positives, lookups, precision) -> bool:
+    """
+    Returns True if the half width of the Wilson interval is at most
+    precision times the estimated rate. Never True without a positive.
+    """
+    if positives == 0:
+        return False
+    low, high = wilson_interval(positives, lookups)
+    return (high - low) / 2 <= precision * positives / lookups
+
+def measureFPR(num_buckets, fingerprint_size, target_occupancy, lookups = 100000000, executor = None, shards = 1, checkpoints = None, precision = None, stats = False, bloom_args = None, bulk = False):
+    """
+    Measures expected and actual FPR of all three filters at one sweep point.
+    The lookup range is split into shards that run on executor if given,
+    their false positive counts are summed. checkpoints: see build_filters().
+    The filters are only built where the shards run, the first shard also
+    describes them, see describe_filters().
+
+    lookups is the budget of negative lookups per filter. If precision is
+    given, lookups are streamed in rounds of BLOCK per shard and a filter
+    stops once the relative half width of its Wilson interval is at most
+    precision, see is_precise(). Otherwise the whole budget is used.
+
+    If stats, the entity gets the build statistics of cf and cbcf, see
+    FilterStats.to_dict(), taken before any lookup. bloom_args, bulk: see build_filters().
+    """
+    first = int(target_occupancy * num_buckets * 4)
+    description = None
+    positives = np.zeros(3, dtype=np.int64)
+    used = np.zeros(3, dtype=np.int64)
+    active = (0, 1, 2)
+    while active and used[active[0]] < lookups:
+        round_lookups = lookups - int(used[active[0]])
+        if precision is not None:
+            round_lookups = min(round_lookups, BLOCK * shards)
+        round_start = first + int(used[active[0]])
+        bounds = [round_start + round_lookups * k // shards for k in range(shards + 1)]
+        if executor is None:
+            results = [count_false_positives(num_buckets, fingerprint_size, target_occupancy, bounds[0], bounds[-1], checkpoints, active, bloom_args, bulk, stats, description is None)]
+        else:
+            futures = [executor.submit(count_false_positives, num_buckets, fingerprint_size, target_occupancy, bounds[k], bounds[k + 1], checkpoints, active, bloom_args, bulk, stats, description is None and k == 0) for k in range(shards)]
+            results = [future.result() for future in futures]
+        if description is None:
+            description = results[0][1]
+            print("Num hash functions for bloom:", description["num_hash_functions"])
+            print(f"Cuckoo Filter: \n    Occupancy: {description['cf_occupancy']}\n    Expected FPR: {description['cf_fpr_e']}")
+            print(f"Configurable-Bucket Cuckoo Filter: \n    Occupancy: {description['cbcf_occupancy']}\n    Expected FPR after scrubbing: {description['cbcf_fpr_e']}")
+            print(f"Bloom Filter 'occupancy': {description['bloom_fill']}\n")
+            print(f"Bloom Filter: \n    Expected FPR: {description['bloom_fpr_e']}")
+        positives += np.sum([counts for counts, _ in results], axis=0)
+        used[list(active)] += round_lookups
+        if precision is not None:
+            active = tuple(k for k in active if not is_precise(int(positives[k]), int(used[k]), precision))
+    cf_fpr, cbcf_fpr, bloom_fpr = (positives / used).tolist()
+    cf_ci, cbcf_ci, bloom_ci = (list(wilson_interval(int(k), int(n))) for k, n in zip(positives, used))
     print(f"Cuckoo Filter:\n    Actual FPR: {cf_fpr}")
     print(f"Configurable-Bucket Cuckoo Filter:\n    Actual FPR: {cbcf_fpr}")
     print(f"Bloom Filter:\n    Actual FPR: {bloom_fpr}")
@@ -59,36 +198,68 @@ def measureFPR(num_buckets, fingerprint_size, target_occupancy):
             "target_occupancy": target_occupancy
         },
         "measurements": {
-            "cf_fpr_e": cf.compute_false_positive_rate(),
+            "cf_fpr_e": description["cf_fpr_e"],
             "cf_fpr": cf_fpr,
-            "cbcf_fpr_e": cbcf.compute_false_positive_rate(),
+            "cbcf_fpr_e": description["cbcf_fpr_e"],
             "cbcf_fpr": cbcf_fpr,
-            "bloom_fpr_e": bloom.compute_false_positive_rate(),
-            "bloom_fpr": bloom_fpr
+            "bloom_fpr_e": description["bloom_fpr_e"],
+            "bloom_fpr": bloom_fpr,
+            "cf_fpr_ci": cf_ci,
+            "cbcf_fpr_ci": cbcf_ci,
+            "bloom_fpr_ci": bloom_ci,
+            "cf_lookups": int(used[0]),
+            "cbcf_lookups": int(used[1]),
+            "bloom_lookups": int(used[2])
         }
     }
+    if description["stats"]:
+        entity["stats"] = description["stats"]
     return entity
 
 start = 0.3
 end = 1.0
 step = 0.05
 
-def worker(start, end, step, fingerlength):
-    for value in [start + i * step for i in range(int((end - start) / step) + 1)]:
-        measurement = measureFPR(8192, fingerlength, value)
-        filename = "measurements"+str(fingerlength) + ".txt"
-        with open(filename, "a") as file:
-            json.dump(measurement, file)
-            file.write('\n')
-
-
-thread1 = threading.Thread(target=worker, args=(start, end, step, 18))
-thread2 = threading.Thread(target=worker, args=(start, end, step, 15))
-thread3 = threading.Thread(target=worker, args=(start, end, step, 12))
-
-thread1.start()
-thread2.start()
-thread3.start()
-thread1.join()
-thread2.join()
-thread3.join()
+def run_sweep(fingerlengths, workers, lookups, incremental = False, precision = None, stats = False, bloom_args = None, bulk = False, store = None):
+    """
+    Measures every occupancy from start to end for every fingerprint length
+    and appends one JSON line per point to measurements<fingerlength>.txt,
+    or one segment per point to the ResultStore in directory store if given.
+    Lookups of each point are sharded across a pool of worker processes.
+    If incremental, every process fills one set of filters per fingerprint
+    length step by step instead of rebuilding them for every occupancy.
+    precision, stats, bloom_args, bulk: see measureFPR().
+    """
+    occupancies = [start + i * step for i in range(int((end - start) / step) + 1)]
+    checkpoints = tuple(occupancies) if incremental else None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for fingerlength in fingerlengths:
+            for value in occupancies:
+                measurement = measureFPR(8192, fingerlength, value, lookups, executor, workers, checkpoints, precision, stats, bloom_args, bulk)
+                if store is not None:
+                    ResultStore(store).append([measurement])
+                    continue
+                filename = "measurements"+str(fingerlength) + ".txt"
+                with open(filename, "a") as file:
+                    json.dump(measurement, file)
+                    file.write('\n')
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures false positive rates of Cuckoo, CB Cuckoo and Bloom filters.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--lookups", type=int, default=100000000, help="budget of negative lookups per filter and sweep point")
+    parser.add_argument("--precision", type=float, default=None, help="stop a filter once its 95%% interval half width is at most this fraction of its FPR")
+    parser.add_argument("--incremental", action="store_true", help="fill one set of filters step by step instead of rebuilding them per occupancy")
+    parser.add_argument("--stats", action="store_true", help="add kick histograms, conversions, timers and bytes per item of cf and cbcf to every measurement")
+    parser.add_argument("--bloom-hash-mode", choices=("classic", "single"), default="classic", help="hashing of the Bloom baseline, see BloomFilter")
+    parser.add_argument("--bloom-block-bits", type=int, default=None, help="block the Bloom baseline into blocks of this many bits, e.g. 512")
+    parser.add_argument("--bulk", action="store_true", help="build cf and cbcf offline with from_keys() instead of inserting key by key")
+    parser.add_argument("--store", default=None, help="append measurements to the columnar result store in this directory instead of measurements<f>.txt")
+    args = parser.parse_args()
+    if args.bulk and args.incremental:
+        parser.error("--bulk and --incremental are mutually exclusive")
+    bloom_args = {"hash_mode": args.bloom_hash_mode, "block_bits": args.bloom_block_bits}
+    run_sweep([18, 15, 12], args.workers, args.lookups, args.incremental, args.precision, args.stats, bloom_args, args.bulk, args.store)
+
+if __name__ == "__main__":
+    main()
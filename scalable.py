@@ -0,0 +1,167 @@
+import copy
+import math
+import numpy as np
+from cuckoo import CuckooFilter
+from hashing import as_hashable
+
+class ScalableCuckooFilter:
+    def __init__(self, num_buckets : int, bucket_size : int, fingerprint_len : int, filter_class = CuckooFilter, max_occupancy = 0.9, growth = 2, tighten = 1, **filter_args):
+        """
+        Initializes a growable filter made of a chain of generations. Inserts go
+        to the newest generation. A new generation with growth times the buckets
+        and tighten more fingerprint bits is added once the newest one reaches
+        max_occupancy or an insert into it fails. No key is ever re-inserted.
+
+        With growth 2 the number of generations grows logarithmically with the
+        number of elements. Tightening keeps the false positive rate of all
+        generations together below 1/(1 - 2**-tighten) times that of the first
+        one at the same occupancy.
+
+        Args:
+            num_buckets: int > 0 : buckets of the first generation
+            bucket_size: int > 0
+            fingerprint_len: int > 0 : fingerprint length of the first generation
+            filter_class: CuckooFilter or a subclass, e.g. CBCuckooFilter
+            max_occupancy: 0 < float <= 1 : occupancy that triggers growth
+            growth: int > 0 : bucket multiplier of each new generation, a power
+                of two if the generations need one, see CuckooFilter
+            tighten: int >= 0 : fingerprint bits added by each new generation
+            filter_args: further arguments of filter_class, e.g. storage
+
+        Raises ValueError if constraints not met.
+        """
+        if not 0 < max_occupancy <= 1 or growth < 1 or tighten < 0:
+            raise ValueError()
+        self.bucket_size = bucket_size
+        self.filter_class = filter_class
+        self.max_occupancy = max_occupancy
+        self.growth = growth
+        self.tighten = tighten
+        self.filter_args = filter_args
+        self.generations = [filter_class(num_buckets, bucket_size, fingerprint_len, **filter_args)]
+        first = self.generations[0]
+        if growth & (growth - 1) and first.hash_mode == "classic" and first._needs_involution():
+            raise ValueError() #a later generation would have no power of two buckets
+
+    @property
+    def num_items(self) -> int:
+        return sum(f.num_items for f in self.generations)
+
+    def insert(self, __item : str) -> bool:
+        """
+        Inserts byte-like object into the newest generation, growing the
+        filter first if needed.
+
+        Returns True if insert successful, otherwise False.
+        """
+        if self._is_full(self.generations[-1]):
+            self._grow()
+        if self.generations[-1].insert(__item):
+            return True
+        self._grow()
+        return self.generations[-1].insert(__item)
+
+    def insert_many(self, keys) -> np.ndarray:
+        """
+        Inserts a sequence or NumPy array of keys. Keys go to the newest
+        generation in batches that fit below max_occupancy, keys that fail
+        are retried once in a new generation.
+
+        Returns a boolean array, True where the insert was successful.
+        """
+        keys = as_hashable(keys)
+        results = np.zeros(len(keys), dtype=np.bool_)
+        pending = np.arange(len(keys))
+        retried = np.zeros(len(keys), dtype=np.bool_)
+        while len(pending) > 0:
+            if self._is_full(self.generations[-1]):
+                self._grow()
+            newest = self.generations[-1]
+            room = math.ceil(self.max_occupancy * newest.num_buckets * newest.bucket_size) - newest.num_items
+            batch = pending[:max(room, 1)]
+            ok = newest.insert_many(keys[batch] if isinstance(keys, np.ndarray) else [keys[k] for k in batch.tolist()])
+            results[batch[ok]] = True
+            failed = batch[~ok]
+            if len(failed) > 0:
+                self._grow()
+                failed = failed[~retried[failed]]
+                retried[failed] = True
+            pending = np.concatenate((failed, pending[len(batch):]))
+        return results
+
+    def lookup(self, __item : str) -> bool:
+        """
+        Always returns True if element was inserted.
+
+        Most likely returns False if element was not inserted.
+
+        May return True even if element was not inserted.
+        """
+        return any(f.lookup(__item) for f in reversed(self.generations))
+
+    def lookup_many(self, keys) -> np.ndarray:
+        """
+        Looks up a sequence or NumPy array of keys at once.
+
+        Returns a boolean array with the result of lookup() for every key.
+        """
+        keys = as_hashable(keys)
+        found = np.zeros(len(keys), dtype=np.bool_)
+        for f in self.generations:
+            found |= f.lookup_many(keys)
+        return found
+
+    def delete(self, __item : str):
+        """
+        Delete element from the newest generation that holds it. Unless the
+        generations store keys (CBCuckooFilter), a colliding fingerprint of an
+        element in a newer generation may be deleted instead, as when deleting
+        a key that was never inserted.
+
+        Raises ValueError if element is not found.
+        """
+        for f in reversed(self.generations):
+            try:
+                f.delete(__item)
+                return
+            except ValueError:
+                pass
+        raise ValueError()
+
+    def scrub(self):
+        """
+        Scrubs every generation that supports it, see CBCuckooFilter.scrub().
+        """
+        for f in self.generations:
+            if hasattr(f, "scrub"):
+                f.scrub()
+
+    def compute_false_positive_rate(self) -> float:
+        """
+        Returns the sum of the false positive rates of all generations,
+        an upper bound of the false positive rate of the filter.
+        """
+        return sum(f.compute_false_positive_rate() for f in self.generations)
+
+    def compute_filter_occupancy(self) -> float:
+        """
+        Returns the filter occupancy over all generations:
+
+        elements_stored / total_slots
+        """
+        return self.num_items / sum(f.num_buckets * f.bucket_size for f in self.generations)
+
+    def copy(self):
+        """
+        Returns an independent copy of the filter.
+        """
+        filter = copy.copy(self)
+        filter.generations = [f.copy() for f in self.generations]
+        return filter
+
+    def _is_full(self, f) -> bool:
+        return f.compute_filter_occupancy() >= self.max_occupancy
+
+    def _grow(self):
+        newest = self.generations[-1]
+        self.generations.append(self.filter_class(newest.num_buckets * self.growth, self.bucket_size, newest.fingerprint_len + self.tighten, **self.filter_args))
@@ -0,0 +1,265 @@
+from multiprocessing import shared_memory
+import os
+import time
+import numpy as np
+from bitarray import bitarray
+from buckets import ArrayBuckets, uint_dtype
+from cuckoo import CuckooFilter, CBCuckooFilter
+from hashing import alt_offsets
+from snapshot import scalar_attributes
+
+#gives the writer our time slice while it is inside a stripe
+_yield = getattr(os, "sched_yield", lambda: time.sleep(0))
+
+ALIGN = 64
+
+class SharedBuckets(ArrayBuckets):
+    def __init__(self, num_buckets : int, bucket_size : int, dtype, stripe_buckets = 64, sbits = False, name = None):
+        """
+        ArrayBuckets whose slots and counts live in one block of
+        multiprocessing.shared_memory, together with one version counter per
+        stripe of stripe_buckets buckets and optionally room for sbits.
+
+        The writer makes the version of every stripe it touches odd before the
+        first change (_touch) and even again in commit() once the whole
+        operation is done, so a reader that saw the same even version before
+        and after a probe saw no change at all (a seqlock per stripe).
+
+        Args:
+            num_buckets: int > 0
+            bucket_size: int > 0
+            dtype: NumPy dtype of a slot, see uint_dtype()
+            stripe_buckets: int > 0 : buckets per version counter
+            sbits: bool : reserve num_buckets bits for sbits, see sbits_buffer
+            name: str : attach read-only to the block of an existing instance
+                instead of creating one
+        """
+        dtype = np.dtype(dtype)
+        count_dtype = uint_dtype(bucket_size.bit_length())
+        num_stripes = -(-num_buckets // stripe_buckets)
+        sizes = [num_stripes * 8, num_buckets * count_dtype.itemsize, num_buckets * bucket_size * dtype.itemsize, (num_buckets + 7) // 8 if sbits else 0]
+        offsets = []
+        total = 0
+        for size in sizes:
+            offsets.append(total)
+            total += -(-size // ALIGN) * ALIGN
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+            buffer = self.shm.buf
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            buffer = self.shm.buf.toreadonly()
+        self.name = self.shm.name
+        self.stripe_buckets = stripe_buckets
+        self.versions = np.frombuffer(buffer, dtype=np.int64, count=num_stripes, offset=offsets[0])
+        counts = np.frombuffer(buffer, dtype=count_dtype, count=num_buckets, offset=offsets[1])
+        slots = np.frombuffer(buffer, dtype=dtype, count=num_buckets * bucket_size, offset=offsets[2]).reshape(num_buckets, bucket_size)
+        super().__init__(num_buckets, bucket_size, dtype, slots, counts)
+        self.sbits_buffer = buffer[offsets[3]:offsets[3] + sizes[3]] if sbits else None
+        self.open_stripes = set()
+
+    def set(self, i, j, value):
+        self._touch(i)
+        super().set(i, j, value)
+
+    def append(self, i, value):
+        self._touch(i)
+        super().append(i, value)
+
+    def pop(self, i, j = -1):
+        self._touch(i)
+        return super().pop(i, j)
+
+    def copy(self):
+        raise TypeError("shared buckets cannot be copied, attach() to them instead")
+
+    def _touch(self, i):
+        stripe = i // self.stripe_buckets
+        if stripe not in self.open_stripes:
+            self.versions[stripe] += 1
+            self.open_stripes.add(stripe)
+
+    def commit(self):
+        """
+        Ends the current write operation: every stripe touched since the
+        last commit() gets an even version again.
+        """
+        for stripe in self.open_stripes:
+            self.versions[stripe] += 1
+        self.open_stripes.clear()
+
+    def close(self):
+        """
+        Releases this process's views of the block. The filter has to drop
+        its sbits first.
+        """
+        self.slots = self.counts = self.versions = self.sbits_buffer = None
+        self.shm.close()
+
+class SharedFilter:
+    """
+    Shared-memory mode of a filter: one writer process owns the filter and
+    may insert, delete and scrub, any number of reader processes attach()
+    to its handle() and look up. Readers validate every probe against the
+    stripe versions of both candidate buckets and retry a probe that raced
+    with a write, so they never see an element halfway through a move or a
+    bucket halfway through a long/short switch. Readers cannot see a stash,
+    so shared filters have none and a failed insert is undone instead.
+    """
+
+    def handle(self) -> dict:
+        """
+        Returns what attach() needs in another process, picklable.
+        """
+        return {"class": type(self).__name__, "attributes": scalar_attributes(self), "name": self.buckets.name, "dtype": self.buckets.slots.dtype.str}
+
+    @classmethod
+    def attach(cls, handle : dict):
+        """
+        Returns a read-only view of the writer's filter, supporting lookup()
+        and lookup_many() only.
+
+        Raises ValueError if handle belongs to another class.
+        """
+        if handle["class"] != cls.__name__:
+            raise ValueError()
+        filter = cls.__new__(cls)
+        vars(filter).update(handle["attributes"])
+        filter.stats = None
+        filter.stash = []
+        if filter.hash_mode == "single":
+            filter.alt_offsets = alt_offsets(filter.fingerprint_len)
+        filter.buckets = SharedBuckets(filter.num_buckets, filter.bucket_size, handle["dtype"], filter.stripe_buckets, issubclass(cls, CBCuckooFilter), handle["name"])
+        if issubclass(cls, CBCuckooFilter):
+            filter.sbits = bitarray(buffer=filter.buckets.sbits_buffer)
+            filter.actual_elements = None
+        return filter
+
+    def close(self):
+        """
+        Detaches this process from the shared block.
+        """
+        self.sbits = None
+        self.buckets.close()
+
+    def unlink(self):
+        """
+        Frees the shared block once all processes closed it, writer only.
+        """
+        self.buckets.shm.unlink()
+
+    def copy(self):
+        raise TypeError("shared filters cannot be copied, attach() to them instead")
+
+    def _fill(self, keys):
+        try:
+            super()._fill(keys)
+        finally:
+            self.buckets.commit()
+
+    def _lookup_hashed(self, *hashed) -> bool:
+        versions = self.buckets.versions
+        stripe1, stripe2 = hashed[-2] // self.stripe_buckets, hashed[-1] // self.stripe_buckets
+        while True:
+            version1, version2 = int(versions[stripe1]), int(versions[stripe2])
+            if (version1 | version2) & 1:
+                _yield() #writer inside
+                continue
+            found = super()._lookup_hashed(*hashed)
+            if versions[stripe1] == version1 and versions[stripe2] == version2:
+                return found
+
+    def _lookup_hashed_many(self, *hashed) -> np.ndarray:
+        versions = self.buckets.versions
+        stripes1, stripes2 = hashed[-2] // self.stripe_buckets, hashed[-1] // self.stripe_buckets
+        found = np.zeros(len(stripes1), dtype=np.bool_)
+        pending = np.arange(len(stripes1))
+        while len(pending) > 0:
+            version1, version2 = versions[stripes1[pending]], versions[stripes2[pending]]
+            probed = super()._lookup_hashed_many(*(h[pending] for h in hashed))
+            valid = (((version1 | version2) & 1) == 0) & (versions[stripes1[pending]] == version1) & (versions[stripes2[pending]] == version2)
+            found[pending[valid]] = probed[valid]
+            pending = pending[~valid]
+            if len(pending) > 0:
+                _yield()
+        return found
+
+    def _insert(self, *args) -> bool:
+        try:
+            return super()._insert(*args)
+        finally:
+            self.buckets.commit()
+
+    def delete(self, __item : str):
+        try:
+            super().delete(__item)
+        finally:
+            self.buckets.commit()
+
+    def _new_buckets(self, bits, dtype = None):
+        if dtype is not None:
+            #keys of a CB filter stay private to the writer
+            return ArrayBuckets(self.num_buckets, self.bucket_size, dtype)
+        return SharedBuckets(self.num_buckets, self.bucket_size, uint_dtype(bits), self.stripe_buckets, isinstance(self, CBCuckooFilter))
+
+class SharedCuckooFilter(SharedFilter, CuckooFilter):
+    def __init__(self, num_buckets : int, bucket_size : int, fingerprint_len : int, max_kicks = 10, hash_mode = "classic", eviction = "random", stripe_buckets = 64):
+        """
+        Initializes a Cuckoo Filter in shared memory, see SharedFilter.
+
+        Args:
+            num_buckets: int > 0
+            bucket_size: int > 0
+            fingerprint_len: int > 0
+            max_kicks: int > 0 : max number of retry iterations when inserting
+            hash_mode: "classic" | "single" : see CuckooFilter
+            eviction: "random" | "bfs" : see CuckooFilter
+            stripe_buckets: int > 0 : buckets per version counter
+
+        Raises ValueError if constraints not met.
+        """
+        if stripe_buckets < 1:
+            raise ValueError()
+        self.stripe_buckets = stripe_buckets
+        super().__init__(num_buckets, bucket_size, fingerprint_len, max_kicks, "array", hash_mode, eviction, 0)
+        self.storage = "shared"
+
+class SharedCBCuckooFilter(SharedFilter, CBCuckooFilter):
+    def __init__(self, num_buckets : int, bucket_size : int, fingerprint_len : int, max_kicks = 10, hash_mode = "classic", keyless = False, eviction = "random", stripe_buckets = 64):
+        """
+        Initializes a Configurable-Bucket Cuckoo Filter whose slots and sbits
+        live in shared memory, see SharedFilter. Keys are kept by the writer.
+
+        Args:
+            num_buckets: int > 0
+            bucket_size: int > 0
+            fingerprint_len: int > 0
+            max_kicks: int > 0 : max number of retry iterations when inserting
+            hash_mode: "classic" | "single" : see CuckooFilter
+            keyless: bool : see CBCuckooFilter
+            eviction: "random" | "bfs" : see CuckooFilter
+            stripe_buckets: int > 0 : buckets per version counter
+
+        Raises ValueError if constraints not met.
+        """
+        if stripe_buckets < 1:
+            raise ValueError()
+        self.stripe_buckets = stripe_buckets
+        super().__init__(num_buckets, bucket_size, fingerprint_len, max_kicks, "array", hash_mode, keyless, eviction, 0)
+        self.storage = "shared"
+        self.sbits = bitarray(buffer=self.buckets.sbits_buffer)
+        self.sbits.setall(1) #all empty, the padding bits up to the next byte stay long
+
+    def _to_short(self, index):
+        self.buckets._touch(index) #before sbits changes
+        super()._to_short(index)
+
+    def _to_long(self, index):
+        self.buckets._touch(index)
+        super()._to_long(index)
+
+    def _scrub_bucket(self, index, max_relocations):
+        try:
+            return super()._scrub_bucket(index, max_relocations)
+        finally:
+            self.buckets.commit()
@@ -0,0 +1,76 @@
+from shared import SharedCuckooFilter, SharedCBCuckooFilter
+import multiprocessing
+import argparse
+import random
+import time
+
+FILTERS = {
+    "cf": SharedCuckooFilter,
+    "cbcf": SharedCBCuckooFilter
+}
+CHUNK = 10000 #keys per lookup_many call
+
+def reader(filter_class, handle, first_key, duration, barrier, results):
+    """
+    Looks up chunks of never inserted keys for duration seconds and puts
+    the number of lookups done into results.
+    """
+    f = filter_class.attach(handle)
+    keys = [str(i) for i in range(first_key, first_key + CHUNK)]
+    barrier.wait()
+    lookups = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        f.lookup_many(keys)
+        lookups += CHUNK
+    f.close()
+    results.put(lookups)
+
+def benchmark_readers(filter_class, num_buckets, fingerprint_size, occupancy, readers, duration, write = False):
+    """
+    Fills a shared filter to occupancy and runs readers reader processes on
+    it for duration seconds. If write, this process keeps inserting and
+    deleting keys meanwhile, so readers pay for retries.
+
+    Returns (lookups per second of all readers together, write operations).
+    """
+    random.seed(0)
+    f = filter_class(num_buckets=num_buckets, bucket_size=4, fingerprint_len=fingerprint_size)
+    f.insert_many([str(i) for i in range(int(occupancy * num_buckets * 4))])
+    barrier = multiprocessing.Barrier(readers + 1)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=reader, args=(filter_class, f.handle(), 10**9 + k * CHUNK, duration, barrier, results)) for k in range(readers)]
+    for p in processes:
+        p.start()
+    barrier.wait()
+    start = time.perf_counter()
+    writes = 0
+    churn = [str(i) for i in range(10**8, 10**8 + 100)]
+    while write and time.perf_counter() - start < duration:
+        for key, ok in zip(churn, f.insert_many(churn)):
+            if ok:
+                f.delete(key)
+        writes += 2 * len(churn)
+    lookups = sum(results.get() for _ in processes)
+    for p in processes:
+        p.join()
+    f.close()
+    f.unlink()
+    return lookups / duration, writes
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures lookup throughput of a shared-memory filter against the number of reader processes.")
+    parser.add_argument("--filter", choices=FILTERS.keys(), default="cbcf")
+    parser.add_argument("--num-buckets", type=int, default=65536)
+    parser.add_argument("--fingerprint-size", type=int, default=12)
+    parser.add_argument("--occupancy", type=float, default=0.9)
+    parser.add_argument("--readers", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per reader count")
+    parser.add_argument("--write", action="store_true", help="insert and delete concurrently in the writer")
+    args = parser.parse_args()
+    for readers in args.readers:
+        throughput, writes = benchmark_readers(FILTERS[args.filter], args.num_buckets, args.fingerprint_size, args.occupancy, readers, args.duration, args.write)
+        print(f"{readers} readers: {throughput:.0f} lookups/s" + (f", {writes} writes" if args.write else ""))
+
+if __name__ == "__main__":
+    main()
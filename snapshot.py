@@ -0,0 +1,102 @@
+import json
+import mmap as mmap_module
+import struct
+
+MAGIC = b"CFSNAP\r\n"
+VERSION = 1
+ALIGN = 64 #sections start on cache-line boundaries
+
+def write_snapshot(path, header : dict, sections : dict):
+    """
+    Writes a snapshot file:
+
+    MAGIC | version u32 | header length u32 | JSON header | sections
+
+    Every section is a buffer (bytes, bytearray, NumPy array, bitarray) and
+    starts at a multiple of ALIGN bytes. The header gets a "sections" entry
+    mapping section names to (offset, length) relative to the first section.
+    """
+    layout = {}
+    offset = 0
+    for name, section in sections.items():
+        length = memoryview(section).nbytes
+        layout[name] = (offset, length)
+        offset += -(-length // ALIGN) * ALIGN
+    encoded = json.dumps(dict(header, sections=layout)).encode()
+    start = len(MAGIC) + 8 + len(encoded)
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        file.write(struct.pack("<II", VERSION, len(encoded)))
+        file.write(encoded)
+        file.write(bytes(-start % ALIGN))
+        for name, section in sections.items():
+            length = layout[name][1]
+            file.write(memoryview(section).cast("B"))
+            file.write(bytes(-length % ALIGN))
+
+def read_snapshot(path, mmap = False):
+    """
+    Reads a snapshot file written by write_snapshot().
+
+    Returns (header, sections), sections mapping names to memoryviews. They
+    are writable copies read into memory, or read-only views of an mmap of
+    the file if mmap is True. The mapping lives as long as any view of it.
+
+    Raises ValueError if the file is no snapshot or of another version.
+    """
+    with open(path, "rb") as file:
+        if mmap:
+            data = memoryview(mmap_module.mmap(file.fileno(), 0, access=mmap_module.ACCESS_READ))
+        else:
+            data = memoryview(bytearray(file.read()))
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError()
+    version, header_len = struct.unpack_from("<II", data, len(MAGIC))
+    if version != VERSION:
+        raise ValueError()
+    start = len(MAGIC) + 8
+    header = json.loads(bytes(data[start:start + header_len]))
+    start += header_len
+    start += -start % ALIGN
+    sections = {name: data[start + offset:start + offset + length] for name, (offset, length) in header.pop("sections").items()}
+    return header, sections
+
+def encode_keys(keys) -> bytes:
+    """
+    Encodes a sequence of str or bytes keys as type byte, u32 length and
+    payload per key.
+    """
+    encoded = bytearray()
+    for key in keys:
+        if isinstance(key, str):
+            payload = key.encode()
+            encoded += b"s"
+        elif isinstance(key, (bytes, bytearray)):
+            payload = bytes(key)
+            encoded += b"b"
+        else:
+            raise ValueError()
+        encoded += struct.pack("<I", len(payload))
+        encoded += payload
+    return bytes(encoded)
+
+def decode_keys(encoded) -> list:
+    """
+    Decodes the keys written by encode_keys().
+    """
+    keys = []
+    position = 0
+    while position < len(encoded):
+        kind = bytes(encoded[position:position + 1])
+        (length,) = struct.unpack_from("<I", encoded, position + 1)
+        payload = bytes(encoded[position + 5:position + 5 + length])
+        keys.append(payload.decode() if kind == b"s" else payload)
+        position += 5 + length
+    return keys
+
+def scalar_attributes(obj) -> dict:
+    """
+    Returns the attributes of obj that JSON can hold as they are, i.e. the
+    parameters and counters of a filter.
+    """
+    return {name: value for name, value in vars(obj).items() if value is None or isinstance(value, (bool, int, float, str))}
@@ -0,0 +1,87 @@
+import copy
+import functools
+import json
+import time
+
+class FilterStats:
+    def __init__(self):
+        """
+        Statistics a filter records while it runs if one is passed as its
+        stats argument. Recording costs a few counter updates per operation
+        and one perf_counter_ns pair per public call.
+
+        Attributes:
+            kick_histogram: {kicks: inserts} : displacements per successful insert,
+                0 for direct placement, path length for "bfs" eviction
+            insert_failures: int : inserts that returned False
+            stashed: int : victims parked in the stash
+            to_short: int : long to short bucket conversions
+            to_long: int : short to long bucket conversions
+            scrub_relocations: int : relocations spent by scrub_step()
+            timers: {operation: [calls, items, ns]} : per public operation
+        """
+        self.kick_histogram = {}
+        self.insert_failures = 0
+        self.stashed = 0
+        self.to_short = 0
+        self.to_long = 0
+        self.scrub_relocations = 0
+        self.timers = {}
+
+    def record_kicks(self, kicks : int):
+        self.kick_histogram[kicks] = self.kick_histogram.get(kicks, 0) + 1
+
+    def record_time(self, operation : str, ns : int, items = 1):
+        timer = self.timers.setdefault(operation, [0, 0, 0])
+        timer[0] += 1
+        timer[1] += items
+        timer[2] += ns
+
+    def to_dict(self, filter = None) -> dict:
+        """
+        Returns the statistics as a JSON-serializable dict. If filter is given,
+        its occupancy and memory footprint are added.
+        """
+        entity = {
+            "kick_histogram": {str(kicks): count for kicks, count in sorted(self.kick_histogram.items())},
+            "insert_failures": self.insert_failures,
+            "stashed": self.stashed,
+            "to_short": self.to_short,
+            "to_long": self.to_long,
+            "scrub_relocations": self.scrub_relocations,
+            "timers": {operation: {"calls": calls, "items": items, "ns": ns, "ns_per_item": ns / items if items else 0.0} for operation, (calls, items, ns) in self.timers.items()}
+        }
+        if filter is not None:
+            memory_bytes = filter.compute_memory_bytes()
+            entity["occupancy"] = filter.compute_filter_occupancy()
+            entity["memory_bytes"] = memory_bytes
+            entity["bytes_per_item"] = memory_bytes / filter.num_items if filter.num_items else 0.0
+        return entity
+
+    def dump(self, file, filter = None):
+        """
+        Writes to_dict(filter) as one JSON line to an open file.
+        """
+        json.dump(self.to_dict(filter), file)
+        file.write('\n')
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+def timed(operation : str, batched = False):
+    """
+    Decorates a filter method to record its run time in self.stats under
+    operation. With batched, the length of the first argument counts as
+    the number of items. Costs one attribute check while stats is None.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.stats is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter_ns()
+            result = method(self, *args, **kwargs)
+            self.stats.record_time(operation, time.perf_counter_ns() - start, len(args[0]) if batched else 1)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import uuid
+import numpy as np
+
+INDEX = "index.jsonl"
+SEGMENTS = "segments"
+
+def flatten(entity : dict, prefix = "") -> dict:
+    """
+    Flattens a nested measurement dict into columns named by dotted paths,
+    e.g. "measurements.cf_fpr". Lists stay values, e.g. confidence intervals.
+    """
+    columns = {}
+    for name, value in entity.items():
+        if isinstance(value, dict):
+            columns.update(flatten(value, f"{prefix}{name}."))
+        else:
+            columns[f"{prefix}{name}"] = value
+    return columns
+
+def to_columns(entities : list) -> dict:
+    """
+    Returns the flattened entities as one NumPy array per column. A value
+    missing from a row is NaN, or "" in str columns. Lists of numbers of
+    one length become 2-d columns, anything else is stored as JSON text.
+    """
+    rows = [flatten(entity) for entity in entities]
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    columns = {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        present = [value for value in values if value is not None]
+        if all(isinstance(value, str) for value in present):
+            columns[name] = np.array(["" if value is None else value for value in values], dtype=str)
+            continue
+        try:
+            array = np.array(present)
+        except ValueError:
+            array = None
+        if array is None or array.dtype.kind not in "biuf":
+            columns[name] = np.array(["" if value is None else json.dumps(value) for value in values], dtype=str)
+            continue
+        if len(present) < len(values):
+            filled = np.full((len(values),) + array.shape[1:], np.nan)
+            filled[[value is not None for value in values]] = array
+            array = filled
+        columns[name] = array
+    return columns
+
+class ResultStore:
+    def __init__(self, path):
+        """
+        Opens a columnar store of measurements in directory path, creating
+        it if needed. Every append() writes one segment, a directory with one
+        .npy file per column, and then adds a line describing it to the
+        index. A segment is built under a temporary name and renamed into
+        place, and an index line is a single append, so any number of sweep
+        processes may append at once and readers only ever see whole
+        segments.
+
+        Args:
+            path: directory of the store
+        """
+        self.path = path
+        os.makedirs(os.path.join(path, SEGMENTS), exist_ok=True)
+
+    def append(self, entities : list) -> str:
+        """
+        Writes entities, e.g. measureFPR() results, as one segment.
+
+        Returns the name of the segment.
+        """
+        columns = to_columns(entities)
+        name = f"{os.getpid()}-{uuid.uuid4().hex}"
+        temporary = os.path.join(self.path, SEGMENTS, "." + name)
+        os.mkdir(temporary)
+        for column, array in columns.items():
+            np.save(os.path.join(temporary, column + ".npy"), array, allow_pickle=False)
+        os.rename(temporary, os.path.join(self.path, SEGMENTS, name))
+        entry = {"segment": name, "rows": len(entities), "columns": {column: [array.dtype.str, list(array.shape[1:])] for column, array in columns.items()}}
+        fd = os.open(os.path.join(self.path, INDEX), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(entry) + "\n").encode())
+        finally:
+            os.close(fd)
+        return name
+
+    def segments(self) -> list:
+        """
+        Returns the index entries of all segments in the order appended.
+        A line still being written by another process is skipped.
+        """
+        try:
+            with open(os.path.join(self.path, INDEX)) as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return []
+        entries = []
+        for line in lines:
+            if line.endswith("\n"):
+                entries.append(json.loads(line))
+        return entries
+
+    def columns(self) -> dict:
+        """
+        Returns (dtype, trailing shape) of every column of any segment.
+        """
+        columns = {}
+        for entry in self.segments():
+            for name, (dtype, shape) in entry["columns"].items():
+                columns.setdefault(name, (np.dtype(dtype), tuple(shape)))
+        return columns
+
+    def scan(self, columns : list, mmap = True):
+        """
+        Yields one dict of the requested columns per segment, reading nothing
+        else. Arrays are read-only memory maps of the segment files if mmap,
+        so a scan streams through stores larger than memory. A column missing
+        from a segment is filled as in to_columns().
+        """
+        known = self.columns()
+        for entry in self.segments():
+            chunk = {}
+            for name in columns:
+                if name in entry["columns"]:
+                    chunk[name] = np.load(os.path.join(self.path, SEGMENTS, entry["segment"], name + ".npy"), mmap_mode="r" if mmap else None, allow_pickle=False)
+                elif name in known and known[name][0].kind == "U":
+                    chunk[name] = np.full(entry["rows"], "", dtype=known[name][0])
+                else:
+                    chunk[name] = np.full((entry["rows"],) + known.get(name, (None, ()))[1], np.nan)
+            yield chunk
+
+    def load(self, columns : list) -> dict:
+        """
+        Returns the requested columns of all segments, concatenated in memory.
+        """
+        chunks = list(self.scan(columns, mmap=False))
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else np.zeros(0) for name in columns}
+
+def read_jsonl(paths : list, chunk = 10000):
+    """
+    Yields the entities of JSON-lines measurement files, as written by
+    main.py, in lists of at most chunk entities.
+    """
+    for path in paths:
+        with open(path) as file:
+            entities = []
+            for line in file:
+                if line.strip():
+                    entities.append(json.loads(line))
+                if len(entities) == chunk:
+                    yield entities
+                    entities = []
+            if entities:
+                yield entities
+
+def scan_jsonl(paths : list, columns : list, chunk = 10000):
+    """
+    Yields the requested columns of JSON-lines measurement files in dicts
+    of at most chunk rows like ResultStore.scan().
+    """
+    for entities in read_jsonl(paths, chunk):
+        yield _select(to_columns(entities), columns, len(entities))
+
+def _select(chunk, columns, rows):
+    return {name: chunk[name] if name in chunk else np.full(rows, np.nan) for name in columns}
+
+def open_results(source):
+    """
+    Returns a function scan(columns) over source: a ResultStore directory
+    or a list of JSON-lines measurement files.
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        return ResultStore(source).scan
+    paths = [source] if isinstance(source, str) else list(source)
+    return lambda columns: scan_jsonl(paths, columns)
+
+def convert(paths : list, store : ResultStore, chunk = 10000) -> int:
+    """
+    Appends the measurements of JSON-lines files to store, streaming them
+    in segments of at most chunk rows.
+
+    Returns the number of measurements converted.
+    """
+    rows = 0
+    for entities in read_jsonl(paths, chunk):
+        store.append(entities)
+        rows += len(entities)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts JSON-lines measurement files into a columnar result store.")
+    parser.add_argument("store", help="directory of the store, created if needed")
+    parser.add_argument("files", nargs="+", help="measurements<f>.txt files written by main.py")
+    parser.add_argument("--chunk", type=int, default=10000, help="rows per segment")
+    args = parser.parse_args()
+    rows = convert(args.files, ResultStore(args.store), args.chunk)
+    print(f"{rows} measurements converted")
+
+if __name__ == "__main__":
+    main()
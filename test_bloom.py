@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+from bloom import BloomFilter
+
+@pytest.mark.parametrize("num_hash_functions, block_bits", [(7, 512), (11, 512), (5, 64)])
+def test_blocked_single_rate_matches_formula(num_hash_functions, block_bits):
+    # in-block offsets by double hashing used to run 10-30% above the formula
+    f = BloomFilter(12 * 200000, num_hash_functions, hash_mode="single", block_bits=block_bits)
+    f.insert_many(np.arange(200000))
+    measured = f.lookup_many(np.arange(200000, 2200000)).mean()
+    assert abs(measured / f.compute_false_positive_rate() - 1) < 0.06
+
+def test_insert_many_returns_results():
+    f = BloomFilter(4096, 3)
+    ok = f.insert_many(["a", "b", "c"])
+    assert ok.dtype == np.bool_ and ok.tolist() == [True, True, True]
@@ -0,0 +1,61 @@
+import random
+import pytest
+from cache import CachedCuckooFilter, CachedCBCuckooFilter
+from cuckoo import CuckooFilter, CBCuckooFilter
+
+def same_random(*calls):
+    # runs every call from the same random state, returns their results
+    state = random.getstate()
+    results = []
+    for call in calls:
+        random.setstate(state)
+        results.append(call())
+    return results
+
+@pytest.mark.parametrize("cache_policy", ["clock", "lru"])
+@pytest.mark.parametrize("keyless, eviction", [(False, "random"), (True, "random"), (False, "bfs")])
+def test_cached_cb_filter_matches_plain(cache_policy, keyless, eviction):
+    random.seed(1)
+    cached = CachedCBCuckooFilter(64, 4, 8, keyless=keyless, eviction=eviction, cache_size=32, cache_policy=cache_policy)
+    plain = CBCuckooFilter(64, 4, 8, storage="array", keyless=keyless, eviction=eviction)
+    stored = []
+    for step in range(4000):
+        op = random.random()
+        if op < 0.3:
+            key = f"k{random.randrange(400)}"
+            ok = same_random(lambda: cached.insert(key), lambda: plain.insert(key))
+            assert ok[0] == ok[1]
+            if ok[0]:
+                stored.append(key)
+        elif op < 0.4 and stored:
+            key = stored.pop(random.randrange(len(stored)))
+            same_random(lambda: cached.delete(key), lambda: plain.delete(key))
+        elif op < 0.45:
+            same_random(lambda: cached.scrub_step(4), lambda: plain.scrub_step(4))
+        else:
+            key = f"k{int(random.paretovariate(1.0)) % 400}" #hot keys repeat
+            assert cached.lookup(key) == plain.lookup(key)
+    assert cached.cache.hits > 0
+    assert all(cached.lookup(key) for key in stored)
+
+@pytest.mark.parametrize("cache_policy", ["clock", "lru"])
+def test_cached_filter_matches_plain(cache_policy):
+    random.seed(2)
+    cached = CachedCuckooFilter(64, 4, 8, cache_size=32, cache_policy=cache_policy)
+    plain = CuckooFilter(64, 4, 8, storage="array")
+    stored = []
+    for step in range(4000):
+        op = random.random()
+        if op < 0.3:
+            key = f"k{random.randrange(400)}"
+            ok = same_random(lambda: cached.insert(key), lambda: plain.insert(key))
+            assert ok[0] == ok[1]
+            if ok[0]:
+                stored.append(key)
+        elif op < 0.4 and stored:
+            key = stored.pop(random.randrange(len(stored)))
+            same_random(lambda: cached.delete(key), lambda: plain.delete(key))
+        else:
+            key = f"k{int(random.paretovariate(1.0)) % 400}"
+            assert cached.lookup(key) == plain.lookup(key)
+    assert cached.cache.hits > 0
@@ -0,0 +1,161 @@
+import random
+import pytest
+from cuckoo import CuckooFilter, CBCuckooFilter, PackedCuckooFilter, PackedCBCuckooFilter
+from stats import FilterStats
+
+def fill_and_delete(seed):
+    # fills a small keyless filter, then deletes half of the keys and
+    # returns the remaining keys the filter no longer finds
+    random.seed(seed)
+    f = CBCuckooFilter(16, 4, 6, keyless=True, storage="list")
+    inserted = [key for key in (f"k{seed}_{i}" for i in range(56)) if f.insert(key)]
+    random.shuffle(inserted)
+    half = len(inserted) // 2
+    for key in inserted[:half]:
+        f.delete(key)
+    f._test_verify_state()
+    return [key for key in inserted[half:] if not f.lookup(key)]
+
+@pytest.mark.parametrize("seed", [6, 17])
+def test_keyless_delete_prefers_long_fingerprint(seed):
+    # a short fingerprint in index1 used to be removed although it belonged
+    # to another key, while the deleted key's long fingerprint sat in index2
+    assert fill_and_delete(seed) == []
+
+@pytest.mark.parametrize("eviction, stash_size", [("random", 4), ("bfs", 0)])
+def test_keyless_delete_keeps_other_key(eviction, stash_size):
+    f = CBCuckooFilter(64, 4, 8, keyless=True, storage="list", eviction=eviction, stash_size=stash_size)
+    assert f.insert("97") and f.insert("233")
+    f.delete("97")
+    assert f.lookup("233")
+
+@pytest.mark.parametrize("max_visited", [1, 8, 40])
+def test_bfs_visits_at_most_max_visited(max_visited):
+    # a search in a full table used to walk every bucket within max_kicks hops
+    f = CuckooFilter(256, 4, 12, storage="list", eviction="bfs", stash_size=0, max_visited=max_visited)
+    for i in range(4 * 256):
+        f.buckets.append(i // 4, i % 4095 + 1)
+    probed = []
+    slot_alt_index = f._slot_alt_index
+    f._slot_alt_index = lambda index, j: probed.append(index) or slot_alt_index(index, j)
+    assert f._find_path(0, 1) is None
+    assert len(set(probed)) <= max_visited
+    assert not f.insert("x")
+
+@pytest.mark.parametrize("filter_class", [PackedCuckooFilter, PackedCBCuckooFilter])
+def test_bits_per_item_of_empty_filter(filter_class):
+    f = filter_class(64, 4, 12)
+    assert f.compute_bits_per_item() == float("inf")
+    f.insert("x")
+    assert f.compute_bits_per_item() == f.buckets.table_bits
+
+def filled_cb_filter(num_buckets = 64, load = 0.97, seed = 0, **filter_args):
+    random.seed(seed)
+    f = CBCuckooFilter(num_buckets, 4, 8, storage="list", **filter_args)
+    keys = [f"s{seed}_{i}" for i in range(int(load * num_buckets * 4))]
+    return f, [key for key in keys if f.insert(key)]
+
+def filter_state(f):
+    return ([list(f.buckets[i]) for i in range(f.num_buckets)], [list(f.actual_elements[i]) for i in range(f.num_buckets)],
+        f.sbits.copy(), list(f.stash), f.num_items, f.num_short_fingerprints, f.num_short_buckets)
+
+def test_scrub_rejects_empty_budget():
+    f, _ = filled_cb_filter()
+    with pytest.raises(ValueError):
+        f.scrub_step(0)
+    with pytest.raises(ValueError):
+        f.scrub(max_relocations=0)
+
+def test_failed_scrub_walk_restores_bucket():
+    f, keys = filled_cb_filter()
+    failed = 0
+    for index in range(f.num_buckets):
+        if f.sbits[index] or f.buckets.size(index) < f.bucket_size:
+            continue
+        before = filter_state(f)
+        if f._scrub_bucket(index, 1) is None:
+            failed += 1
+            assert filter_state(f) == before
+        f._test_verify_state()
+    assert failed > 0
+    assert all(f.lookup(key) for key in keys)
+
+@pytest.mark.parametrize("max_relocations", [1, 5, 64])
+def test_scrub_step_keeps_budget(max_relocations):
+    f, keys = filled_cb_filter(stats=FilterStats())
+    while True:
+        spent = f.stats.scrub_relocations
+        remaining = f.scrub_step(max_relocations)
+        assert f.stats.scrub_relocations - spent <= max_relocations
+        f._test_verify_state()
+        if remaining == 0:
+            break
+    assert all(f.lookup(key) for key in keys)
+
+def test_classic_needs_power_of_two_buckets():
+    with pytest.raises(ValueError):
+        CuckooFilter(100, 4, 12)
+    with pytest.raises(ValueError):
+        CBCuckooFilter(100, 4, 12, keyless=True)
+    CBCuckooFilter(100, 4, 12) #rehashes its keys
+    CuckooFilter(100, 4, 12, hash_mode="single")
+
+@pytest.mark.parametrize("stash_size", [4, 0])
+@pytest.mark.parametrize("eviction", ["random", "bfs"])
+@pytest.mark.parametrize("filter_class, num_buckets, hash_mode", [
+    (CuckooFilter, 128, "classic"),
+    (CuckooFilter, 100, "single"),
+    (CBCuckooFilter, 100, "classic"),
+    (CBCuckooFilter, 100, "single"),
+])
+def test_overfilling_keeps_members(filter_class, num_buckets, hash_mode, eviction, stash_size):
+    # failed inserts are stashed or undone, never drop a stored element
+    for seed in range(5):
+        random.seed(seed)
+        f = filter_class(num_buckets, 4, 12, hash_mode=hash_mode, eviction=eviction, stash_size=stash_size)
+        keys = [f"o{seed}_{i}" for i in range(num_buckets * 5)]
+        inserted = [key for key in keys if f.insert(key)]
+        assert len(inserted) < len(keys) and f.num_items == len(inserted)
+        assert len(f.stash) <= stash_size
+        assert all(f.lookup(key) for key in inserted)
+        assert f.lookup_many(inserted).all()
+
+@pytest.mark.parametrize("filter_class", [CuckooFilter, CBCuckooFilter])
+def test_to_storage_keeps_contents(filter_class):
+    random.seed(0)
+    f = filter_class(128, 4, 12, storage="list")
+    keys = [key for key in (str(i) for i in range(490)) if f.insert(key)]
+    buckets = [list(f.buckets[i]) for i in range(f.num_buckets)]
+    f.to_storage("array")
+    assert f.storage == "array" and [list(f.buckets[i]) for i in range(f.num_buckets)] == buckets
+    assert f.lookup_many(keys).all()
+    with pytest.raises(ValueError):
+        f.to_storage("packed")
+
+def test_bits_per_item_counts_fill_counts():
+    # 4 slots of 12 bits, 3 count bits and for the CB format 1 sbit per bucket
+    f, g = PackedCuckooFilter(64, 4, 12), PackedCBCuckooFilter(64, 4, 12)
+    for i in range(64):
+        f.insert(str(i))
+        g.insert(str(i))
+    assert f.compute_bits_per_item() == 51
+    assert g.compute_bits_per_item() == 52
+
+@pytest.mark.parametrize("filter_class", [CuckooFilter, CBCuckooFilter])
+@pytest.mark.parametrize("num_keys", [900, 1000])
+def test_from_keys_stores_at_least_online(filter_class, num_keys):
+    random.seed(0)
+    keys = [str(i) for i in range(num_keys)]
+    bulk = filter_class.from_keys(keys, 256, 4, 12, stash_size=0)
+    online = filter_class(256, 4, 12, stash_size=0)
+    online.insert_many(keys)
+    assert bulk.num_items >= online.num_items
+    assert bulk.lookup_many(keys).sum() >= bulk.num_items
+    if filter_class is CBCuckooFilter:
+        bulk._test_verify_state()
+        short_buckets = bulk.num_short_buckets
+        bulk.scrub()
+        assert bulk.num_short_buckets == short_buckets #already the minimum
+        if online.num_items == bulk.num_items:
+            online.scrub()
+            assert bulk.num_short_buckets <= online.num_short_buckets
@@ -0,0 +1,78 @@
+import mmh3
+import numpy as np
+import pytest
+from bloom import BloomFilter
+from cuckoo import CuckooFilter, CBCuckooFilter
+from hashing import alt_offset, alt_offset_many, alt_offsets, as_keys, hash_many, hash_fingerprints, murmur3_32, murmur3_x64_128
+from trace import zipf_trace
+
+@pytest.mark.parametrize("width", range(41))
+def test_murmur_matches_mmh3(width):
+    rng = np.random.default_rng(width)
+    blocks = rng.integers(0, 256, (64, width), dtype=np.uint8)
+    keys = [row.tobytes() for row in blocks]
+    for seed in (0, 1, 2, 0xDEADBEEF):
+        assert murmur3_32(blocks, seed).tolist() == [mmh3.hash(key, seed, signed=False) for key in keys]
+        assert murmur3_x64_128(blocks, seed).tolist() == [list(mmh3.hash64(key, seed, signed=False)) for key in keys]
+    assert hash_many(keys, 1).tolist() == [mmh3.hash(key, 1) for key in keys]
+
+def test_hash_fingerprints_matches_mmh3():
+    fingerprints = np.concatenate((np.arange(2**12), np.random.default_rng(0).integers(0, 2**40, 64)))
+    assert hash_fingerprints(fingerprints).tolist() == [mmh3.hash(str(fingerprint), 2) for fingerprint in fingerprints.tolist()]
+
+@pytest.mark.parametrize("make_filter", [
+    lambda: CuckooFilter(512, 4, 12, storage="array"),
+    lambda: CuckooFilter(512, 4, 12, storage="array", hash_mode="single"),
+    lambda: CBCuckooFilter(512, 4, 12, storage="array"),
+    lambda: BloomFilter(16384, 4),
+    lambda: BloomFilter(16384, 4, block_bits=512),
+    lambda: BloomFilter(16384, 11, hash_mode="single", block_bits=512),
+])
+def test_array_keys_match_scalar_keys(make_filter):
+    # arrays are hashed as they are, without becoming lists of bytes first
+    flows, packets = zipf_trace(1500, 4000)
+    numbers = np.arange(-700, 800)
+    for keys, queries in ((flows[:1000], packets), (numbers, numbers + 1000)):
+        f, g = make_filter(), make_filter()
+        f.insert_many(keys)
+        for key in as_keys(keys):
+            g.insert(key)
+        assert f.lookup_many(queries).tolist() == [g.lookup(key) for key in as_keys(queries)]
+
+@pytest.mark.parametrize("make_filter", [
+    lambda: CuckooFilter(512, 4, 12),
+    lambda: CBCuckooFilter(512, 4, 12),
+    lambda: BloomFilter(16384, 4),
+])
+@pytest.mark.parametrize("dtype", [np.int32, np.uint16, np.uint64, np.bool_])
+def test_scalar_elements_match_array(make_filter, dtype):
+    # elements of an array are widened to 8 bytes like the array itself
+    keys = np.arange(1000).astype(dtype)
+    f = make_filter()
+    f.insert_many(keys)
+    assert all(f.lookup(key) for key in keys)
+    g = make_filter()
+    for key in keys:
+        g.insert(key)
+    assert g.lookup_many(keys).all()
+    if not isinstance(f, BloomFilter):
+        f.delete(keys[5])
+
+def test_alt_offsets_on_the_fly():
+    table = alt_offsets(12)
+    assert [alt_offset(fingerprint) for fingerprint in range(2**12)] == table.tolist()
+    wide = np.random.default_rng(0).integers(0, 2**40, 1000)
+    assert alt_offset_many(wide).tolist() == [alt_offset(fingerprint) for fingerprint in wide.tolist()]
+    assert alt_offsets(40) is None #instead of a 4 TiB table
+
+@pytest.mark.parametrize("filter_class", [CuckooFilter, CBCuckooFilter])
+def test_single_mode_wide_fingerprints(filter_class):
+    f = filter_class(256, 4, 40, storage="array", hash_mode="single")
+    keys = [str(i) for i in range(700)]
+    inserted = f.insert_many(keys)
+    assert inserted.all() and f.lookup_many(keys).all()
+    for index in range(0, 256, 17):
+        assert f._alt_index(f._alt_index(index, 2**39 + index), 2**39 + index) == index
+    for key in keys[:350]:
+        f.delete(key)
+    assert f.lookup_many(keys[350:]).all()
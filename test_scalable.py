@@ -0,0 +1,28 @@
+import random
+import pytest
+from cuckoo import CuckooFilter, CBCuckooFilter
+from scalable import ScalableCuckooFilter
+
+@pytest.mark.parametrize("filter_class, filter_args", [
+    (CuckooFilter, {}),
+    (CuckooFilter, {"hash_mode": "single", "stash_size": 0}),
+    (CBCuckooFilter, {"keyless": True}),
+    (CBCuckooFilter, {"storage": "array", "eviction": "bfs"}),
+])
+def test_growth_keeps_members(filter_class, filter_args):
+    random.seed(0)
+    f = ScalableCuckooFilter(16, 4, 8, filter_class, **filter_args)
+    keys = [str(i) for i in range(3000)]
+    ok = f.insert_many(keys[:1500])
+    ok = list(ok) + [f.insert(key) for key in keys[1500:]]
+    assert all(ok) and f.num_items == len(keys)
+    assert len(f.generations) >= 5
+    assert [g.num_buckets for g in f.generations] == [16 * 2**k for k in range(len(f.generations))]
+    assert f.lookup_many(keys).all()
+    assert all(f.lookup(key) for key in keys)
+
+def test_growth_needs_power_of_two_for_classic():
+    with pytest.raises(ValueError):
+        ScalableCuckooFilter(16, 4, 8, growth=3)
+    ScalableCuckooFilter(16, 4, 8, growth=3, hash_mode="single")
+    ScalableCuckooFilter(16, 4, 8, CBCuckooFilter, growth=3)
@@ -0,0 +1,29 @@
+import pytest
+from shared import SharedCuckooFilter, SharedCBCuckooFilter
+
+@pytest.mark.parametrize("filter_class", [SharedCuckooFilter, SharedCBCuckooFilter])
+def test_lookup_after_from_keys(filter_class):
+    keys = [str(i) for i in range(900)]
+    f = filter_class.from_keys(keys, 256, 4, 12)
+    reader = filter_class.attach(f.handle())
+    try:
+        assert f.num_items == len(keys)
+        assert not (f.buckets.versions & 1).any()
+        assert f.lookup("0") and reader.lookup("0")
+        assert f.lookup_many(keys).all()
+        assert reader.lookup_many(keys).all()
+    finally:
+        reader.close()
+        f.close()
+        f.unlink()
+
+def test_copy_raises():
+    f = SharedCuckooFilter(16, 4, 8)
+    try:
+        with pytest.raises(TypeError):
+            f.copy()
+        with pytest.raises(TypeError):
+            f.buckets.copy()
+    finally:
+        f.close()
+        f.unlink()
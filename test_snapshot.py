@@ -0,0 +1,86 @@
+import random
+import struct
+import pytest
+from bloom import BloomFilter
+from cuckoo import CuckooFilter, CBCuckooFilter, PackedCuckooFilter, PackedCBCuckooFilter
+from snapshot import MAGIC
+
+FILTERS = {
+    "cf-list": lambda: CuckooFilter(64, 4, 12, storage="list"),
+    "cf-array": lambda: CuckooFilter(64, 4, 12, storage="array", hash_mode="single"),
+    "cf-packed": lambda: PackedCuckooFilter(64, 4, 12),
+    "cbcf-keyed": lambda: CBCuckooFilter(64, 4, 12, storage="list"),
+    "cbcf-keyless": lambda: CBCuckooFilter(64, 4, 12, storage="array", keyless=True),
+    "cbcf-packed": lambda: PackedCBCuckooFilter(64, 4, 12),
+}
+
+def filter_state(f):
+    state = [[list(f.buckets[i]) for i in range(f.num_buckets)], list(f.stash), f.num_items]
+    if isinstance(f, CBCuckooFilter):
+        state += [f.sbits.tolist(), f.num_short_fingerprints, f.num_short_buckets]
+        if not f.keyless:
+            state.append([list(f.actual_elements[i]) for i in range(f.num_buckets)])
+    return state
+
+def overfilled(name):
+    # past capacity, so the stash holds victims
+    random.seed(0)
+    f = FILTERS[name]()
+    keys = [str(i) for i in range(300)]
+    inserted = [key for key in keys if f.insert(key)]
+    assert f.stash
+    return f, inserted
+
+@pytest.mark.parametrize("name", FILTERS)
+def test_round_trip(name, tmp_path):
+    f, inserted = overfilled(name)
+    f.save(tmp_path / "f.snap")
+    g = type(f).load(tmp_path / "f.snap")
+    assert filter_state(g) == filter_state(f)
+    if isinstance(g, CBCuckooFilter):
+        g._test_verify_state()
+    #a loaded filter goes on like the original
+    for key in inserted[:100]:
+        f.delete(key)
+        g.delete(key)
+    more = [str(i) for i in range(1000, 1100)]
+    random.seed(1)
+    ok_f = [f.insert(key) for key in more]
+    random.seed(1)
+    ok_g = [g.insert(key) for key in more]
+    assert ok_f == ok_g and filter_state(g) == filter_state(f)
+
+@pytest.mark.parametrize("name", FILTERS)
+def test_mmap_lookups(name, tmp_path):
+    f, inserted = overfilled(name)
+    f.save(tmp_path / "f.snap")
+    g = type(f).load(tmp_path / "f.snap", mmap=True)
+    queries = inserted + [str(i) for i in range(1000, 3000)]
+    assert g.lookup_many(queries).tolist() == f.lookup_many(queries).tolist()
+    assert [g.lookup(key) for key in queries] == [f.lookup(key) for key in queries]
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_bloom_round_trip(mmap, tmp_path):
+    f = BloomFilter(1001, 5, hash_mode="single", block_bits=64)
+    f.insert_many([str(i) for i in range(100)])
+    f.save(tmp_path / "b.snap")
+    g = BloomFilter.load(tmp_path / "b.snap", mmap=mmap)
+    assert g.bitarray == f.bitarray and g.num_items == f.num_items
+    queries = [str(i) for i in range(2000)]
+    assert g.lookup_many(queries).tolist() == f.lookup_many(queries).tolist()
+
+def test_rejects_other_files(tmp_path):
+    f, _ = overfilled("cf-list")
+    path = tmp_path / "f.snap"
+    f.save(path)
+    data = path.read_bytes()
+    with pytest.raises(ValueError):
+        CBCuckooFilter.load(path) #another class
+    with pytest.raises(ValueError):
+        BloomFilter.load(path)
+    (tmp_path / "version.snap").write_bytes(data[:len(MAGIC)] + struct.pack("<I", 2) + data[len(MAGIC) + 4:])
+    with pytest.raises(ValueError):
+        CuckooFilter.load(tmp_path / "version.snap")
+    (tmp_path / "magic.snap").write_bytes(b"X" + data[1:])
+    with pytest.raises(ValueError):
+        CuckooFilter.load(tmp_path / "magic.snap")
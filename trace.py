@@ -0,0 +1,83 @@
+import mmap as mmap_module
+import numpy as np
+
+#packet 5-tuple as captured, network byte order, no padding
+FIVE_TUPLE = np.dtype([("src_ip", ">u4"), ("dst_ip", ">u4"), ("src_port", ">u2"), ("dst_port", ">u2"), ("protocol", "u1")])
+
+def open_trace(path, dtype = FIVE_TUPLE) -> np.ndarray:
+    """
+    Maps a binary file of fixed-size records into memory read-only.
+
+    Args:
+        path: file of records back to back, no header
+        dtype: NumPy dtype of a record, or int : record size in bytes
+
+    Returns a read-only array of records over the mapping, nothing is read
+    until the records are used. The mapping lives as long as the array.
+
+    Raises ValueError if the file size is no multiple of the record size.
+    """
+    dtype = np.dtype(f"V{dtype}") if isinstance(dtype, int) else np.dtype(dtype)
+    with open(path, "rb") as file:
+        size = file.seek(0, 2)
+        if size % dtype.itemsize != 0:
+            raise ValueError()
+        if size == 0:
+            return np.zeros(0, dtype=dtype)
+        data = mmap_module.mmap(file.fileno(), 0, access=mmap_module.ACCESS_READ)
+    return np.frombuffer(data, dtype=dtype)
+
+def write_trace(path, records : np.ndarray):
+    """
+    Writes records as a file open_trace() reads with records.dtype.
+    """
+    with open(path, "wb") as file:
+        file.write(np.ascontiguousarray(records).tobytes())
+
+def chunks(records : np.ndarray, chunk = 65536):
+    """
+    Yields consecutive slices of at most chunk records, views of records.
+    """
+    for start in range(0, len(records), chunk):
+        yield records[start:start + chunk]
+
+def insert_trace(filter, path, dtype = FIVE_TUPLE, chunk = 65536) -> int:
+    """
+    Inserts every record of a trace file, chunk records per insert_many()
+    call. Each record is one key, its raw bytes, see hashing.as_keys().
+
+    Returns the number of failed inserts.
+    """
+    failures = 0
+    for records in chunks(open_trace(path, dtype), chunk):
+        ok = filter.insert_many(records)
+        failures += len(ok) - int(np.count_nonzero(ok))
+    return failures
+
+def lookup_trace(filter, path, dtype = FIVE_TUPLE, chunk = 65536) -> int:
+    """
+    Looks up every record of a trace file, chunk records per lookup_many()
+    call.
+
+    Returns the number of positive lookups.
+    """
+    return sum(int(np.count_nonzero(filter.lookup_many(records))) for records in chunks(open_trace(path, dtype), chunk))
+
+def zipf_trace(num_flows : int, num_packets : int, exponent = 1.0, seed = 0) -> tuple:
+    """
+    Generates a skewed packet trace: num_flows random distinct 5-tuples,
+    and packets drawn from them with probability proportional to
+    1 / rank**exponent, as flow sizes of router traffic roughly are.
+
+    Returns (flows, packets), both FIVE_TUPLE arrays, flows by rank.
+    """
+    rng = np.random.default_rng(seed)
+    flows = np.zeros(num_flows, dtype=FIVE_TUPLE)
+    flows["src_ip"] = rng.choice(2**32, num_flows, replace=False) #distinct flows
+    flows["dst_ip"] = rng.integers(0, 2**32, num_flows)
+    flows["src_port"] = rng.integers(1024, 2**16, num_flows)
+    flows["dst_port"] = rng.integers(0, 2**16, num_flows)
+    flows["protocol"] = rng.choice([6, 17], num_flows)
+    weights = 1.0 / np.arange(1, num_flows + 1) ** exponent
+    packets = flows[rng.choice(num_flows, num_packets, p=weights / weights.sum())]
+    return flows, packets
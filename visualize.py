@@ -1,48 +1,55 @@
-import json
+import argparse
+import numpy as np
 import matplotlib.pyplot as plt
-
-filename = "measurements18.txt"
-entities = []
-
-with open(filename, "r") as file:
-    for line in file:
-        entity = json.loads(line)
-        entities.append(entity)
-
-occupancies = []
-cf_fpr_e = []
-cf_fpr = []
-cbcf_fpr_e = []
-cbcf_fpr = []
-bloom_fpr_e = []
-bloom_fpr = []
-for entity in entities:
-    m = entity['measurements']
-    cf_fpr_e.append(m['cf_fpr_e'])
-    cf_fpr.append(m['cf_fpr'])
-    cbcf_fpr_e.append(m['cbcf_fpr_e'])
-    cbcf_fpr.append(m['cbcf_fpr'])
-    bloom_fpr_e.append(m['bloom_fpr_e'])
-    bloom_fpr.append(m['bloom_fpr'])
-
-    p = entity['parameters']
-    occupancies.append(p['target_occupancy'])
-
-x = occupancies
-
-# Plot each measurement as a line
-plt.plot(x, cf_fpr_e, label='Expected Cuckoo')
-plt.plot(x, cf_fpr, label='Cuckoo')
-plt.plot(x, cbcf_fpr_e, label='Expected CB Cuckoo')
-plt.plot(x, cbcf_fpr, label='CB Cuckoo')
-plt.plot(x, bloom_fpr_e, label='Expected Bloom')
-plt.plot(x, bloom_fpr, label='Bloom')
-
-# Add labels and legend
-plt.title('f=18')
-plt.xlabel('Occupancy')
-plt.ylabel('FPR')
-plt.legend()
-
-# Show the plot
-plt.show()
\ No newline at end of file
+from store import open_results
+
+CURVES = [
+    ("measurements.cf_fpr_e", "Expected Cuckoo"),
+    ("measurements.cf_fpr", "Cuckoo"),
+    ("measurements.cbcf_fpr_e", "Expected CB Cuckoo"),
+    ("measurements.cbcf_fpr", "CB Cuckoo"),
+    ("measurements.bloom_fpr_e", "Expected Bloom"),
+    ("measurements.bloom_fpr", "Bloom")
+]
+
+def average_curves(source) -> dict:
+    """
+    Streams the FPR columns of source and averages repeated measurements of
+    a sweep point, keeping only running sums in memory.
+
+    Returns {fingerprint_size: (occupancies, {column: mean FPR per occupancy})}.
+    """
+    columns = [name for name, _ in CURVES]
+    sums = {}
+    for chunk in open_results(source)(columns + ["parameters.fingerprint_size", "parameters.target_occupancy"]):
+        values = np.column_stack([chunk[name] for name in columns])
+        for fingerprint_size, occupancy, row in zip(chunk["parameters.fingerprint_size"].tolist(), chunk["parameters.target_occupancy"].tolist(), values):
+            point = sums.setdefault(int(fingerprint_size), {}).setdefault(round(occupancy, 6), [np.zeros(len(columns)), 0])
+            point[0] += row
+            point[1] += 1
+    curves = {}
+    for fingerprint_size, points in sums.items():
+        occupancies = sorted(points)
+        means = np.array([points[o][0] / points[o][1] for o in occupancies])
+        curves[fingerprint_size] = (occupancies, {name: means[:, k] for k, name in enumerate(columns)})
+    return curves
+
+def main():
+    parser = argparse.ArgumentParser(description="Plots FPR against occupancy, one panel per fingerprint size.")
+    parser.add_argument("source", nargs="*", default=["measurements18.txt"], help="result store directory or measurements<f>.txt files")
+    args = parser.parse_args()
+    curves = average_curves(args.source[0] if len(args.source) == 1 else args.source)
+    fig, axes = plt.subplots(1, len(curves), squeeze=False, figsize=(6 * len(curves), 4.5))
+    for ax, fingerprint_size in zip(axes[0], sorted(curves, reverse=True)):
+        occupancies, means = curves[fingerprint_size]
+        #plot each measurement as a line
+        for name, label in CURVES:
+            ax.plot(occupancies, means[name], label=label)
+        ax.set_title(f'f={fingerprint_size}')
+        ax.set_xlabel('Occupancy')
+        ax.set_ylabel('FPR')
+        ax.legend()
+    plt.show()
+
+if __name__ == "__main__":
+    main()